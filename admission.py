@@ -0,0 +1,145 @@
+import os
+import json
+import math
+import time
+import threading
+from collections import OrderedDict
+
+# Fraction of every bucket that only emergency-urgency reservations may use.
+EMERGENCY_RESERVE = 0.2
+EMERGENCY_URGENCY = 3.0
+
+DEFAULT_KEY_QUOTA = {"rate": 50.0, "burst": 100.0, "tool_rate": 25.0, "tool_burst": 50.0}
+DEFAULT_GLOBAL = {"rate": 500.0, "burst": 1000.0}
+MAX_TOOL_BUCKETS = 256  # per key; tool names come from clients
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.level = float(burst)
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self.stamp:
+            self.level = min(self.burst, self.level + (now - self.stamp) * self.rate)
+            self.stamp = now
+
+    def wait_time(self, n, floor, now):
+        """Seconds until n tokens can be taken without going below floor (0 if now)."""
+        self._refill(now)
+        missing = n + floor - self.level
+        if missing <= 0:
+            return 0.0
+        return missing / self.rate if self.rate > 0 else float("inf")
+
+    def take(self, n):
+        self.level -= n
+
+
+class AdmissionController:
+    """
+    Per-key and per-key/tool token buckets plus a global capacity bucket.
+
+    Routine calls must leave EMERGENCY_RESERVE of every bucket untouched, so
+    when the server or a key is saturated, emergency reservations (urgency 3)
+    are still admitted from that reserved lane. A rejected call gets the time
+    until enough tokens refill, for a 429 Retry-After, unless it asks for more
+    than a bucket can ever hold: waiting would not help, so it gets no time.
+    """
+
+    def __init__(self, keys, global_quota=None, reserve=EMERGENCY_RESERVE, share=1.0):
+        self.keys = keys  # api key -> {"name", "rate", "burst", "tool_rate", "tool_burst", "tools": {...}}
+        self.reserve = reserve
+        # with several worker processes each one enforces its share of every quota
+        self.share = share
+        g = dict(DEFAULT_GLOBAL, **(global_quota or {}))
+        self.global_bucket = TokenBucket(g["rate"] * share, g["burst"] * share)
+        self.key_buckets = {k: TokenBucket(q["rate"] * share, q["burst"] * share) for k, q in keys.items()}
+        self.tool_buckets = {k: OrderedDict() for k in keys}
+        self._tools_lock = threading.Lock()
+        self.rejected = 0
+
+    def key_config(self, api_key):
+        return self.keys.get(api_key)
+
+    def _tool_bucket(self, api_key, tool):
+        with self._tools_lock:
+            buckets = self.tool_buckets[api_key]
+            b = buckets.get(tool)
+            if b is None:
+                q = self.keys[api_key]
+                tq = q.get("tools", {}).get(tool, {})
+                b = TokenBucket(tq.get("rate", q["tool_rate"]) * self.share,
+                                tq.get("burst", q["tool_burst"]) * self.share)
+                buckets[tool] = b
+                if len(buckets) > MAX_TOOL_BUCKETS:
+                    buckets.popitem(last=False)
+            else:
+                buckets.move_to_end(tool)
+            return b
+
+    def _buckets(self, api_key, tools):
+        per_tool = {}
+        for t in tools:
+            per_tool[t] = per_tool.get(t, 0) + 1
+        buckets = [(self.global_bucket, len(tools)), (self.key_buckets[api_key], len(tools))]
+        return buckets + [(self._tool_bucket(api_key, t), n) for t, n in sorted(per_tool.items())]
+
+    def max_calls(self, api_key, tools, emergency=False):
+        """Most calls of one tool a single request can carry under this key's quotas."""
+        usable = 1.0 if emergency else 1.0 - self.reserve
+        return int(min(b.burst * usable for b, _ in self._buckets(api_key, sorted(set(tools)))))
+
+    def admit(self, api_key, tools, emergency=False):
+        """
+        Try to admit a request carrying one call per entry of tools.
+        Returns (True, 0), (False, retry_after_seconds), or (False, None) when
+        the request is larger than some bucket can ever hold.
+        """
+        now = time.monotonic()
+        buckets = self._buckets(api_key, tools)
+
+        # lock in a fixed order (global, key, tools by name) so concurrent admits cannot deadlock
+        locked = []
+        try:
+            for b, _ in buckets:
+                b.lock.acquire()
+                locked.append(b)
+            wait = 0.0
+            for b, n in buckets:
+                floor = 0.0 if emergency else b.burst * self.reserve
+                if n + floor > b.burst:
+                    self.rejected += 1
+                    return False, None
+                wait = max(wait, b.wait_time(n, floor, now))
+            if wait > 0:
+                self.rejected += 1
+                return False, wait
+            for b, n in buckets:
+                b.take(n)
+            return True, 0.0
+        finally:
+            for b in locked:
+                b.lock.release()
+
+
+def retry_after_header(seconds):
+    return str(max(1, int(math.ceil(seconds))))
+
+
+def load_keys(default_key, path=None):
+    """
+    Keys and quotas from MCP_API_KEYS (JSON) or a JSON file, e.g.
+        {"kioskkey": {"name": "kiosks", "rate": 100, "burst": 200,
+                      "tools": {"q_intelli": {"rate": 80, "burst": 160}}}}
+    Falls back to the single default_key with DEFAULT_KEY_QUOTA.
+    """
+    raw = os.environ.get("MCP_API_KEYS")
+    if raw is None and path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            raw = f.read()
+    keys = json.loads(raw) if raw else {default_key: {"name": "default"}}
+    return {k: dict(DEFAULT_KEY_QUOTA, **(v or {})) for k, v in keys.items()}
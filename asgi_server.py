@@ -0,0 +1,232 @@
+import json
+import asyncio
+import metrics as _metrics
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+# Blocking persistence (journal appends, file writes) runs here, never on the event loop.
+_io_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="asgi-io")
+
+MAX_BODY_BYTES = 1024 * 1024
+
+
+def offload(fn, *args):
+    """Fire-and-forget fn(*args) on the I/O pool; failures are printed, not raised."""
+    fut = _io_pool.submit(fn, *args)
+    fut.add_done_callback(_report_failure)
+    return fut
+
+
+async def run_blocking(fn, *args):
+    """Await fn(*args) on the I/O pool."""
+    return await asyncio.get_running_loop().run_in_executor(_io_pool, fn, *args)
+
+
+async def run_compute(fn, *args):
+    """Await CPU-bound fn(*args) on the loop's default executor, leaving the I/O pool free."""
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+async def run_invoke(data, fn, compute=(), blocking=()):
+    """
+    fn() for the /invoke body data (one call or a batch): on the default
+    executor when it has an action in compute (CPU-heavy), on the I/O pool when
+    it has one in blocking (disk), else right here on the event loop.
+    """
+    items = data if isinstance(data, list) else data.get("batch") if isinstance(data, dict) else None
+    items = items if isinstance(items, list) else [data]
+    actions = {i.get("action") for i in items if isinstance(i, dict)}
+    if actions & set(compute):
+        return await run_compute(fn)
+    if actions & set(blocking):
+        return await run_blocking(fn)
+    return fn()
+
+
+def _report_failure(fut):
+    exc = fut.exception()
+    if exc is not None:
+        print("background persistence failed:", exc)
+
+
+class Headers:
+    """Case-insensitive header lookup, like Flask's request.headers.get()."""
+
+    def __init__(self, raw):
+        self._h = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in raw}
+
+    def get(self, name, default=None):
+        return self._h.get(name.lower(), default)
+
+
+class Request:
+    def __init__(self, scope, body, stream=None):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.headers = Headers(scope.get("headers", []))
+        self.args = {k: v[0] for k, v in parse_qs(scope.get("query_string", b"").decode("latin-1")).items()}
+        self.body = body
+        self.stream = stream  # async iterator of body chunks, for routes registered as streaming
+
+    def get_json(self, silent=True):
+        try:
+            return json.loads(self.body) if self.body else None
+        except ValueError:
+            if silent:
+                return None
+            raise
+
+
+class Response:
+    def __init__(self, body, status=200, content_type="application/json", headers=None):
+        self.body = body if isinstance(body, bytes) else body.encode("utf-8")
+        self.status = status
+        self.content_type = content_type
+        self.headers = headers or {}
+
+
+class StreamingResponse:
+    """Body produced by an async iterator of str/bytes chunks (e.g. Server-Sent Events)."""
+
+    def __init__(self, chunks, status=200, content_type="text/event-stream", headers=None):
+        self.chunks = chunks
+        self.status = status
+        self.content_type = content_type
+        self.headers = headers or {}
+
+
+def json_response(body, status=200, headers=None):
+    return Response(json.dumps(body, separators=(",", ":")), status, "application/json", headers)
+
+
+class ASGIApp:
+    """
+    Minimal ASGI router: {(method, path): async handler(request)}.
+    A handler returns a Response or a (dict, status) pair, which is sent as JSON.
+    With a metrics.Metrics, every request is timed and GET /metrics is served.
+    Routes in streaming_bodies are not buffered (or size-limited): their
+    handler reads request.stream as the chunks arrive.
+    """
+
+    def __init__(self, routes, metrics=None, streaming_bodies=()):
+        self.routes = dict(routes)
+        self.metrics = metrics
+        self.streaming_bodies = set(streaming_bodies)
+        if metrics is not None:
+            _metrics.describe_http(metrics)
+            self.routes[("GET", "/metrics")] = self._metrics_endpoint
+        self.paths = {path for _, path in self.routes}
+
+    async def _metrics_endpoint(self, req):
+        return Response(self.metrics.render(), content_type=_metrics.CONTENT_TYPE)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                msg = await receive()
+                if msg["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif msg["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+
+        if (scope["method"], scope["path"]) in self.streaming_bodies:
+            req = Request(scope, b"", _body_chunks(receive))
+        else:
+            body = b""
+            more = True
+            while more:
+                msg = await receive()
+                body += msg.get("body", b"")
+                more = msg.get("more_body", False)
+                if len(body) > MAX_BODY_BYTES:
+                    await self.send(send, json_response({"ok": False, "error": "request too large"}, 413))
+                    return
+            req = Request(scope, body)
+        route = req.path if req.path in self.paths else "unmatched"
+        t0 = _metrics.request_started(self.metrics, route) if self.metrics is not None else None
+        handler = self.routes.get((req.method, req.path))
+        if handler is None:
+            status = 405 if req.path in self.paths else 404
+            resp = json_response({"ok": False, "error": "method not allowed" if status == 405 else "not found"}, status)
+        else:
+            try:
+                resp = await handler(req)
+            except Exception as e:
+                print("ASGI handler error:", e)
+                resp = json_response({"ok": False, "error": "internal error"}, 500)
+            if isinstance(resp, tuple):
+                resp = json_response(*resp)
+        # streams count until their first byte, like the Flask hooks
+        streaming = isinstance(resp, StreamingResponse)
+        if t0 is not None and streaming:
+            _metrics.request_finished(self.metrics, route, req.method, resp.status, t0)
+        try:
+            await self.send(send, resp, receive)
+        finally:
+            if t0 is not None and not streaming:
+                _metrics.request_finished(self.metrics, route, req.method, resp.status, t0)
+
+    @staticmethod
+    async def send(send, resp, receive=None):
+        if isinstance(resp, StreamingResponse):
+            headers = [(b"content-type", resp.content_type.encode("latin-1")), (b"cache-control", b"no-cache")]
+            headers += [(k.lower().encode("latin-1"), str(v).encode("latin-1")) for k, v in resp.headers.items()]
+            await send({"type": "http.response.start", "status": resp.status, "headers": headers})
+            # stop producing as soon as the client goes away, not at the next write
+            disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+            chunks = resp.chunks.__aiter__()
+            try:
+                while True:
+                    nxt = asyncio.ensure_future(chunks.__anext__())
+                    await asyncio.wait({nxt, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                    if not nxt.done():
+                        nxt.cancel()
+                        return
+                    try:
+                        chunk = nxt.result()
+                    except StopAsyncIteration:
+                        break
+                    body = chunk if isinstance(chunk, bytes) else chunk.encode("utf-8")
+                    await send({"type": "http.response.body", "body": body, "more_body": True})
+                await send({"type": "http.response.body", "body": b""})
+            finally:
+                disconnected.cancel()
+            return
+        headers = [(b"content-type", resp.content_type.encode("latin-1")),
+                   (b"content-length", str(len(resp.body)).encode("latin-1"))]
+        headers += [(k.lower().encode("latin-1"), str(v).encode("latin-1")) for k, v in resp.headers.items()]
+        await send({"type": "http.response.start", "status": resp.status, "headers": headers})
+        await send({"type": "http.response.body", "body": resp.body})
+
+
+async def _body_chunks(receive):
+    more = True
+    while more:
+        msg = await receive()
+        if msg["type"] == "http.disconnect":
+            raise ConnectionError("client disconnected")
+        if msg.get("body"):
+            yield msg["body"]
+        more = msg.get("more_body", False)
+
+
+async def _wait_disconnect(receive):
+    while True:
+        msg = await receive()
+        if msg["type"] == "http.disconnect":
+            return
+
+
+def run(app, host="0.0.0.0", port=8080, sockets=None):
+    """Serve an ASGI app with uvicorn (pip install uvicorn), optionally on already bound sockets."""
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("ASGI mode needs uvicorn: pip install uvicorn")
+    if sockets is None:
+        uvicorn.run(app, host=host, port=port, log_level="warning", backlog=4096)
+    else:
+        uvicorn.Server(uvicorn.Config(app, log_level="warning", backlog=4096)).run(sockets=sockets)
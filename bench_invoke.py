@@ -0,0 +1,232 @@
+"""
+Load test for /invoke.
+
+Starts server.py or mcp_server.py in a scratch directory (or targets --url),
+drives reserve/advice calls at a given concurrency and action mix, and prints
+a JSON report with throughput, latency percentiles and error rates.
+
+    python bench_invoke.py --server mcp --requests 5000 --concurrency 32 --mix reserve=0.7,advice=0.3
+    python bench_invoke.py --server server --mix reserve=0.7,estimate=0.3
+    python bench_invoke.py --server mcp --history 0,100000,1000000 --out bench.json
+
+--history runs one phase per size, each on a fresh server whose mcp_usage.json
+is pre-filled with that many calls, to show how latency reacts to usage growth.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVERS = {
+    "mcp": ("mcp_server.py", "testkey123"),
+    "server": ("server.py", "supersecret123"),
+}
+# actions make_item() can build that each server implements, and the default --mix
+ACTIONS = {
+    "mcp": ("reserve", "advice", "estimate"),
+    "server": ("reserve", "estimate"),
+}
+DEFAULT_MIX = {
+    "mcp": "reserve=0.7,advice=0.3",
+    "server": "reserve=0.7,estimate=0.3",
+}
+DOMAINS = ["hospital", "bank", "train", "traffic", "restaurant", "temple"]
+
+
+def parse_mix(text):
+    mix = []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix.append((name.strip(), float(weight or 1)))
+    return mix
+
+
+def percentile(sorted_vals, p):
+    if not sorted_vals:
+        return None
+    k = min(len(sorted_vals) - 1, max(0, int(round(p / 100.0 * (len(sorted_vals) - 1)))))
+    return round(sorted_vals[k], 3)
+
+
+def make_item(action, rng):
+    domain = rng.choice(DOMAINS)
+    if action == "reserve":
+        payload = {"domain": domain, "urgency": rng.choice([1, 1, 1, 1.5, 2, 3])}
+    elif action == "estimate":
+        payload = {"domain": domain, "people": rng.randint(0, 60)}
+    else:
+        payload = {"domain": domain}
+    return {"tool": "bench", "action": action, "payload": payload}
+
+
+def seed_usage(workdir, calls):
+    """Write a legacy-format mcp_usage.json with `calls` entries."""
+    now = int(time.time())
+    with open(os.path.join(workdir, "mcp_usage.json"), "w", encoding="utf-8") as f:
+        f.write('{"calls": [')
+        for i in range(calls):
+            f.write(("," if i else "") + json.dumps({"ts": now - calls + i, "tool": "seed", "action": "advice"}))
+        f.write('], "counts": {"seed": %d}}' % calls)
+
+
+def start_server(kind, port, workdir, asgi=False):
+    script = os.path.join(HERE, SERVERS[kind][0])
+    cmd = [sys.executable, script] + (["--asgi"] if asgi else [])
+    # quotas high enough that admission control (mcp_server) never sheds benchmark load
+    unlimited = {"rate": 1e9, "burst": 1e9}
+    env = dict(os.environ, PORT=str(port), MCP_GLOBAL_QUOTA=json.dumps(unlimited),
+               MCP_API_KEYS=json.dumps({SERVERS[kind][1]: dict(unlimited, tool_rate=1e9, tool_burst=1e9)}))
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}/invoke"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{SERVERS[kind][0]} exited with code {proc.returncode}")
+        try:
+            requests.post(url, json={}, timeout=1)
+            return proc, url
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("server did not come up within 60s")
+
+
+def run_load(url, api_key, total, concurrency, mix, seed=0):
+    """Closed-loop load: `concurrency` workers share `total` requests."""
+    names = [name for name, _ in mix]
+    weights = [w for _, w in mix]
+    latencies = {name: [] for name in names}
+    statuses = {}
+    errors = []
+    lock = threading.Lock()
+    remaining = [total]
+
+    def worker(idx):
+        rng = random.Random(seed * 1000 + idx)
+        session = requests.Session()
+        session.headers.update({"X-API-KEY": api_key})
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            action = rng.choices(names, weights)[0]
+            t0 = time.perf_counter()
+            try:
+                r = session.post(url, json=make_item(action, rng), timeout=30)
+                code = r.status_code
+            except requests.RequestException as e:
+                code = "conn_error"
+                with lock:
+                    if len(errors) < 5:
+                        errors.append(str(e))
+            dt = (time.perf_counter() - t0) * 1000.0
+            with lock:
+                latencies[action].append(dt)
+                statuses[str(code)] = statuses.get(str(code), 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    def summary(vals):
+        vals = sorted(vals)
+        return {
+            "count": len(vals),
+            "mean_ms": round(sum(vals) / len(vals), 3) if vals else None,
+            "p50_ms": percentile(vals, 50),
+            "p95_ms": percentile(vals, 95),
+            "p99_ms": percentile(vals, 99),
+            "max_ms": round(vals[-1], 3) if vals else None,
+        }
+
+    everything = [v for vals in latencies.values() for v in vals]
+    failed = sum(n for code, n in statuses.items() if not code.isdigit() or int(code) >= 400)
+    return {
+        "requests": total,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1) if elapsed else None,
+        "latency": summary(everything),
+        "by_action": {name: summary(vals) for name, vals in latencies.items()},
+        "status_counts": statuses,
+        "error_rate": round(failed / total, 4) if total else 0.0,
+        "sample_errors": errors,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--server", choices=sorted(SERVERS), default="mcp", help="which server script to start")
+    ap.add_argument("--asgi", action="store_true", help="start the server in --asgi mode")
+    ap.add_argument("--url", help="benchmark an already running /invoke URL instead of starting a server")
+    ap.add_argument("--api-key", help="API key (defaults to the server's demo key)")
+    ap.add_argument("--port", type=int, default=18080)
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--mix", help="action=weight,... (default: reserve=0.7 plus advice=0.3 for mcp, "
+                                  "estimate=0.3 for server; server.py has no advice action)")
+    ap.add_argument("--warmup", type=int, default=100)
+    ap.add_argument("--history", default="0", help="comma-separated usage history sizes (mcp server only)")
+    ap.add_argument("--out", help="also write the JSON report to this file")
+    args = ap.parse_args()
+
+    args.mix = args.mix or DEFAULT_MIX[args.server]  # reported in "config"
+    mix = parse_mix(args.mix)
+    unsupported = sorted({name for name, _ in mix} - set(ACTIONS[args.server]))
+    if unsupported:
+        ap.error(f"--server {args.server} does not support: {', '.join(unsupported)} "
+                 f"(use {', '.join(ACTIONS[args.server])})")
+    api_key = args.api_key or SERVERS[args.server][1]
+    report = {
+        "started": int(time.time()),
+        "config": {k: v for k, v in vars(args).items() if k != "api_key"},
+        "runs": [],
+    }
+
+    if args.url:
+        run_load(args.url, api_key, args.warmup, args.concurrency, mix, seed=99)
+        result = run_load(args.url, api_key, args.requests, args.concurrency, mix)
+        report["runs"].append(dict(result, history=None))
+    else:
+        for size in [int(s) for s in args.history.split(",") if s.strip()]:
+            workdir = tempfile.mkdtemp(prefix="qintelli-bench-")
+            proc = None
+            try:
+                if size and args.server == "mcp":
+                    seed_usage(workdir, size)
+                t0 = time.perf_counter()
+                proc, url = start_server(args.server, args.port, workdir, args.asgi)
+                startup = time.perf_counter() - t0
+                run_load(url, api_key, args.warmup, args.concurrency, mix, seed=99)
+                result = run_load(url, api_key, args.requests, args.concurrency, mix)
+                report["runs"].append(dict(result, history=size, startup_s=round(startup, 3)))
+            finally:
+                if proc is not None:
+                    proc.terminate()
+                    try:
+                        proc.wait(timeout=10)
+                    except subprocess.TimeoutExpired:
+                        proc.kill()
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    out = json.dumps(report, indent=2)
+    print(out)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(out)
+
+
+if __name__ == "__main__":
+    main()
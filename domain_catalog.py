@@ -0,0 +1,140 @@
+import os
+import json
+import hashlib
+import threading
+from queue_engine import service_time
+
+DEFAULT_ADVICE = ["Try booking or rescheduling."]
+SKIP_FILES = ("reports.json",)  # GUI data living next to the catalog
+
+
+def catalog_files(data_dir):
+    """[(file name, mtime_ns, size)] of the catalog's data/*.json files."""
+    sig = []
+    if os.path.isdir(data_dir):
+        for fname in sorted(os.listdir(data_dir)):
+            if fname.endswith(".json") and fname not in SKIP_FILES and not fname.startswith("."):
+                st = os.stat(os.path.join(data_dir, fname))
+                sig.append((fname, st.st_mtime_ns, st.st_size))
+    return sig
+
+
+def read_catalog(data_dir, files=None):
+    """{domain: info} from data/<domain>.json; unreadable files are skipped."""
+    domains = {}
+    for fname, _, _ in files if files is not None else catalog_files(data_dir):
+        try:
+            with open(os.path.join(data_dir, fname), "r", encoding="utf-8") as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if isinstance(info, dict):
+            domains[fname[:-5]] = info
+    return domains
+
+
+def advice_for(info, people=None):
+    """
+    Advice lines of one domain's catalog entry. With crowd_threshold set, a
+    queue of at most that many people gets calm_advice instead.
+    """
+    threshold = info.get("crowd_threshold")
+    if people is not None and threshold is not None and people <= threshold and info.get("calm_advice"):
+        return list(info["calm_advice"])
+    return list(info.get("advice") or DEFAULT_ADVICE)
+
+
+def check_catalog(domains):
+    """ValueError naming the first domain whose entry the server cannot use."""
+    for d, info in sorted(domains.items()):
+        if "avg_service_time_mins" in info:
+            try:
+                service_time(info["avg_service_time_mins"])
+            except ValueError as e:
+                raise ValueError(f"{d}.json: {e}")
+
+
+class CatalogSnapshot:
+    """One immutable catalog version with its pre-encoded JSON body and ETag."""
+
+    def __init__(self, domains, version):
+        check_catalog(domains)
+        self.domains = domains
+        self.version = version
+        digest = hashlib.sha256(json.dumps(domains, sort_keys=True).encode("utf-8")).hexdigest()
+        self.etag = f'"{digest[:20]}"'
+        self.body = json.dumps({"ok": True, "version": version, "etag": self.etag, "domains": domains},
+                               separators=(",", ":")).encode("utf-8")
+
+    def service_times(self):
+        return {d: service_time(info["avg_service_time_mins"]) for d, info in self.domains.items()
+                if "avg_service_time_mins" in info}
+
+
+class Catalog:
+    """
+    Domain catalog served by the MCP server.
+
+    A watcher thread polls the data/*.json signatures (names, mtimes, sizes)
+    and, when something changed, parses the files into a new snapshot that
+    replaces the current one in a single assignment: readers always see a
+    whole catalog, old or new. The ETag is a hash of the content, so it is the
+    same on every worker and across restarts while the files are unchanged.
+    A reload with an invalid entry (see check_catalog) is rejected and the
+    current snapshot stays.
+    """
+
+    def __init__(self, data_dir, poll_secs=2.0, on_reload=None):
+        self.data_dir = data_dir
+        self.poll_secs = poll_secs
+        self.on_reload = on_reload
+        self._sig = catalog_files(data_dir)
+        self.snapshot = CatalogSnapshot(read_catalog(data_dir, self._sig), 1)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def reload(self):
+        """Re-read data/ if any file changed; True when a new snapshot was published."""
+        sig = catalog_files(self.data_dir)
+        if sig == self._sig:
+            return False
+        self._sig = sig
+        try:
+            snap = CatalogSnapshot(read_catalog(self.data_dir, sig), self.snapshot.version + 1)
+        except ValueError as e:
+            print("catalog reload rejected, keeping version", self.snapshot.version, "-", e)
+            return False
+        if snap.etag == self.snapshot.etag:
+            return False  # touched, not changed
+        self.snapshot = snap
+        if self.on_reload is not None:
+            self.on_reload(snap)
+        return True
+
+    def advice(self, domain, people=None):
+        info = self.snapshot.domains.get(domain)
+        return advice_for(info, people) if info is not None else list(DEFAULT_ADVICE)
+
+    def _run(self):
+        while not self._stop.wait(self.poll_secs):
+            try:
+                self.reload()
+            except Exception as e:
+                print("catalog reload failed:", e)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="catalog-watch", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match check (a list of tags or "*"; weak tags compare equal)."""
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or ("W/" + etag) in tags
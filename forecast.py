@@ -0,0 +1,162 @@
+import sys
+import csv
+import json
+import time
+import argparse
+
+DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+SLOTS = 7 * 24  # one profile cell per day-of-week and hour
+PRIOR_WEIGHT = 3.0  # a cell with few reports leans towards its hour-of-day mean
+DEFAULT_HORIZON = 24  # hours
+MAX_HORIZON = SLOTS
+
+
+class _Profile:
+    """Expected people per (dow, hour) of one domain, plus the slots sorted from least to most busy."""
+
+    __slots__ = ("version", "expected", "reports", "ranking", "total")
+
+    def __init__(self, version, expected, reports):
+        self.version = version
+        self.expected = expected
+        self.reports = reports
+        self.total = sum(reports)
+        self.ranking = sorted(range(SLOTS), key=lambda i: (expected[i], i))
+
+
+class Forecaster:
+    """
+    "Least busy time" forecasts from a ReportStore's per-domain day-of-week x
+    hour aggregates.
+
+    The store folds every report into its cells as it arrives, so this class
+    never looks at raw history: a domain's profile (168 smoothed means and
+    their ranking) is rebuilt from its cells only when the domain changed,
+    and a forecast walks that ranking, at most 168 entries, however many
+    reports there are.
+    """
+
+    def __init__(self, store, prior_weight=PRIOR_WEIGHT):
+        self.store = store
+        self.prior_weight = prior_weight
+        self._profiles = {}
+
+    def profile(self, domain):
+        version = self.store.domain_versions.get(domain)
+        if version is None:
+            return None
+        p = self._profiles.get(domain)
+        if p is None or p.version != version:
+            p = self._profiles[domain] = self._build(domain, version)
+        return p
+
+    def _build(self, domain, version):
+        counts = [self.store.cell(domain, i // 24, i % 24) for i in range(SLOTS)]
+        reports = [n for n, _ in counts]
+        total_n = sum(reports) or 1
+        domain_mean = sum(people for _, people in counts) / total_n
+        expected = []
+        for i, (n, people) in enumerate(counts):
+            # hour-of-day mean over all days is the prior for sparse cells
+            same_hour = counts[i % 24::24]
+            hour_n = sum(c[0] for c in same_hour)
+            prior = sum(c[1] for c in same_hour) / hour_n if hour_n else domain_mean
+            expected.append((people + self.prior_weight * prior) / (n + self.prior_weight))
+        return _Profile(version, expected, reports)
+
+    def best_slots(self, domain, now=None, hours=DEFAULT_HORIZON, count=3):
+        """
+        The `count` least busy hours of the next `hours` for domain, least busy
+        first: [{"day", "dow", "hour", "starts_in_hours", "expected_people", "reports"}].
+        """
+        p = self.profile(domain)
+        if p is None:
+            return []
+        hours = max(1, min(int(hours), MAX_HORIZON))
+        lt = time.localtime(time.time() if now is None else now)
+        start = lt.tm_wday * 24 + lt.tm_hour
+        out = []
+        for i in p.ranking:
+            ahead = (i - start) % SLOTS
+            if ahead < hours:
+                out.append(self._slot(p, i, ahead))
+                if len(out) >= count:
+                    break
+        return out
+
+    def expected_now(self, domain, now=None):
+        """Expected people for the current hour, or None without reports for domain."""
+        p = self.profile(domain)
+        if p is None:
+            return None
+        lt = time.localtime(time.time() if now is None else now)
+        return p.expected[lt.tm_wday * 24 + lt.tm_hour]
+
+    def forecast(self, domain, now=None, hours=DEFAULT_HORIZON, count=3):
+        """best_slots() plus the current hour, for the /invoke forecast action."""
+        p = self.profile(domain)
+        if p is None:
+            return {"domain": domain, "reports": 0, "now": None, "best": []}
+        lt = time.localtime(time.time() if now is None else now)
+        return {"domain": domain, "reports": p.total,
+                "now": self._slot(p, lt.tm_wday * 24 + lt.tm_hour, 0),
+                "best": self.best_slots(domain, now, hours, count)}
+
+    @staticmethod
+    def _slot(p, i, ahead):
+        return {"day": DAYS[i // 24], "dow": i // 24, "hour": i % 24, "starts_in_hours": ahead,
+                "expected_people": round(p.expected[i], 1), "reports": p.reports[i]}
+
+
+def read_history(f):
+    """
+    (domain, people, ts) records from an open CSV (header with domain, people
+    and ts columns) or NDJSON file, one at a time; bad lines are skipped.
+    """
+    first = f.readline()
+    if first.lstrip().startswith("{"):
+        for line in _chain(first, f):
+            try:
+                r = json.loads(line)
+                yield str(r["domain"]), int(r["people"]), float(r["ts"])
+            except (ValueError, KeyError, TypeError):
+                continue
+    else:
+        for r in csv.DictReader(_chain(first, f)):
+            try:
+                yield r["domain"], int(r["people"]), float(r["ts"])
+            except (ValueError, KeyError, TypeError):
+                continue
+
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+
+def main(argv=None):
+    from report_store import ReportStore
+
+    ap = argparse.ArgumentParser(description="Load report history and print least busy hours.")
+    ap.add_argument("--db", default="mcp_reports.db", help="report database (default: mcp_reports.db)")
+    ap.add_argument("--load", metavar="FILE", help="import a CSV/NDJSON history (domain, people, ts) first")
+    ap.add_argument("--hours", type=int, default=DEFAULT_HORIZON, help="forecast horizon in hours")
+    ap.add_argument("domains", nargs="*", help="domains to forecast (default: all)")
+    args = ap.parse_args(argv)
+
+    store = ReportStore(args.db)
+    if args.load:
+        t0 = time.perf_counter()
+        with open(args.load, "r", encoding="utf-8", newline="") as f:
+            n = store.add_many(read_history(f))
+        print(f"loaded {n} reports in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+    forecaster = Forecaster(store)
+    for domain in args.domains or sorted(store.totals):
+        res = forecaster.forecast(domain, hours=args.hours)
+        best = ", ".join(f"{s['day']} {s['hour']:02d}:00 (~{s['expected_people']})" for s in res["best"])
+        print(f"{domain}: {best or 'no reports'}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
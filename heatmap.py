@@ -0,0 +1,94 @@
+import numpy as np
+from PIL import Image
+
+HOURS = 24
+DAYS = 7
+NO_DATA = (224, 224, 224, 0)
+
+
+def density_grids(cells, domains):
+    """
+    Build density grids from ReportStore.cells ({(domain, dow, hour): [reports, people]}).
+
+    Returns (by_hour, by_dow_hour): by_hour is len(domains) x 24, by_dow_hour is
+    len(domains) x 7 x 24. Density is mean people per report; cells without
+    reports are NaN.
+    """
+    index = {d: i for i, d in enumerate(domains)}
+    keys = [k for k in cells if k[0] in index]
+    reports = np.zeros((len(domains), DAYS, HOURS))
+    people = np.zeros((len(domains), DAYS, HOURS))
+    if keys:
+        d = np.fromiter((index[k[0]] for k in keys), dtype=np.intp, count=len(keys))
+        w = np.fromiter((k[1] for k in keys), dtype=np.intp, count=len(keys))
+        h = np.fromiter((k[2] for k in keys), dtype=np.intp, count=len(keys))
+        vals = np.array([cells[k] for k in keys], dtype=float)
+        np.add.at(reports, (d, w % DAYS, h % HOURS), vals[:, 0])
+        np.add.at(people, (d, w % DAYS, h % HOURS), vals[:, 1])
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        by_dow_hour = np.where(reports > 0, people / reports, np.nan)
+        r_hour = reports.sum(axis=1)
+        by_hour = np.where(r_hour > 0, people.sum(axis=1) / r_hour, np.nan)
+    return by_hour, by_dow_hour
+
+
+def colorize(grid):
+    """NaN -> transparent, else yellow (quietest) to red (most crowded), as RGBA uint8."""
+    out = np.empty(grid.shape + (4,), dtype=np.uint8)
+    out[...] = NO_DATA
+    mask = ~np.isnan(grid)
+    if mask.any():
+        vals = grid[mask]
+        lo, hi = vals.min(), vals.max()
+        v = (vals - lo) / (hi - lo) if hi > lo else np.full(vals.shape, 0.5)
+        out[mask, 0] = 255
+        out[mask, 1] = (255 * (1.0 - v)).astype(np.uint8)
+        out[mask, 2] = 0
+        out[mask, 3] = 210
+    return out
+
+
+class HeatmapRenderer:
+    """
+    Renders the domain x hour grid (all domains stacked) above the day-of-week x
+    hour grid of the selected domain into one RGBA image.
+
+    The image is cached against (store.version, domains, selected); render()
+    returns None when nothing changed, so callers can skip redraws entirely.
+    """
+
+    def __init__(self, store, width=200, height=180, label_w=44):
+        self.store = store
+        self.width = width
+        self.height = height
+        self.label_w = label_w
+        self._key = None
+        self.layout = {}
+
+    def render(self, domains, selected):
+        key = (self.store.version, tuple(domains), selected)
+        if key == self._key:
+            return None
+        self._key = key
+
+        by_hour, by_dow_hour = density_grids(self.store.cells, domains)
+        img = Image.new("RGBA", (self.width, self.height), (0, 0, 0, 0))
+        cell_w = max(1, (self.width - self.label_w) // HOURS)
+        rows = max(1, len(domains))
+        top_h = self.height * 3 // 5
+        row_h = max(1, top_h // rows)
+
+        if len(domains):
+            top = Image.fromarray(colorize(by_hour), "RGBA").resize((cell_w * HOURS, row_h * rows), Image.NEAREST)
+            img.paste(top, (self.label_w, 0))
+
+        day_h = max(1, (self.height - top_h - 4) // DAYS)
+        if selected in domains:
+            grid = by_dow_hour[domains.index(selected)]
+            bottom = Image.fromarray(colorize(grid), "RGBA").resize((cell_w * HOURS, day_h * DAYS), Image.NEAREST)
+            img.paste(bottom, (self.label_w, top_h + 4))
+
+        # where the caller should put text labels
+        self.layout = {"row_h": row_h, "top_h": top_h, "day_h": day_h, "cell_w": cell_w}
+        return img
@@ -0,0 +1,112 @@
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+HEADER = "Idempotency-Key"
+ITEM_FIELD = "idempotency_key"  # the same for one item of a batch
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+DEFAULT_TTL = 24 * 3600.0  # GUI outbox entries may be flushed hours after the first attempt
+DEFAULT_MAX_ENTRIES = 10000
+WAIT_SECS = 30.0  # how long a duplicate waits for the first request to finish
+
+
+def fingerprint(data):
+    """Hash of a request body, to spot a key reused for a different request."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+                          .encode("utf-8")).hexdigest()
+
+
+def cacheable(status):
+    # rate limiting and server errors are transient: a retry must run again
+    return status < 500 and status != 429
+
+
+class _Flight:
+    __slots__ = ("fingerprint", "done", "response")
+
+    def __init__(self, fp):
+        self.fingerprint = fp
+        self.done = threading.Event()
+        self.response = None
+
+
+class IdempotencyCache:
+    """
+    Responses of /invoke requests sent with an Idempotency-Key.
+
+    The first request with a key runs; its response (body, status) is kept
+    for ttl seconds and returned to every later request with the same key
+    and body, so a retried reservation gets the same token instead of a new
+    one. Duplicates arriving while the first one still runs wait for it
+    rather than running again. At most max_entries responses are kept
+    (least recently used go first), whatever the number of keys.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, wait=WAIT_SECS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.wait = wait
+        self._done = OrderedDict()  # key -> (expires, fingerprint, response)
+        self._flights = {}  # key -> _Flight
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.collapsed = 0
+
+    def __len__(self):
+        return len(self._done)
+
+    def run(self, key, fp, fn):
+        """
+        fn() -> (body, status[, headers]) once per key. Returns (response, replayed);
+        a key reused with a different body gets a 422 response.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._done.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._done[key]
+                entry = None
+            if entry is not None:
+                self._done.move_to_end(key)
+                if entry[1] != fp:
+                    return _mismatch(), False
+                self.hits += 1
+                return entry[2], True
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight(fp)
+            elif flight.fingerprint != fp:
+                return _mismatch(), False
+            else:
+                self.collapsed += 1
+
+        if not leader:
+            if not flight.done.wait(self.wait):
+                return ({"ok": False, "error": "the original request with this Idempotency-Key is still running"},
+                        409), False
+            if flight.response is None:
+                return ({"ok": False, "error": "the original request with this Idempotency-Key failed"}, 500), False
+            return flight.response, True
+
+        response = None
+        try:
+            response = fn()
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if response is not None and cacheable(response[1]):
+                    self._done[key] = (time.monotonic() + self.ttl, fp, response)
+                    self._done.move_to_end(key)
+                    while len(self._done) > self.max_entries:
+                        self._done.popitem(last=False)
+            flight.response = response
+            flight.done.set()
+        return response, False
+
+
+def _mismatch():
+    return {"ok": False, "error": "Idempotency-Key was already used for a different request"}, 422
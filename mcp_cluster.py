@@ -0,0 +1,316 @@
+import os
+import sys
+import json
+import time
+import socket
+import bisect
+import asyncio
+import hashlib
+import secrets
+import argparse
+import subprocess
+
+VNODES = 128  # points per worker on the ring; evens out the domain split
+FORWARD_HEADER = "X-MCP-Shard-Auth"  # marks a request forwarded by a sibling worker
+TOKEN_ACTIONS = ("position", "status", "validate")
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mcp_server.py")
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing of keys (domains, tokens) onto worker indexes."""
+
+    def __init__(self, nodes, vnodes=VNODES):
+        points = sorted((_hash(f"{node}#{v}"), node) for node in nodes for v in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._nodes = [n for _, n in points]
+
+    def node_for(self, key):
+        i = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[i]
+
+
+def route_key(item):
+    """The key an /invoke item is routed by: its token for token lookups, else its domain."""
+    if not isinstance(item, dict):
+        return None
+    payload = item.get("payload") or {}
+    if not isinstance(payload, dict):
+        return None
+    if item.get("action", "advice") in TOKEN_ACTIONS:
+        return str(payload.get("token", "")).upper()
+    return str(payload.get("domain", "general"))
+
+
+class Shard:
+    """
+    This worker's place in the cluster. Each domain (and so its queue, tokens,
+    estimator state and stream subscribers) lives on exactly one worker.
+    Tokens are drawn until they hash to the issuing worker, so a token alone
+    is enough to find its owner.
+    """
+
+    def __init__(self, index, count, port_base, secret, host="0.0.0.0", port=8080):
+        self.index = index
+        self.count = count
+        self.port_base = port_base
+        self.secret = secret
+        self.host = host
+        self.port = port
+        self.ring = HashRing(range(count))
+        self.peers = PeerClient()
+
+    def owner(self, key):
+        return self.index if key is None else self.ring.node_for(key)
+
+    def peer_port(self, index):
+        return self.port_base + index
+
+    def token_factory(self, base):
+        def factory():
+            token = base()
+            while self.ring.node_for(token) != self.index:
+                token = base()
+            return token
+        return factory
+
+    def is_forwarded(self, req):
+        return req.headers.get(FORWARD_HEADER) == self.secret
+
+    def listen_sockets(self):
+        """Public socket (shared by all workers via SO_REUSEPORT) plus this worker's peer socket."""
+        public = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        public.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        public.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        public.bind((self.host, self.port))
+        internal = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        internal.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        internal.bind(("127.0.0.1", self.peer_port(self.index)))
+        return [public, internal]
+
+    def forward_headers(self, req):
+        headers = {"X-API-KEY": req.headers.get("X-API-KEY", ""), FORWARD_HEADER: self.secret,
+                   "Content-Type": "application/json"}
+        if req.headers.get("Idempotency-Key"):
+            headers["Idempotency-Key"] = req.headers.get("Idempotency-Key")
+        return headers
+
+    async def forward_invoke(self, owner, data, headers):
+        """Run an /invoke body on its owner; (body, status), or 503 if the owner is unreachable."""
+        try:
+            status, _, body = await self.peers.request(
+                self.peer_port(owner), "POST", "/invoke", headers, json.dumps(data).encode("utf-8"))
+            return json.loads(body), status
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            return {"ok": False, "error": f"shard {owner} unavailable: {e}"}, 503
+
+    async def forward_ingest(self, owner, rows, headers):
+        """
+        Store kiosk report rows on their owner via its /ingest; (stored,
+        duplicates). Raises OSError when the owner is unreachable or fails.
+        """
+        body = "".join(json.dumps({"kiosk": k, "seq": seq, "domain": d, "people": p, "ts": ts},
+                                  separators=(",", ":")) + "\n" for k, seq, d, p, ts in rows)
+        headers = {**headers, "Content-Type": "application/x-ndjson"}
+        try:
+            status, _, data = await self.peers.request(
+                self.peer_port(owner), "POST", "/ingest", headers, body.encode("utf-8"))
+            res = json.loads(data)
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            raise OSError(f"shard {owner} unavailable: {e}")
+        if status != 200:
+            raise OSError(f"shard {owner} answered {status}: {res.get('error')}")
+        return res["stored"], res["duplicates"]
+
+    async def dispatch(self, data, headers, local, max_items):
+        """
+        Route an admitted /invoke body. local(data) runs it on this worker and
+        returns an awaitable of (body, status). A batch is split by owner; the parts run
+        concurrently and the results are put back in request order.
+        """
+        items = data if isinstance(data, list) else data.get("batch") if isinstance(data, dict) else None
+        if items is None:
+            owner = self.owner(route_key(data))
+            if owner == self.index:
+                return await local(data)
+            return await self.forward_invoke(owner, data, headers)
+        if not isinstance(items, list) or len(items) > max_items:
+            return await local(data)  # let the usual validation answer
+
+        groups = {}
+        for pos, item in enumerate(items):
+            groups.setdefault(self.owner(route_key(item)), []).append(pos)
+        if list(groups) == [self.index]:
+            return await local(items)
+
+        async def run(owner, positions):
+            part = [items[p] for p in positions]
+            if owner == self.index:
+                return await local(part)
+            return await self.forward_invoke(owner, part, headers)
+
+        owners = list(groups)
+        answers = await asyncio.gather(*(run(o, groups[o]) for o in owners))
+        results = [None] * len(items)
+        for owner, (body, status) in zip(owners, answers):
+            part = body.get("results") if status == 200 else None
+            for i, p in enumerate(groups[owner]):
+                results[p] = part[i] if part else dict(body, status=status)
+        return {"ok": True, "type": "batch", "results": results}, 200
+
+    async def forward_stream(self, owner, target, headers):
+        """Proxy a /stream request (SSE or long-poll) to the worker that owns the token."""
+        from asgi_server import Response, StreamingResponse
+        try:
+            status, resp_headers, reader, writer = await self.peers.open_stream(self.peer_port(owner), target, headers)
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            return {"ok": False, "error": f"shard {owner} unavailable: {e}"}, 503
+        content_type = resp_headers.get("content-type", "application/json")
+        if content_type.startswith("text/event-stream"):
+            return StreamingResponse(_relay(reader, writer), status)
+        try:
+            body = await reader.read()
+        finally:
+            writer.close()
+        return Response(body, status, content_type)
+
+
+async def _relay(reader, writer):
+    try:
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        writer.close()
+
+
+class PeerClient:
+    """
+    Minimal HTTP/1.1 client for worker-to-worker calls over loopback, on the
+    worker's event loop. Connections are kept alive and reused, so a forwarded
+    call costs one round trip, not a TCP handshake.
+    """
+
+    def __init__(self, host="127.0.0.1", max_idle=32):
+        self.host = host
+        self.max_idle = max_idle
+        self._idle = {}  # port -> [(reader, writer)]
+
+    async def request(self, port, method, target, headers, body=b""):
+        idle = self._idle.setdefault(port, [])
+        reused = bool(idle)
+        conn = idle.pop() if reused else await asyncio.open_connection(self.host, port)
+        try:
+            status, resp_headers, data = await self._roundtrip(conn, method, target, headers, body)
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            conn[1].close()
+            if not reused:
+                raise
+            # the peer closed an idle connection (e.g. it restarted); retry once on a new one
+            conn = await asyncio.open_connection(self.host, port)
+            status, resp_headers, data = await self._roundtrip(conn, method, target, headers, body)
+        if resp_headers.get("connection", "").lower() == "close" or len(idle) >= self.max_idle:
+            conn[1].close()
+        else:
+            idle.append(conn)
+        return status, resp_headers, data
+
+    async def _roundtrip(self, conn, method, target, headers, body):
+        reader, writer = conn
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {self.host}", f"Content-Length: {len(body)}"]
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+        status, resp_headers = await _read_head(reader)
+        if "content-length" not in resp_headers:
+            raise ValueError("peer response without content-length")
+        data = await reader.readexactly(int(resp_headers["content-length"]))
+        return status, resp_headers, data
+
+    async def open_stream(self, port, target, headers):
+        """GET over a fresh HTTP/1.0 connection; the body runs until the peer closes it."""
+        reader, writer = await asyncio.open_connection(self.host, port)
+        lines = [f"GET {target} HTTP/1.0", f"Host: {self.host}"] + [f"{k}: {v}" for k, v in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+        try:
+            status, resp_headers = await _read_head(reader)
+        except Exception:
+            writer.close()
+            raise
+        return status, resp_headers, reader, writer
+
+
+async def _read_head(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise asyncio.IncompleteReadError(b"", None)
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        k, _, v = line.decode("latin-1").partition(":")
+        headers[k.strip().lower()] = v.strip()
+    return status, headers
+
+
+def shard_from_env():
+    """This worker's Shard when started by run_workers(), else None (single process)."""
+    if "MCP_SHARD" not in os.environ:
+        return None
+    return Shard(int(os.environ["MCP_SHARD"]), int(os.environ["MCP_SHARDS"]),
+                 int(os.environ["MCP_SHARD_PORT_BASE"]), os.environ["MCP_SHARD_SECRET"],
+                 os.environ.get("MCP_SHARD_HOST", "0.0.0.0"), int(os.environ.get("PORT", 8080)))
+
+
+def run_workers(workers, host="0.0.0.0", port=8080, port_base=None):
+    """
+    Start `workers` ASGI worker processes of mcp_server.py on one public port
+    and restart any that exit, until interrupted.
+    """
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise SystemExit("multi-worker mode needs SO_REUSEPORT (Linux, macOS, BSD)")
+    port_base = port + 1 if port_base is None else port_base
+    env = dict(os.environ, MCP_SHARDS=str(workers), MCP_SHARD_PORT_BASE=str(port_base),
+               MCP_SHARD_SECRET=secrets.token_hex(16), MCP_SHARD_HOST=host, PORT=str(port))
+
+    def spawn(i):
+        return subprocess.Popen([sys.executable, SERVER_SCRIPT, "--asgi"], env=dict(env, MCP_SHARD=str(i)))
+
+    procs = [spawn(i) for i in range(workers)]
+    print(f"{workers} workers on {host}:{port} (peer ports {port_base}-{port_base + workers - 1})")
+    try:
+        while True:
+            time.sleep(1)
+            for i, p in enumerate(procs):
+                if p.poll() is not None:
+                    print(f"worker {i} exited with {p.returncode}, restarting")
+                    procs[i] = spawn(i)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run mcp_server.py as several domain-sharded worker processes.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8080)))
+    parser.add_argument("--peer-port-base", type=int, default=None, help="first loopback port for worker-to-worker calls")
+    args = parser.parse_args(argv)
+    run_workers(args.workers, args.host, args.port, args.peer_port_base)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,175 @@
-from flask import Flask, request, jsonify, render_template_string
-import time, os, json, uuid
+from flask import Flask, Response, request, jsonify, render_template_string
+import time, os, sys, json, atexit, threading
+from usage_journal import UsageJournal
+from queue_engine import QueueEngine, parse_urgency, check_args
+from domain_catalog import Catalog, etag_matches
+from wait_estimator import WaitEstimator
+from queue_actions import QueueActions, COMPUTE_ACTIONS
+from report_store import ReportStore, MAX_PEOPLE, report_ts
+from forecast import Forecaster, DEFAULT_HORIZON
+from venue_index import load_index, describe, DEFAULT_SPEED_KMH
+from report_ingest import NDJSONReports, ingest_stream, ingest_reply, FOLD_ROWS
+from traffic_capture import CaptureWriter
+import idempotency as idem
+from token_registry import TokenRegistry, random_token
+from admission import AdmissionController, load_keys, retry_after_header, EMERGENCY_URGENCY
+from token_stream import StreamHub, stream_events, async_stream_events, long_poll, async_long_poll
+from usage_rollup import RollupEngine, WINDOWS
+from mcp_cluster import shard_from_env
+from shared_store import SharedStore
+from metrics import Metrics, instrument_flask
 
 app = Flask(__name__)
 
+# Runtime telemetry at GET /metrics (Prometheus text format, see metrics.py)
+metrics = Metrics()
+instrument_flask(app, metrics)
+metrics.describe("mcp_action_duration_seconds", "histogram", "Time to run one /invoke item, by tool and action.")
+metrics.describe("mcp_persistence_duration_seconds", "histogram", "Usage journal appends and compactions.")
+
+def observe_persistence(op, seconds):
+    metrics.observe("mcp_persistence_duration_seconds", (("op", op),), seconds)
+
+# Set when this process is one worker of `python mcp_cluster.py --workers N`;
+# it then owns only the domains that hash to it (see mcp_cluster.py).
+shard = shard_from_env()
+
+# Usage is kept in an append-only journal (see usage_journal.py); the old
+# single-file mcp_usage.json is migrated into it on first start.
 USAGE_FILE = "mcp_usage.json"
-if not os.path.exists(USAGE_FILE):
-    with open(USAGE_FILE, "w", encoding="utf-8") as f:
-        json.dump({"calls": [], "counts": {}}, f)
+USAGE_JOURNAL_DIR = os.environ.get("MCP_USAGE_DIR", "mcp_usage.d")
+if shard and shard.index > 0:
+    USAGE_JOURNAL_DIR += f".shard{shard.index}"
+rollup = RollupEngine()
+journal = UsageJournal(USAGE_JOURNAL_DIR, legacy_file=None if shard and shard.index > 0 else USAGE_FILE,
+                       rollup=rollup, observer=observe_persistence).start()
+atexit.register(journal.close)
+
+# Domain catalog (data/*.json: checklists, service times, advice), hot-reloaded
+# when the files change and served at GET /catalog (see domain_catalog.py)
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+def apply_catalog(snap):
+    # new priors for every domain, already seen or not; learned service times are kept
+    estimator.set_priors(snap.service_times())
+    queues.set_service_times(snap.service_times())
+
+catalog = Catalog(DATA_DIR, on_reload=apply_catalog)
+
+# Live reservation queues, one per domain (see queue_engine.py)
+SERVICE_TIMES = catalog.snapshot.service_times()
+estimator = WaitEstimator(SERVICE_TIMES)
+registry = TokenRegistry(token_factory=shard.token_factory(random_token) if shard else None)
+hub = StreamHub()  # pushes queue changes to /stream subscribers
+queues = QueueEngine(SERVICE_TIMES, estimator=estimator, registry=registry, on_change=hub.publish)
+actions = QueueActions(queues, registry, estimator)  # reserve, status, simulate, ... (see queue_actions.py)
+token_status = actions.token_status
+stream_request = actions.stream_request
+catalog.start()
+
+# Crowd reports ("report" action) folded into per-domain day-of-week x hour
+# profiles as they arrive; the "forecast" action reads only those (see forecast.py)
+REPORTS_DB = os.environ.get("MCP_REPORTS_DB", "mcp_reports.db")
+if shard and shard.index > 0:
+    REPORTS_DB += f".shard{shard.index}"
+reports = ReportStore(REPORTS_DB)
+forecaster = Forecaster(reports)
+atexit.register(reports.close)
+
+# Venue registry (data/venues.csv, or MCP_VENUES) in a spatial index for the
+# "nearest" action: closest venues of a domain ranked by travel time plus wait
+VENUES_FILE = os.environ.get("MCP_VENUES", os.path.join(DATA_DIR, "venues.csv"))
+venues = load_index(VENUES_FILE)
+MAX_NEAREST = 50
+metrics.gauge("mcp_queue_length", "People waiting, per domain.",
+              lambda: {(("domain", d),): len(q) for d, q in list(queues.queues.items())})
+metrics.gauge("mcp_tokens_active", "Issued tokens that have not expired.", lambda: {(): len(registry)})
 
 # API key settings
 # Set environment variable MCP_API_KEY to a secure value before running.
 DEFAULT_API_KEY = "testkey123"  # change this for production / demo
 API_KEY = os.environ.get("MCP_API_KEY", DEFAULT_API_KEY)
+PORT = int(os.environ.get("PORT", 8080))
+
+# Several keys with their own quotas: MCP_API_KEYS='{"key": {"rate": 20, "burst": 40}}'
+# or mcp_keys.json (see admission.py). Without either, API_KEY is the only key.
+# Server-wide capacity: MCP_GLOBAL_QUOTA='{"rate": 500, "burst": 1000}'.
+KEYS_FILE = "mcp_keys.json"
+GLOBAL_QUOTA = json.loads(os.environ.get("MCP_GLOBAL_QUOTA") or "{}")
+admission = AdmissionController(load_keys(API_KEY, KEYS_FILE), GLOBAL_QUOTA,
+                                share=1.0 / shard.count if shard else 1.0)
+
+# Optional capture of every /invoke request (body, status, latency) for
+# replay_invoke.py: MCP_CAPTURE=invoke-capture.ndjson.gz
+CAPTURE_FILE = os.environ.get("MCP_CAPTURE")
+if CAPTURE_FILE and shard and shard.index > 0:
+    CAPTURE_FILE += f".shard{shard.index}"
+capture = CaptureWriter(CAPTURE_FILE).start() if CAPTURE_FILE else None
+if capture is not None:
+    atexit.register(capture.close)
+
+def invoke_done(data, body, status, t0, key=None):
+    """Capture the call if enabled; returns the Server-Timing header (handler time, for replays)."""
+    seconds = time.perf_counter() - t0
+    if capture is not None:
+        capture.record(data, status, seconds, body, idempotency_key=key[1] if key else None)
+    return {"Server-Timing": f"app;dur={seconds * 1000.0:.3f}"}
+
+# Retried /invoke requests with the same Idempotency-Key get the first
+# response again instead of running twice (see idempotency.py)
+idempotency = idem.IdempotencyCache(float(os.environ.get("MCP_IDEMPOTENCY_TTL", idem.DEFAULT_TTL)),
+                                    int(os.environ.get("MCP_IDEMPOTENCY_MAX", idem.DEFAULT_MAX_ENTRIES)))
+metrics.describe("mcp_idempotent_replays_total", "counter", "/invoke responses replayed for a repeated Idempotency-Key.")
+metrics.gauge("mcp_idempotency_entries", "Responses kept for Idempotency-Key replays.",
+              lambda: {(): len(idempotency)})
+
+def idempotency_key(req):
+    """(API key, Idempotency-Key) or None; ValueError when the key is too long."""
+    key = req.headers.get(idem.HEADER)
+    if not key:
+        return None
+    if len(key) > idem.MAX_KEY_LENGTH:
+        raise ValueError(f"{idem.HEADER} longer than {idem.MAX_KEY_LENGTH} characters")
+    return req.headers.get("X-API-KEY", ""), key
+
+def run_idempotent(key, data, fn):
+    """fn() -> (body, status[, headers]), run once per key; returns (response, replayed)."""
+    if key is None:
+        return fn(), False
+    response, replayed = idempotency.run(key, idem.fingerprint(data), fn)
+    if replayed:
+        metrics.inc("mcp_idempotent_replays_total")
+    return response, replayed
+
+def invoke_reply(data, response, replayed, t0, key):
+    """(body, status, headers) of a finished /invoke."""
+    body, status = response[0], response[1]
+    headers = dict(response[2]) if len(response) > 2 else {}
+    headers.update(invoke_done(data, body, status, t0, key))
+    if replayed:
+        headers[idem.REPLAYED_HEADER] = "true"
+    return body, status, headers
+
+# Workers publish their usage totals here so any of them can serve the merged leaderboard.
+SHARED_DB = os.environ.get("MCP_SHARED_DB", "mcp_shared.db")
+USAGE_PUBLISH_SECS = 2
+shared = SharedStore(SHARED_DB) if shard else None
 
-def load_usage():
-    with open(USAGE_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+def usage_summary():
+    now = time.time()
+    return {"windows": {w: rollup.window(w, now) for w in ["all"] + list(WINDOWS)},
+            "recent": journal.recent_calls(10)}
 
-def save_usage(data):
-    with open(USAGE_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+def publish_usage():
+    while True:
+        try:
+            shared.put(shard.index, "usage", usage_summary())
+        except Exception as e:
+            print("usage publish failed:", e)
+        time.sleep(USAGE_PUBLISH_SECS)
+
+if shard:
+    threading.Thread(target=publish_usage, name="usage-publish", daemon=True).start()
 
 @app.route("/health", methods=["GET"])
 def health():
@@ -27,43 +177,253 @@ def health():
 
 def require_api_key(req):
     header = req.headers.get("X-API-KEY", "")
-    return header == API_KEY
+    return admission.key_config(header) is not None
+
+def admission_check(req, data):
+    """
+    Rate limits for an authenticated /invoke. Returns None when admitted, else
+    a 429 (body, status, headers), or a 413 for a batch too large to ever be
+    admitted under the key's quotas. Requests made only of emergency
+    reservations may use the reserved lane.
+    """
+    items = data if isinstance(data, list) else data.get("batch") if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        items = [data if isinstance(data, dict) else {}]
+    items = [i for i in items if isinstance(i, dict)] or [{}]
+    tools = [str(i.get("tool", "q_intelli")) for i in items]
+    emergency = all(
+        i.get("action") == "reserve"
+        and parse_urgency((i.get("payload") or {}).get("urgency", 1) if isinstance(i.get("payload"), dict) else 1)
+        >= EMERGENCY_URGENCY
+        for i in items
+    )
+    api_key = req.headers.get("X-API-KEY", "")
+    ok, wait = admission.admit(api_key, tools, emergency)
+    if ok:
+        return None
+    if wait is None:
+        limit = admission.max_calls(api_key, tools, emergency)
+        return {"ok": False, "error": f"too many calls for this key's quota: send at most {limit} per request",
+                "max_calls": limit}, 413
+    retry = retry_after_header(wait)
+    return {"ok": False, "error": "rate limited", "retry_after": int(retry)}, 429, {"Retry-After": retry}
+
+MAX_BATCH_ITEMS = 500
+IO_ACTIONS = {"report"}  # write SQLite: run on the I/O pool in --asgi mode
+
+def handle_action(action, payload):
+    """Run one tool action; returns (response body, http status)."""
+    error = check_args(payload)
+    if error:
+        return {"ok": False, "error": error}, 400
+    res = actions.handle(action, payload)
+    if res is not None:
+        return res
+    if action == "report":
+        try:
+            people = int(payload["people"])
+        except (KeyError, TypeError, ValueError, OverflowError):
+            return {"ok": False, "error": "people must be an integer"}, 400
+        if not 0 <= people <= MAX_PEOPLE:
+            return {"ok": False, "error": f"people must be between 0 and {MAX_PEOPLE}"}, 400
+        try:
+            ts = report_ts(payload.get("ts"))
+        except (TypeError, ValueError, OverflowError):
+            return {"ok": False, "error": "ts must be an epoch time between 2000 and now"}, 400
+        domain = payload.get("domain", "general")
+        venue = None
+        if payload.get("venue") is not None:
+            # a report at a known venue also updates that venue's crowd for "nearest"
+            venue = venues.get(str(payload["venue"]))
+            if venue is None or venue.domain != domain:
+                return {"ok": False, "error": f"unknown venue for domain {domain}"}, 400
+        reports.add(domain, people, ts)
+        if venue is not None:
+            venues.report(venue.id, people, ts)
+        return {"ok": True, "type": "report", "domain": domain, "reports": reports.report_count(domain)}, 200
+    elif action == "forecast":
+        try:
+            hours = int(payload.get("hours", DEFAULT_HORIZON))
+            count = max(1, min(int(payload.get("slots", 3)), 24))
+        except (TypeError, ValueError):
+            return {"ok": False, "error": "hours and slots must be integers"}, 400
+        return {"ok": True, "type": "forecast",
+                **forecaster.forecast(payload.get("domain", "general"), hours=hours, count=count)}, 200
+    elif action == "nearest":
+        try:
+            lat = float(payload["lat"])
+            lon = float(payload["lon"])
+            k = max(1, min(int(payload.get("k", 5)), MAX_NEAREST))
+            max_km = float(payload["max_km"]) if payload.get("max_km") is not None else None
+            speed = float(payload.get("speed_kmh", DEFAULT_SPEED_KMH))
+        except (KeyError, TypeError, ValueError):
+            return {"ok": False, "error": "lat and lon are required; k, max_km and speed_kmh must be numbers"}, 400
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180) or not speed > 0:
+            return {"ok": False, "error": "lat/lon out of range or speed_kmh not positive"}, 400
+        domain = payload.get("domain", "general")
+        now = time.time()
+        hits = venues.nearest(domain, lat, lon, k, max_km, speed, estimator.service_mins(domain),
+                              forecaster.expected_now(domain, now), now)
+        return {"ok": True, "type": "nearest", "domain": domain, "venues_indexed": venues.count(domain),
+                "venues": [describe(h, venues, now) for h in hits]}, 200
+    elif action == "advice":
+        # advice lives in data/<domain>.json now, see domain_catalog.py
+        try:
+            people = int(payload["people"]) if "people" in payload else None
+        except (TypeError, ValueError):
+            people = None
+        lines = catalog.advice(payload.get("domain", "general"), people)
+        return {"ok": True, "type": "advice", "advice": " ".join(lines), "lines": lines,
+                "catalog_version": catalog.snapshot.version}, 200
+    else:
+        return {"ok": False, "error": "unknown action"}, 400
+
+def timed_action(tool, action, payload):
+    """handle_action() plus its latency in mcp_action_duration_seconds."""
+    t0 = time.perf_counter()
+    res = handle_action(action, payload)
+    labels = (("tool", metrics.bounded("tool", str(tool))), ("action", metrics.bounded("action", str(action))))
+    metrics.observe("mcp_action_duration_seconds", labels, time.perf_counter() - t0)
+    return res
+
+def parse_item(data):
+    """(tool, action, payload) from one request object, with the usual defaults."""
+    if not isinstance(data, dict):
+        return None
+    payload = data.get("payload") or {}
+    if not isinstance(payload, dict):
+        return None
+    return data.get("tool", "q_intelli"), data.get("action", "advice"), payload
+
+def run_item(item, parsed, api_key):
+    """
+    One batch item. With an "idempotency_key" it runs once per key, sharing the
+    Idempotency-Key cache: an item sent alone first, or in an earlier batch,
+    gets its first answer again.
+    """
+    key = item.get(idem.ITEM_FIELD)
+    if key is None:
+        return timed_action(*parsed)
+    if not isinstance(key, str) or not 0 < len(key) <= idem.MAX_KEY_LENGTH:
+        return {"ok": False, "error": f"{idem.ITEM_FIELD} must be 1 to {idem.MAX_KEY_LENGTH} characters"}, 400
+    data = {k: v for k, v in item.items() if k != idem.ITEM_FIELD}
+    return run_idempotent((api_key, key), data, lambda: timed_action(*parsed))[0][:2]
+
+def run_batch(items, record, api_key=""):
+    """
+    Batch envelope: a list of {tool, action, payload[, idempotency_key]}. All
+    items are journaled with one append and each gets its own result (with
+    "status") in order.
+    """
+    parsed = [parse_item(item) for item in items]
+    record([(p[0], p[1]) for p in parsed if p is not None])
+    results = []
+    for item, p in zip(items, parsed):
+        if p is None:
+            body, status = {"ok": False, "error": "invalid item"}, 400
+        else:
+            body, status = run_item(item, p, api_key)
+        results.append({**body, "status": status})
+    return {"ok": True, "type": "batch", "results": results}, 200
+
+def handle_invoke(data, record=None, api_key=""):
+    """
+    Single call ({tool, action, payload}) or batch ([...] or {"batch": [...]}).
+    record(calls) persists usage; the ASGI mode passes one that runs off the event loop.
+    api_key scopes the items' own idempotency keys.
+    """
+    record = record or journal.record_many
+    items = data if isinstance(data, list) else data.get("batch") if isinstance(data, dict) else None
+    if items is not None:
+        if not isinstance(items, list):
+            return {"ok": False, "error": "batch must be a list"}, 400
+        if len(items) > MAX_BATCH_ITEMS:
+            return {"ok": False, "error": f"batch too large (max {MAX_BATCH_ITEMS} items)"}, 413
+        return run_batch(items, record, api_key)
+
+    item = parse_item(data or {})
+    if item is None:
+        return {"ok": False, "error": "invalid payload"}, 400
+    tool, action, payload = item
+    record([(tool, action)])
+    return timed_action(tool, action, payload)
 
 @app.route("/invoke", methods=["POST"])
 def invoke():
-    # protect with API key
+    # protect with API key (checked once, also for batches)
     if not require_api_key(request):
         return jsonify({"ok": False, "error": "invalid api key"}), 401
 
-    data = request.json or {}
-    tool = data.get("tool", "q_intelli")
-    action = data.get("action", "advice")
-    payload = data.get("payload", {})
+    data = request.get_json(silent=True)
+    t0 = time.perf_counter()
+    try:
+        key = idempotency_key(request)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    # a replayed response costs no quota; concurrent duplicates wait for the first
+    api_key = request.headers.get("X-API-KEY", "")
+    response, replayed = run_idempotent(
+        key, data, lambda: admission_check(request, data) or handle_invoke(data, api_key=api_key))
+    body, status, headers = invoke_reply(data, response, replayed, t0, key)
+    return jsonify(body), status, headers
 
-    usage = load_usage()
-    usage["calls"].append({"ts": int(time.time()), "tool": tool, "action": action})
-    usage["counts"][tool] = usage["counts"].get(tool, 0) + 1
-    save_usage(usage)
+@app.route("/stream", methods=["GET"])
+def stream():
+    """
+    Token status pushed by the server: Server-Sent Events by default, or a single
+    long-poll answer with ?since=<version>. EventSource clients can pass ?key=.
+    """
+    if not (require_api_key(request) or admission.key_config(request.args.get("key", "")) is not None):
+        return jsonify({"ok": False, "error": "invalid api key"}), 401
+    sub, err = stream_request(request.args)
+    if err:
+        return jsonify(err[0]), err[1]
+    token, domain, since = sub
+    if since is not None or request.args.get("mode") == "poll":
+        return jsonify({"ok": True, **long_poll(hub, domain, token_status, token, since)})
+    return Response(stream_events(hub, domain, token_status, token), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-    if action == "reserve":
-        token = str(uuid.uuid4())[:8].upper()
-        eta_min = int(payload.get("eta_min", 15))
-        return jsonify({"ok": True, "type": "reservation", "token": token, "eta_min": eta_min})
-    elif action == "advice":
-        domain = payload.get("domain", "general")
-        suggestions = {
-            "hospital": "If urgent: use emergency gate or call reception; else book online.",
-            "bank": "Use ATM/online banking or VIP counters where available.",
-            "train": "Check next trains and ask staff for a faster option.",
-            "traffic": "Try alternate routes or call emergency services if needed.",
-        }
-        return jsonify({"ok": True, "type": "advice", "advice": suggestions.get(domain, "Try booking or rescheduling.")})
-    else:
-        return jsonify({"ok": False, "error": "unknown action"}), 400
+CATALOG_CACHE_HEADERS = {"Cache-Control": "no-cache"}  # kiosks keep a copy but revalidate
+
+def catalog_reply(if_none_match):
+    """(body bytes, status, headers) for GET /catalog; 304 with no body when the client's copy is current."""
+    snap = catalog.snapshot
+    headers = dict(CATALOG_CACHE_HEADERS, ETag=snap.etag)
+    if etag_matches(if_none_match, snap.etag):
+        return b"", 304, headers
+    return snap.body, 200, headers
+
+@app.route("/catalog", methods=["GET"])
+def catalog_endpoint():
+    """Versioned domain catalog; send If-None-Match with the last ETag to get a 304."""
+    body, status, headers = catalog_reply(request.headers.get("If-None-Match"))
+    return Response(body, status=status, headers=headers, content_type="application/json")
+
+# Kiosks upload their crowd reports in bulk (see report_ingest.py)
+INGEST_READ_BYTES = 64 * 1024
+
+def ingest_gzip(req):
+    return req.headers.get("Content-Encoding", "").strip().lower() == "gzip"
+
+@app.route("/ingest", methods=["POST"])
+def ingest():
+    """Kiosk crowd reports as NDJSON (gzip allowed), parsed while the body streams in."""
+    if not require_api_key(request):
+        return jsonify({"ok": False, "error": "invalid api key"}), 401
+    rejected = admission_check(request, {"tool": "ingest"})
+    if rejected:
+        return jsonify(rejected[0]), rejected[1], rejected[2]
+    chunks = iter(lambda: request.stream.read(INGEST_READ_BYTES), b"")
+    try:
+        return jsonify(ingest_stream(reports, chunks, gzip=ingest_gzip(request)))
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
 
 LEADER_HTML = """
 <html><head><title>MCP Tool Leaderboard</title></head><body>
 <h2>MCP Usage Leaderboard</h2>
+<p>Window: {{window}} ({% for w in windows %}<a href="?window={{w}}">{{w}}</a> {% endfor %})</p>
 <table border="1" cellpadding="8">
 <tr><th>Tool</th><th>Calls</th></tr>
 {% for t,c in counts.items() %}
@@ -75,19 +435,213 @@ LEADER_HTML = """
 </body></html>
 """
 
+def leaderboard_window(args):
+    window = args.get("window", "all")
+    if window != "all" and window not in WINDOWS:
+        return None
+    return window
+
+def usage_totals(window):
+    """(window totals, latest calls); merged over all workers in multi-worker mode."""
+    if shard is None:
+        return rollup.window(window, time.time()), journal.recent_calls(10)
+    parts = shared.get_all("usage", range(shard.count))
+    parts[shard.index] = usage_summary()
+    totals = {"tools": {}, "actions": {}}
+    for part in parts.values():
+        for kind in ("tools", "actions"):
+            for name, n in part["windows"][window][kind].items():
+                totals[kind][name] = totals[kind].get(name, 0) + n
+    for kind in ("tools", "actions"):
+        totals[kind] = dict(sorted(totals[kind].items(), key=lambda kv: -kv[1]))
+    recent = sorted((c for part in parts.values() for c in part["recent"]), key=lambda c: c["ts"])[-10:]
+    return totals, recent
+
+def leaderboard_context(window):
+    totals, calls = usage_totals(window)
+    counts = totals["tools"]
+    return {"counts": counts, "calls": json.dumps(calls, indent=2), "window": window,
+            "windows": ["all"] + list(WINDOWS)}
+
+def leaderboard_data(window):
+    # e.g. /leaderboard.json?window=1h ; windows: all, 5m, 1h, 24h, 7d, 30d
+    if window is None:
+        return {"ok": False, "error": "unknown window", "windows": ["all"] + list(WINDOWS)}, 400
+    totals, recent = usage_totals(window)
+    return {"ok": True, "window": window, "tools": totals["tools"], "actions": totals["actions"],
+            "recent": recent}, 200
+
 @app.route("/leaderboard", methods=["GET"])
 def leaderboard():
-    usage = load_usage()
-    counts = usage.get("counts", {})
-    calls = usage.get("calls", [])[-10:]
-    return render_template_string(LEADER_HTML, counts=counts, calls=json.dumps(calls, indent=2))
+    window = leaderboard_window(request.args)
+    if window is None:
+        return jsonify({"ok": False, "error": "unknown window"}), 400
+    return render_template_string(LEADER_HTML, **leaderboard_context(window))
+
+@app.route("/leaderboard.json", methods=["GET"])
+def leaderboard_json():
+    body, status = leaderboard_data(leaderboard_window(request.args))
+    return jsonify(body), status
+
+INDEX_INFO = {"service":"mcp-mock","endpoints":["/health","/invoke (api-key protected)","/leaderboard","/leaderboard.json?window=1h","/stream?token=...","/catalog (ETag)","/ingest (api-key protected, gzip NDJSON)","/metrics"]}
 
 @app.route("/", methods=["GET"])
 def index():
-    return jsonify({"service":"mcp-mock","endpoints":["/health","/invoke (api-key protected)","/leaderboard"]})
+    return jsonify(INDEX_INFO)
+
+def create_asgi_app():
+    """
+    Same routes on asyncio (see asgi_server.py). Handlers never touch disk on
+    the event loop: journal appends are handed to a small I/O thread pool.
+    Calls with a CPU-heavy (COMPUTE_ACTIONS) or SQLite-writing (IO_ACTIONS)
+    action run in an executor.
+    """
+    from jinja2 import Environment
+    from urllib.parse import urlencode
+    import asyncio
+    from asgi_server import ASGIApp, Response, StreamingResponse, offload, run_blocking, run_invoke
+
+    template = Environment(autoescape=True).from_string(LEADER_HTML)
+
+    def record_async(calls):
+        offload(journal.record_many, calls)
+
+    async def a_health(req):
+        return {"ok": True, "ts": int(time.time())}, 200
+
+    def local_invoke(data, req):
+        return handle_invoke(data, record=record_async, api_key=req.headers.get("X-API-KEY", ""))
+
+    async def off_loop(data, fn):
+        # report's SQLite commit goes to the I/O pool like journal appends; simulations to the default executor
+        return await run_invoke(data, fn, COMPUTE_ACTIONS, IO_ACTIONS)
+
+    async def a_invoke(req):
+        if not require_api_key(req):
+            return {"ok": False, "error": "invalid api key"}, 401
+        data = req.get_json(silent=True)
+        try:
+            key = idempotency_key(req)
+        except ValueError as e:
+            return {"ok": False, "error": str(e)}, 400
+        if shard and shard.is_forwarded(req):
+            # admitted and routed by the worker that took the request; replays are kept here,
+            # on the owner of the domain, so every worker sees the same first response
+            return (await off_loop(data, lambda: run_idempotent(key, data, lambda: local_invoke(data, req))))[0]
+        t0 = time.perf_counter()
+        if shard:
+            rejected = admission_check(req, data)
+            if rejected:
+                return invoke_reply(data, rejected, False, t0, key)
+
+            async def local(part):
+                return (await off_loop(part, lambda: run_idempotent(key, part, lambda: local_invoke(part, req))))[0]
+            response = await shard.dispatch(data, shard.forward_headers(req), local, MAX_BATCH_ITEMS)
+            return invoke_reply(data, response, False, t0, key)
+        # a duplicate of an off-loop call waits for the first one in the executor, not on the loop
+        response, replayed = await off_loop(
+            data, lambda: run_idempotent(key, data, lambda: admission_check(req, data) or local_invoke(data, req)))
+        return invoke_reply(data, response, replayed, t0, key)
+
+    async def a_leaderboard(req):
+        window = leaderboard_window(req.args)
+        if window is None:
+            return {"ok": False, "error": "unknown window"}, 400
+        # the merged totals read the shared SQLite store: off the loop, like journal appends
+        context = await run_blocking(leaderboard_context, window)
+        return Response(template.render(**context), content_type="text/html; charset=utf-8")
+
+    async def a_leaderboard_json(req):
+        return await run_blocking(leaderboard_data, leaderboard_window(req.args))
+
+    async def a_catalog(req):
+        body, status, headers = catalog_reply(req.headers.get("If-None-Match"))
+        return Response(body, status, headers=headers)
+
+    async def a_ingest(req):
+        if not require_api_key(req):
+            return {"ok": False, "error": "invalid api key"}, 401
+        forwarded = bool(shard) and shard.is_forwarded(req)
+        if not forwarded:
+            rejected = admission_check(req, {"tool": "ingest"})
+            if rejected:
+                return rejected
+        parser = NDJSONReports(gzip=ingest_gzip(req))
+        totals = [0, 0]
+        pending = []
+
+        async def fold(rows):
+            # SQLite runs on the I/O pool; in a cluster each domain's reports go to its owner
+            groups = {}
+            for row in rows:
+                owner = shard.owner(row[2]) if shard and not forwarded else None
+                groups.setdefault(owner, []).append(row)
+            parts = []
+            for owner, part in groups.items():
+                if owner is None or owner == shard.index:
+                    parts.append(run_blocking(reports.ingest, part))
+                else:
+                    parts.append(shard.forward_ingest(owner, part, shard.forward_headers(req)))
+            for stored, dups in await asyncio.gather(*parts):
+                totals[0] += stored
+                totals[1] += dups
+
+        try:
+            async for chunk in req.stream:
+                pending.extend(parser.feed(chunk))
+                while len(pending) >= FOLD_ROWS:
+                    await fold(pending[:FOLD_ROWS])
+                    del pending[:FOLD_ROWS]
+            pending.extend(parser.close())
+            if pending:
+                await fold(pending)
+        except ValueError as e:
+            return {"ok": False, "error": str(e)}, 400
+        except (OSError, asyncio.IncompleteReadError) as e:
+            # stored parts stay stored; the kiosk resends and they count as duplicates
+            return {"ok": False, "error": f"ingest incomplete: {e}"}, 503
+        return ingest_reply(parser, *totals), 200
+
+    async def a_index(req):
+        return INDEX_INFO, 200
+
+    async def a_stream(req):
+        if not (require_api_key(req) or admission.key_config(req.args.get("key", "")) is not None):
+            return {"ok": False, "error": "invalid api key"}, 401
+        owner = shard.owner(str(req.args.get("token", "")).upper()) if shard else None
+        if owner is not None and owner != shard.index:
+            target = "/stream?" + urlencode(dict(req.args, key=req.args.get("key") or req.headers.get("X-API-KEY", "")))
+            return await shard.forward_stream(owner, target, shard.forward_headers(req))
+        sub, err = stream_request(req.args)
+        if err:
+            return err
+        token, domain, since = sub
+        if since is not None or req.args.get("mode") == "poll":
+            return {"ok": True, **(await async_long_poll(hub, domain, token_status, token, since))}, 200
+        return StreamingResponse(async_stream_events(hub, domain, token_status, token))
+
+    return ASGIApp({
+        ("GET", "/health"): a_health,
+        ("POST", "/invoke"): a_invoke,
+        ("GET", "/leaderboard"): a_leaderboard,
+        ("GET", "/leaderboard.json"): a_leaderboard_json,
+        ("GET", "/"): a_index,
+        ("GET", "/stream"): a_stream,
+        ("GET", "/catalog"): a_catalog,
+        ("POST", "/ingest"): a_ingest,
+    }, metrics=metrics, streaming_bodies=[("POST", "/ingest")])
 
 if __name__ == "__main__":
     # Run on 8080 (ngrok friendly). To change API key for demo:
     # Windows (PowerShell): $env:MCP_API_KEY = 'mysecretkey'; python mcp_server.py
+    # Add --asgi to serve the same routes on asyncio (needs uvicorn) instead of Flask.
     print("Using API_KEY:", API_KEY)
-    app.run(host="0.0.0.0", port=8080, debug=True)
+    if "--asgi" in sys.argv:
+        import asgi_server
+        if shard:
+            asgi_server.run(create_asgi_app(), sockets=shard.listen_sockets())
+        else:
+            asgi_server.run(create_asgi_app(), host="0.0.0.0", port=PORT)
+    else:
+        # no reloader: a second process would open the same usage journal
+        app.run(host="0.0.0.0", port=PORT, debug=True, use_reloader=False)
@@ -0,0 +1,225 @@
+import time
+import bisect
+import threading
+
+# Latency buckets in seconds (upper bounds; +Inf is implicit)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+MAX_LABEL_VALUES = 64  # per client-supplied label (tool, action, domain); the rest is "other"
+FOLD_AT = 64  # registered thread shards before exited threads are folded away
+
+
+class Metrics:
+    """
+    Counters and histograms in the Prometheus text format.
+
+    Every thread writes to its own dicts (registered once, on first use), so an
+    observation is a couple of dict operations with no lock and no contention
+    between request threads. /metrics sums the per-thread values when scraped.
+    A thread's dicts are folded into a base total once it has exited (at scrape
+    time, or when registrations pile up), so a thread per request does not
+    grow them without bound. Gauges are callbacks evaluated at scrape time.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._shards = []  # (thread, (counters, hists))
+        self._base = ({}, {})  # totals of threads that have exited
+        self._fold_at = FOLD_AT
+        self._lock = threading.Lock()  # only taken when a new thread registers, and to scrape
+        self._meta = {}  # name -> (type, help)
+        self._gauges = []  # (name, fn returning {labels: value})
+        self._label_values = {}
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = ({}, {})
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+                if len(self._shards) >= self._fold_at:
+                    self._fold_dead()
+        return shard
+
+    def _fold_dead(self):
+        """Merge the shards of exited threads into the base total. Call with the lock held."""
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                _merge(self._base, shard)
+        self._shards = live
+        self._fold_at = max(FOLD_AT, 2 * len(live))
+
+    def describe(self, name, kind, help_text):
+        self._meta[name] = (kind, help_text)
+
+    def bounded(self, label, value):
+        """value, or "other" once label has seen MAX_LABEL_VALUES distinct values."""
+        seen = self._label_values.setdefault(label, set())
+        if value in seen:
+            return value
+        if len(seen) >= MAX_LABEL_VALUES:
+            return "other"
+        seen.add(value)
+        return value
+
+    def inc(self, name, labels=(), n=1):
+        counters = self._shard()[0]
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + n
+
+    def observe(self, name, labels, seconds):
+        hists = self._shard()[1]
+        key = (name, labels)
+        h = hists.get(key)
+        if h is None:
+            h = hists[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        h[bisect.bisect_left(self.buckets, seconds)] += 1
+        h[-1] += seconds
+
+    def gauge(self, name, help_text, fn):
+        """fn() -> {labels tuple: value}, called on every scrape."""
+        self.describe(name, "gauge", help_text)
+        self._gauges.append((name, fn))
+
+    def timer(self, name, labels=()):
+        return _Timer(self, name, labels)
+
+    # ---------------------- exposition ---------------------- #
+    def collect(self):
+        total = ({}, {})
+        with self._lock:
+            self._fold_dead()
+            _merge(total, self._base)
+            shards = [shard for _, shard in self._shards]
+        for shard in shards:
+            _merge(total, shard)
+        return total
+
+    def render(self):
+        counters, hists = self.collect()
+        series = {}
+        for (name, labels), n in counters.items():
+            series.setdefault(name, []).append(f"{name}{_labels(labels)} {n}")
+        for (name, labels), h in hists.items():
+            lines = series.setdefault(name, [])
+            total = 0
+            for bound, n in zip(self.buckets + ("+Inf",), h):
+                total += n
+                lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {total}")
+            lines.append(f"{name}_sum{_labels(labels)} {h[-1]:.6f}")
+            lines.append(f"{name}_count{_labels(labels)} {total}")
+        for name, fn in self._gauges:
+            try:
+                values = fn()
+            except Exception as e:
+                print("metrics gauge failed:", name, e)
+                continue
+            series.setdefault(name, []).extend(f"{name}{_labels(l)} {v}" for l, v in values.items())
+
+        out = []
+        for name in sorted(series):
+            kind, help_text = self._meta.get(name, ("untyped", ""))
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(series[name])
+        return "\n".join(out) + "\n"
+
+
+def _merge(total, shard):
+    counters, hists = total
+    c, h = shard
+    for key, n in c.copy().items():
+        counters[key] = counters.get(key, 0) + n
+    for key, vals in h.copy().items():
+        acc = hists.setdefault(key, [0] * len(vals))
+        for i, v in enumerate(list(vals)):
+            acc[i] += v
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "t0")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, self.labels, time.perf_counter() - self.t0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+# ---------------------- HTTP instrumentation ---------------------- #
+def describe_http(metrics):
+    if "http_requests_in_flight" in metrics._meta:
+        return  # one Metrics can serve both the Flask and the ASGI app
+    metrics.describe("http_requests_total", "counter", "HTTP requests by route, method and status.")
+    metrics.describe("http_request_duration_seconds", "histogram", "HTTP request latency by route.")
+    metrics.describe("http_requests_started_total", "counter", "HTTP requests started, by route.")
+    metrics.gauge("http_requests_in_flight", "HTTP requests being handled, by route.",
+                  lambda: _in_flight(metrics))
+
+
+def _in_flight(metrics):
+    counters, _ = metrics.collect()
+    started = {l: n for (name, l), n in counters.items() if name == "http_requests_started_total"}
+    done = {}
+    for (name, l), n in counters.items():
+        if name == "http_requests_total":
+            key = tuple(kv for kv in l if kv[0] == "route")
+            done[key] = done.get(key, 0) + n
+    return {l: n - done.get(l, 0) for l, n in started.items()}
+
+
+def request_started(metrics, route):
+    metrics.inc("http_requests_started_total", (("route", route),))
+    return time.perf_counter()
+
+
+def request_finished(metrics, route, method, status, t0):
+    metrics.inc("http_requests_total", (("route", route), ("method", method), ("status", str(status))))
+    metrics.observe("http_request_duration_seconds", (("route", route),), time.perf_counter() - t0)
+
+
+def instrument_flask(app, metrics):
+    """Time every request of a Flask app and serve GET /metrics."""
+    from flask import request, g, Response
+
+    describe_http(metrics)
+
+    def route():
+        return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_t0 = request_started(metrics, route())
+
+    @app.after_request
+    def _metrics_finish(response):
+        t0 = g.pop("_metrics_t0", None)
+        if t0 is not None:
+            request_finished(metrics, route(), request.method, response.status_code, t0)
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics_endpoint():
+        return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+    return app
@@ -0,0 +1,331 @@
+import os
+import json
+import time
+import uuid
+import queue
+import heapq
+import random
+import hashlib
+import itertools
+import threading
+
+RETRY_STATUSES = (429, 502, 503, 504)
+_DEFERRED = object()  # invoke() result when the item was parked in the outbox
+
+
+class OfflineError(Exception):
+    """The server could not be reached (connection error, timeout or 5xx after all retries)."""
+
+
+class BadReplyError(Exception):
+    """The server answered, but not with JSON (a proxy error page, say); not retried."""
+
+
+class _Retry(Exception):
+    """Raised by a job to run again in delay seconds, without holding the network thread meanwhile."""
+
+    def __init__(self, delay):
+        Exception.__init__(self, delay)
+        self.delay = delay
+
+
+def _batch_item(entry):
+    """An outbox entry as a batch item, under the Idempotency-Key its first attempt used."""
+    key = entry["headers"].get("Idempotency-Key")
+    return dict(entry["item"], idempotency_key=key) if key else entry["item"]
+
+
+def _json(r):
+    try:
+        return r.json()
+    except ValueError:
+        snippet = (r.text or "")[:80].strip()
+        raise BadReplyError(f"HTTP {r.status_code} from the server is not JSON: {snippet!r}")
+
+
+class NetWorker:
+    """
+    The GUI's single network thread.
+
+    It owns one keep-alive requests.Session, so repeated calls reuse the same
+    TCP/TLS connection instead of a new handshake per click. Jobs go through a
+    bounded queue; a job submitted with the key of one that is still queued or
+    running is coalesced into it (double clicks send one request). Failed
+    calls are retried with exponential backoff and jitter, honouring
+    Retry-After; a job waiting for its retry is parked, so lookups and other
+    jobs run in the meantime. Reservations that still cannot be sent go to an
+    outbox file, with the Idempotency-Key their first attempt used, and are
+    resent in batches, each item under its key, once the server answers again.
+    """
+
+    def __init__(self, outbox_path, queue_size=32, retries=3, backoff=0.5, max_backoff=30.0,
+                 batch_size=20, timeout=8, flush_interval=15):
+        self.outbox_path = outbox_path
+        self.rejected_path = outbox_path + ".rejected"
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.batch_size = batch_size  # below the server's per-tool burst less its emergency reserve
+        self.timeout = timeout
+        self.flush_interval = flush_interval
+        self.on_outbox_result = None  # fn(entry, result) for flushed entries nobody is waiting for
+
+        self._jobs = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._pending = set()  # keys of queued/running jobs
+        self._waiters = {}  # outbox entry id -> (on_done, on_error)
+        self._delayed = []  # heap of (due, seq, job) waiting for a retry
+        self._seq = itertools.count()
+        self._outbox = self._load_outbox()
+        self._next_flush = 0.0
+        self._flush_failures = 0
+        self._session = None
+        self._thread = None
+
+    # ---------------------- outbox file ---------------------- #
+    def _load_outbox(self):
+        entries = []
+        try:
+            with open(self.outbox_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except OSError:
+            pass
+        return entries
+
+    def _save_outbox(self):
+        tmp = self.outbox_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for e in self._outbox:
+                f.write(json.dumps(e) + "\n")
+        os.replace(tmp, self.outbox_path)
+
+    def outbox_size(self):
+        return len(self._outbox)
+
+    # ---------------------- submitting ---------------------- #
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="gui-net", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, fn, on_done=None, on_error=None, key=None):
+        """
+        Queue fn(session) -> result. Returns "queued", "coalesced" (same key
+        already pending; callbacks are dropped) or "full".
+        """
+        with self._lock:
+            if key is not None and key in self._pending:
+                return "coalesced"
+            try:
+                self._jobs.put_nowait((key, fn, on_done, on_error))
+            except queue.Full:
+                return "full"
+            if key is not None:
+                self._pending.add(key)
+        return "queued"
+
+    def invoke(self, url, headers, item, on_done=None, on_error=None, key=None, outbox=False, on_offline=None):
+        """
+        POST one /invoke item with retries. With outbox=True an unreachable
+        server does not fail the call: the item is stored, on_offline() is
+        called, and on_done(result) follows when the outbox is flushed.
+        """
+        # every retry of this call carries the same key, so the server runs it once
+        idem_headers = dict(headers, **{"Idempotency-Key": uuid.uuid4().hex})
+        attempts = [0]
+
+        def job(session):
+            try:
+                return self._post(session, url, idem_headers, item, attempts[0])
+            except _Retry:
+                attempts[0] += 1
+                raise
+            except OfflineError:
+                if not outbox:
+                    raise
+                # keep the key: the server may have booked an attempt whose answer was lost
+                entry = {"id": f"{time.time():.6f}-{random.getrandbits(32):08x}", "url": url,
+                         "headers": idem_headers, "item": item, "ts": time.time()}
+                self._outbox.append(entry)
+                self._save_outbox()
+                self._waiters[entry["id"]] = (on_done, on_error)
+                if on_offline:
+                    on_offline()
+                return _DEFERRED
+
+        def done(result):
+            if result is not _DEFERRED and on_done:
+                on_done(result)
+        return self.submit(job, done, on_error, key)
+
+    def lookup(self, url, headers, item, on_result, timeout=1.0):
+        """
+        Quick invoke without retries or outbox, for lookups: on_result(result),
+        or on_result(None) if it fails, runs on the network thread (at once on
+        the caller's thread when the job queue is full).
+        """
+        def job(session):
+            return _json(session.post(url, json=item, headers=headers, timeout=timeout))
+
+        if self.submit(job, on_result, lambda e: on_result(None)) != "queued":
+            on_result(None)
+
+    # ---------------------- worker thread ---------------------- #
+    def _run(self):
+        import requests
+        self._session = requests.Session()
+        while True:
+            job = self._next_job()
+            if job is None:
+                self._flush()
+                continue
+            key, fn, on_done, on_error = job
+            retrying = False
+            try:
+                result = fn(self._session)
+            except _Retry as e:
+                # park it (the key stays pending, so clicks still coalesce) and serve other jobs
+                retrying = True
+                heapq.heappush(self._delayed, (time.time() + e.delay, next(self._seq), job))
+            except Exception as e:
+                if on_error:
+                    on_error(e)
+            else:
+                if on_done:
+                    on_done(result)
+                if result is not _DEFERRED:
+                    self._next_flush = 0.0  # the server answered: flush the outbox right away
+            finally:
+                if not retrying:
+                    with self._lock:
+                        self._pending.discard(key)
+            if self._outbox and time.time() >= self._next_flush:
+                self._flush()
+
+    def _next_job(self):
+        """A parked job whose retry is due, else the next queued one; None when the wait times out."""
+        if self._delayed and self._delayed[0][0] <= time.time():
+            return heapq.heappop(self._delayed)[2]
+        try:
+            return self._jobs.get(timeout=self._idle_wait())
+        except queue.Empty:
+            return None
+
+    def _idle_wait(self):
+        due = [self._next_flush] if self._outbox else []
+        if self._delayed:
+            due.append(self._delayed[0][0])
+        if not due:
+            return self.flush_interval
+        return max(0.05, min(self.flush_interval, min(due) - time.time()))
+
+    def _delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(self.max_backoff, retry_after)
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def _post(self, session, url, headers, body, attempt=0):
+        """
+        One POST, the attempt-th of a job. Raises _Retry (with the backoff to
+        wait) on a connection error, timeout or retryable status while retries
+        remain, then OfflineError; BadReplyError for an answer that is not JSON.
+        """
+        import requests
+        retry_after = None
+        try:
+            r = session.post(url, json=body, headers=headers, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            r = None
+        if r is not None and r.status_code not in RETRY_STATUSES:
+            return _json(r)
+        if r is not None:
+            try:
+                retry_after = float(r.headers.get("Retry-After"))
+            except (TypeError, ValueError):
+                retry_after = None
+        if attempt < self.retries:
+            raise _Retry(self._delay(attempt, retry_after))
+        raise OfflineError(f"no answer from {url} after {self.retries + 1} attempts")
+
+    def _flush(self):
+        """
+        Send outbox entries in batches, grouped by URL and headers; stop at the
+        first batch the server cannot take now. Each entry carries the
+        Idempotency-Key of its first attempt as its item's idempotency_key, so
+        the server answers an entry it already booked with that booking
+        instead of a new one. A batch the server refuses for good (a 4xx, or a
+        single item above the key's quota) is moved to the rejected file and
+        its callers get the error, so it cannot hold up the rest.
+        """
+        if not self._outbox or time.time() < self._next_flush:
+            return
+        groups = {}
+        for e in self._outbox:
+            headers = {k: v for k, v in e["headers"].items() if k != "Idempotency-Key"}
+            groups.setdefault((e["url"], json.dumps(headers, sort_keys=True)), []).append(e)
+        sent = set()
+        try:
+            for (url, headers), entries in groups.items():
+                headers = json.loads(headers)
+                i = 0
+                while i < len(entries):
+                    chunk = entries[i:i + self.batch_size]
+                    # same entries, same key: a batch resent after a lost answer is not booked twice
+                    key = hashlib.sha256("|".join(e["id"] for e in chunk).encode("utf-8")).hexdigest()
+                    r = self._session.post(url, json=[_batch_item(e) for e in chunk], timeout=self.timeout,
+                                           headers=dict(headers, **{"Idempotency-Key": key}))
+                    if r.status_code >= 500 or r.status_code == 429:
+                        raise OfflineError(f"flush got HTTP {r.status_code}")
+                    try:
+                        data = _json(r)
+                    except BadReplyError as e:
+                        if r.status_code < 400:
+                            raise OfflineError(str(e))  # a captive portal's page, say: try again later
+                        data = {"ok": False, "error": str(e)}
+                    if not isinstance(data, dict):
+                        data = {"ok": False, "error": "invalid response"}
+                    if r.status_code == 413 and len(chunk) > 1:
+                        # more than the key's quota admits at once: go on in smaller batches
+                        limit = int(data.get("max_calls") or len(chunk) // 2)
+                        self.batch_size = max(1, min(self.batch_size, limit, len(chunk) - 1))
+                        continue
+                    results = data.get("results")
+                    if r.status_code >= 400:
+                        data, results = dict(data, status=r.status_code), None
+                        self._reject(chunk, data)
+                    for j, e in enumerate(chunk):
+                        res = results[j] if results and j < len(results) else data
+                        sent.add(e["id"])
+                        self._deliver(e, res)
+                    i += len(chunk)
+            self._flush_failures = 0
+        except Exception:
+            self._flush_failures += 1
+            self._next_flush = time.time() + self._delay(min(self._flush_failures, 10))
+        finally:
+            if sent:
+                self._outbox = [e for e in self._outbox if e["id"] not in sent]
+                self._save_outbox()
+
+    def _reject(self, entries, reply):
+        """Keep entries the server refused for good, with its reply, out of the outbox."""
+        print(f"outbox: {len(entries)} reservation(s) rejected:", reply.get("error"))
+        with open(self.rejected_path, "a", encoding="utf-8") as f:
+            for e in entries:
+                f.write(json.dumps(dict(e, reply=reply)) + "\n")
+
+    def _deliver(self, entry, result):
+        on_done, _ = self._waiters.pop(entry["id"], (None, None))
+        try:
+            if on_done:
+                on_done(result)
+            elif self.on_outbox_result:
+                self.on_outbox_result(entry, result)
+        except Exception as e:
+            print("outbox callback failed:", e)
+
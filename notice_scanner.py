@@ -0,0 +1,368 @@
+import os
+import re
+import sys
+import json
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from domain_catalog import read_catalog
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(HERE, "data")
+TEMPLATES_DIR = os.path.join(DATA_DIR, "templates")
+SCAN_CACHE = os.path.join(DATA_DIR, ".scan_cache.json")
+SCAN_CACHE_MAX = 5000  # results kept, least recently used dropped first
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp", ".webp")
+
+WORK_SIDE = 1024  # longest side the classifier works at
+TEMPLATE_SCALES = (0.3, 0.45, 0.6, 0.8, 1.0, 1.3)  # of the template at TEMPLATE_SIDE
+TEMPLATE_SIDE = 512
+MIN_TEMPLATE_SCORE = 0.6  # normalised correlation below this is noise
+KEYWORD_WEIGHT = 1.0
+NAME_WEIGHT = 0.5
+TEMPLATE_WEIGHT = 3.0
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def catalog_keywords(domains):
+    """{domain: [lowercase keywords]}; the domain name itself always counts."""
+    return {d: sorted({d.lower()} | {k.lower() for k in info.get("keywords", [])})
+            for d, info in domains.items()}
+
+
+def templates_signature(templates_dir=TEMPLATES_DIR):
+    sig = []
+    if os.path.isdir(templates_dir):
+        for root, _, files in os.walk(templates_dir):
+            for fname in sorted(files):
+                if fname.lower().endswith(IMAGE_EXTS):
+                    st = os.stat(os.path.join(root, fname))
+                    sig.append((os.path.relpath(os.path.join(root, fname), templates_dir), st.st_mtime_ns, st.st_size))
+    return sorted(sig)
+
+
+def model_version(keywords, templates_dir=TEMPLATES_DIR):
+    """Changes whenever keywords or templates change, so cached results are re-checked."""
+    raw = json.dumps([keywords, templates_signature(templates_dir)], sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+# ---------------------- worker side (runs in the process pool) ---------------------- #
+_templates = {}  # (dir, version) -> {domain: [edge images]}, per worker process
+
+
+def _cv2():
+    try:
+        import cv2
+    except ImportError:
+        raise RuntimeError("notice scanning needs OpenCV: pip install opencv-python")
+    return cv2
+
+
+def load_reduced(path, max_side=WORK_SIDE):
+    """
+    Grayscale image with its longest side <= max_side. JPEGs are decoded at
+    1/2, 1/4 or 1/8 scale directly (libjpeg DCT scaling), which is much
+    faster than decoding full size and shrinking afterwards.
+    """
+    cv2 = _cv2()
+    import numpy as np
+    from PIL import Image
+    with Image.open(path) as im:  # reads only the header
+        longest = max(im.size)
+    flag = cv2.IMREAD_GRAYSCALE
+    for reduced, factor in ((cv2.IMREAD_REDUCED_GRAYSCALE_8, 8), (cv2.IMREAD_REDUCED_GRAYSCALE_4, 4),
+                            (cv2.IMREAD_REDUCED_GRAYSCALE_2, 2)):
+        if longest // factor >= max_side:
+            flag = reduced
+            break
+    data = np.fromfile(path, dtype=np.uint8)  # imread cannot open non-ASCII paths on Windows
+    img = cv2.imdecode(data, flag)
+    if img is None:
+        raise ValueError(f"cannot decode {path}")
+    scale = max_side / max(img.shape)
+    if scale < 1:
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return img
+
+
+def preprocess(gray):
+    """(contrast-normalised gray, binarised text mask) for OCR and matching."""
+    cv2 = _cv2()
+    gray = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+    gray = cv2.GaussianBlur(gray, (3, 3), 0)
+    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 15)
+    return gray, binary
+
+
+def ocr_available():
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+def ocr_text(binary):
+    """Text of the notice via pytesseract, or "" when it (or tesseract) is not installed."""
+    try:
+        import pytesseract
+        return pytesseract.image_to_string(binary)
+    except Exception:
+        return ""
+
+
+def keyword_scores(text, keywords):
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    counts = {}
+    for w in words:
+        counts[w] = counts.get(w, 0) + 1
+    return {d: sum(counts.get(k, 0) for k in kws) for d, kws in keywords.items()}
+
+
+def _load_templates(templates_dir, version):
+    key = (templates_dir, version)
+    if key not in _templates:
+        loaded = {}
+        if os.path.isdir(templates_dir):
+            for domain in sorted(os.listdir(templates_dir)):
+                ddir = os.path.join(templates_dir, domain)
+                if not os.path.isdir(ddir):
+                    continue
+                for fname in sorted(os.listdir(ddir)):
+                    if fname.lower().endswith(IMAGE_EXTS):
+                        img = load_reduced(os.path.join(ddir, fname), max_side=TEMPLATE_SIDE)
+                        loaded.setdefault(domain, []).append(_edges(img))
+        _templates.clear()
+        _templates[key] = loaded
+    return _templates[key]
+
+
+def _edges(gray):
+    """Canny edges, thickened so slightly misaligned strokes still correlate."""
+    cv2 = _cv2()
+    return cv2.dilate(cv2.Canny(gray, 50, 150), cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3)))
+
+
+def template_scores(gray, templates):
+    """Best normalised correlation per domain over a few scales, on edge maps."""
+    cv2 = _cv2()
+    edges = _edges(gray)
+    scores = {}
+    for domain, temps in templates.items():
+        best = 0.0
+        for t in temps:
+            for s in TEMPLATE_SCALES:
+                tt = cv2.resize(t, None, fx=s, fy=s, interpolation=cv2.INTER_AREA) if s != 1.0 else t
+                if tt.shape[0] > edges.shape[0] or tt.shape[1] > edges.shape[1] or min(tt.shape) < 8:
+                    continue
+                _, val, _, _ = cv2.minMaxLoc(cv2.matchTemplate(edges, tt, cv2.TM_CCOEFF_NORMED))
+                best = max(best, val)
+        scores[domain] = round(best, 3)
+    return scores
+
+
+def classify_image(path, keywords, templates_dir=TEMPLATES_DIR, version=None):
+    """
+    Classify one image file. Returns {"domain", "confidence", "scores", "text"};
+    domain is None when nothing matched. Runs in a worker process.
+    """
+    gray, binary = preprocess(load_reduced(path))
+    text = ocr_text(binary)
+    by_text = keyword_scores(text, keywords)
+    by_name = keyword_scores(os.path.splitext(os.path.basename(path))[0].replace("_", " "), keywords)
+    templates = _load_templates(templates_dir, version) if version else {}
+    by_template = template_scores(gray, templates) if templates else {}
+
+    scores = {}
+    for d in keywords:
+        t = by_template.get(d, 0.0)
+        scores[d] = round(KEYWORD_WEIGHT * by_text.get(d, 0) + NAME_WEIGHT * by_name.get(d, 0)
+                          + (TEMPLATE_WEIGHT * t if t >= MIN_TEMPLATE_SCORE else 0.0), 3)
+    total = sum(scores.values())
+    best = max(scores, key=scores.get) if scores else None
+    if not total:
+        return {"domain": None, "confidence": 0.0, "scores": scores, "text": text[:500]}
+    return {"domain": best, "confidence": round(scores[best] / total, 3), "scores": scores, "text": text[:500]}
+
+
+# ---------------------- caller side ---------------------- #
+class ScanCache:
+    """
+    Results by image content hash, kept in a JSON file; entries of an older
+    model version are ignored. At most max_entries are kept, least recently
+    used go first (the file keeps that order).
+    """
+
+    def __init__(self, path=SCAN_CACHE, max_entries=SCAN_CACHE_MAX):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = OrderedDict(json.load(f))
+        except (OSError, ValueError, TypeError):
+            self.entries = OrderedDict()
+        self._trim()
+
+    def _trim(self):
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, digest, version):
+        with self._lock:
+            e = self.entries.get(digest)
+            if not e or e.get("version") != version:
+                return None
+            self.entries.move_to_end(digest)
+            return e["result"]
+
+    def put(self, digest, version, result):
+        with self._lock:
+            self.entries[digest] = {"version": version, "result": result}
+            self.entries.move_to_end(digest)
+            self._trim()
+
+    def save(self):
+        with self._lock:
+            data = json.dumps(self.entries)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, self.path)
+
+
+class NoticeScanner:
+    """
+    Guesses the queue type (domain) of notice photos from the catalog keywords
+    (data/<domain>.json "keywords") found in the file name. Two optional extras
+    add evidence from the image itself: OCR text, when pytesseract and the
+    tesseract binary are installed, and template matching, when reference
+    images are placed in data/templates/<domain>/ (none ship with the repo).
+
+    Photos are classified in a process pool (created on first use), with a
+    content-hash result cache in front of it. scan() returns a Future, so a
+    GUI can hand the result back to its own thread when it is ready.
+    """
+
+    def __init__(self, data_dir=DATA_DIR, templates_dir=TEMPLATES_DIR, cache_path=SCAN_CACHE, workers=None):
+        self.data_dir = data_dir
+        self.templates_dir = templates_dir
+        self.workers = workers
+        self.cache = ScanCache(cache_path)
+        self._pool = None
+        self.refresh_model()
+
+    def refresh_model(self, domains=None):
+        """Reload keywords (e.g. after a catalog update) and the templates version."""
+        self.keywords = catalog_keywords(domains if domains is not None else read_catalog(self.data_dir))
+        self.version = model_version(self.keywords, self.templates_dir)
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _finish(self, digest, path, fut):
+        result = dict(fut.result(), path=path, hash=digest, cached=False)
+        self.cache.put(digest, self.version, result)
+        return result
+
+    def scan(self, path):
+        """Future of the classification of one file (already resolved on a cache hit)."""
+        from concurrent.futures import Future
+        digest = file_hash(path)
+        hit = self.cache.get(digest, self.version)
+        if hit is not None:
+            done = Future()
+            done.set_result(dict(hit, path=path, cached=True))
+            return done
+        out = Future()
+        inner = self.pool.submit(classify_image, path, self.keywords, self.templates_dir, self.version)
+
+        def relay(f):
+            try:
+                out.set_result(self._finish(digest, path, f))
+            except Exception as e:
+                out.set_exception(e)
+        inner.add_done_callback(relay)
+        return out
+
+    def scan_many(self, paths):
+        """Classify many files; yields results in input order. Cache hits skip the pool."""
+        futures = [self.scan(p) for p in paths]
+        for p, fut in zip(paths, futures):
+            try:
+                yield fut.result()
+            except Exception as e:
+                yield {"path": p, "domain": None, "error": str(e)}
+        self.cache.save()
+
+    def close(self):
+        self.cache.save()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def preview_image(path, max_w, max_h):
+    """
+    PIL image for a preview of at most max_w x max_h. JPEGs are decoded in
+    draft mode (at 1/2..1/8 scale) so multi-megapixel photos load quickly.
+    """
+    from PIL import Image
+    img = Image.open(path)
+    img.draft("RGB", (max_w, max_h))
+    img = img.convert("RGB")
+    img.thumbnail((max_w, max_h), Image.BILINEAR, reducing_gap=2.0)
+    return img
+
+
+def image_files(directory):
+    return [os.path.join(directory, f) for f in sorted(os.listdir(directory)) if f.lower().endswith(IMAGE_EXTS)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify notice photos by queue type (file name keywords, "
+                                                 "plus OCR and data/templates/ when available).")
+    parser.add_argument("directory", help="folder with .png/.jpg notice photos")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--json", dest="json_out", default=None, help="also write all results to this file")
+    args = parser.parse_args(argv)
+
+    paths = image_files(args.directory)
+    if not ocr_available():
+        print("OCR unavailable (pip install pytesseract, plus the tesseract binary): matching file names only",
+              file=sys.stderr)
+    scanner = NoticeScanner(workers=args.workers)
+    results = []
+    try:
+        for res in scanner.scan_many(paths):
+            results.append(res)
+            if res.get("error"):
+                print(f"{res['path']}\tERROR\t{res['error']}")
+            else:
+                note = "\t(cached)" if res.get("cached") else ""
+                print(f"{res['path']}\t{res['domain'] or '-'}\t{res['confidence']:.2f}{note}")
+    finally:
+        scanner.close()
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
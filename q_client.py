@@ -1,18 +1,32 @@
+import os
 import sys
-import requests
 import json
+import uuid
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+RESERVE_TIMEOUT = 8  # seconds per attempt; retries reuse the Idempotency-Key
+RESERVE_ATTEMPTS = 3
 
-def check_invoke_endpoint(base_url):
+# discovered /invoke URL per server base URL, so bulk runs skip the OPTIONS probes
+ENDPOINT_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".q_client_endpoints.json")
+
+def check_invoke_endpoint(base_url, session=None):
     """
     Check if the server accepts requests at /invoke or /invoke/ endpoint.
     Returns the corrected URL or raises an exception.
     """
     possible_urls = [base_url.rstrip('/') + '/invoke', base_url.rstrip('/') + '/invoke/']
+    http = session or requests
 
     for url in possible_urls:
         try:
             # Use OPTIONS to check availability without side effects
-            response = requests.options(url, timeout=3)
+            response = http.options(url, timeout=3)
             if response.status_code < 400:
                 return url
             # Accept 405 Method Not Allowed as endpoint exists but method disallowed
@@ -27,54 +41,266 @@ def check_invoke_endpoint(base_url):
         + "\nPlease check your server URL and endpoint path."
     )
 
-if len(sys.argv) != 5:
-    print("Usage: python q_client.py <server_url> <eta> <api_key> <tool_name>")
-    print("Example: python q_client.py http://localhost:8080/invoke 10 testkey123 my_tool")
-    sys.exit(1)
-
-server_url = sys.argv[1]
-eta = sys.argv[2]
-api_key = sys.argv[3]
-tool_name = sys.argv[4]
-
-try:
-    invoke_url = check_invoke_endpoint(server_url)
-    print(f"[DEBUG] Using invoke endpoint URL: {invoke_url}")
-except RuntimeError as e:
-    print("ERROR:", e)
-    sys.exit(1)
-
-payload = {
-    "tool": tool_name,
-    "action": "reserve",
-    "payload": {
-        "eta_min": eta
+def send_batch(invoke_url, api_key, items, timeout=15):
+    """
+    Send several {tool, action, payload} items in one POST (batch envelope).
+    Returns the per-item results in the same order; each has "ok" and "status".
+    """
+    headers = {"X-API-KEY": api_key, "Content-Type": "application/json"}
+    response = requests.post(invoke_url, json={"batch": items}, headers=headers, timeout=timeout)
+    if response.status_code >= 400:
+        raise RuntimeError(f"Server returned HTTP status {response.status_code}. Response:\n{response.text}")
+    return response.json().get("results", [])
+
+def resolve_invoke_endpoint(base_url, session=None, cache_file=ENDPOINT_CACHE_FILE):
+    """check_invoke_endpoint() with the answer remembered in cache_file."""
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    if base_url in cache:
+        return cache[base_url]
+
+    url = check_invoke_endpoint(base_url, session)
+    cache[base_url] = url
+    try:
+        with open(cache_file, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=2)
+    except OSError:
+        pass
+    return url
+
+def make_session(pool_size, api_key):
+    """Keep-alive session whose connection pool fits pool_size concurrent requests."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"X-API-KEY": api_key, "Content-Type": "application/json"})
+    return session
+
+def read_items(stream, tool_name):
+    """
+    Yield (line_no, ref, item) from JSONL. A line with an "action" is sent as-is;
+    any other object is a reservation payload (domain, urgency, ...).
+    ref is the line's "id"/"request_id", echoed back in the output.
+    """
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, ValueError(f"invalid JSON: {e}")
+            continue
+        if not isinstance(obj, dict):
+            yield line_no, None, ValueError("line is not a JSON object")
+            continue
+        ref = obj.get("id", obj.get("request_id"))
+        if "action" in obj:
+            item = {"tool": obj.get("tool", tool_name), "action": obj["action"], "payload": obj.get("payload", {})}
+        else:
+            payload = {k: v for k, v in obj.items() if k not in ("id", "request_id")}
+            item = {"tool": tool_name, "action": "reserve", "payload": payload}
+        yield line_no, ref, item
+
+def bulk_key(run_id, line_no, ref):
+    """Idempotency-Key of one bulk line: the run id plus the line's id (or line number)."""
+    key = f"q_client:{run_id}:" + (f"id:{ref}" if ref is not None else f"line:{line_no}")
+    if len(key) > 255:
+        key = f"q_client:{run_id}:" + hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return key
+
+def run_bulk(invoke_url, session, items, concurrency=8, batch_size=1, out=sys.stdout, timeout=15, run_id=None):
+    """
+    Send items with at most `concurrency` requests in flight and stream one JSONL
+    result per input line to out as soon as it completes. Returns (ok, failed).
+    Every request carries an Idempotency-Key made from run_id (a new one per
+    run unless given) and its lines, so sending a file again with the same
+    run_id does not book its lines twice, while another file reusing the same
+    ids under a new run_id is not mistaken for a resend.
+    """
+    run_id = run_id or uuid.uuid4().hex[:12]
+    slots = threading.BoundedSemaphore(concurrency)
+    out_lock = threading.Lock()
+    tally = {"ok": 0, "failed": 0}
+
+    def emit(line_no, ref, result):
+        rec = {"line": line_no, "result": result}
+        if ref is not None:
+            rec["id"] = ref
+        with out_lock:
+            tally["ok" if result.get("ok") else "failed"] += 1
+            out.write(json.dumps(rec) + "\n")
+            out.flush()
+
+    def send(chunk):
+        try:
+            keys = [bulk_key(run_id, line_no, ref) for line_no, ref, _ in chunk]
+            if len(chunk) == 1:
+                r = session.post(invoke_url, json=chunk[0][2], headers={"Idempotency-Key": keys[0]}, timeout=timeout)
+                results = [dict(r.json(), status=r.status_code)]
+            else:
+                # the same lines in the same chunk get the same key on a resumed run
+                key = f"q_client:{run_id}:batch:" + hashlib.sha256("|".join(keys).encode("utf-8")).hexdigest()
+                r = session.post(invoke_url, json={"batch": [c[2] for c in chunk]}, headers={"Idempotency-Key": key},
+                                 timeout=timeout)
+                if r.status_code == 413:
+                    # larger than the key's quota ever admits: say so rather than a bare HTTP error
+                    results = [dict(r.json(), status=413)] * len(chunk)
+                else:
+                    r.raise_for_status()
+                    results = r.json().get("results", [])
+        except (requests.RequestException, ValueError) as e:
+            results = [{"ok": False, "error": str(e)}] * len(chunk)
+        finally:
+            slots.release()
+        for (line_no, ref, _), result in zip(chunk, results):
+            emit(line_no, ref, result)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        chunk = []
+        for line_no, ref, item in items:
+            if isinstance(item, Exception):
+                emit(line_no, ref, {"ok": False, "error": str(item)})
+                continue
+            chunk.append((line_no, ref, item))
+            if len(chunk) >= batch_size:
+                slots.acquire()  # bounds in-flight requests and memory for huge inputs
+                pool.submit(send, chunk)
+                chunk = []
+        if chunk:
+            slots.acquire()
+            pool.submit(send, chunk)
+    return tally["ok"], tally["failed"]
+
+def bulk_main(argv):
+    ap = argparse.ArgumentParser(prog="q_client.py --bulk",
+                                 description="Send many reservations from JSONL (file or '-' for stdin).")
+    ap.add_argument("--bulk", required=True, metavar="FILE")
+    ap.add_argument("server_url")
+    ap.add_argument("api_key")
+    ap.add_argument("--tool", default="q_client")
+    ap.add_argument("--concurrency", type=int, default=8, help="max requests in flight")
+    ap.add_argument("--batch-size", type=int, default=1, help="items per /invoke request (batch envelope); "
+                    "the server answers 413 above its per-tool quota (40 by default)")
+    ap.add_argument("--timeout", type=float, default=15)
+    ap.add_argument("--resume", metavar="RUN_ID", default=None,
+                    help="run id printed by an earlier run of the same file: lines it booked are not booked again")
+    ap.add_argument("--no-cache", action="store_true", help="re-probe the /invoke endpoint")
+    args = ap.parse_args(argv[1:])
+
+    concurrency = max(1, args.concurrency)
+    session = make_session(concurrency, args.api_key)
+    try:
+        if args.no_cache:
+            invoke_url = check_invoke_endpoint(args.server_url, session)
+        else:
+            invoke_url = resolve_invoke_endpoint(args.server_url, session)
+    except RuntimeError as e:
+        print("ERROR:", e, file=sys.stderr)
+        sys.exit(1)
+
+    run_id = args.resume or uuid.uuid4().hex[:12]
+    print(f"Run id {run_id} (re-send this file with --resume {run_id} to finish it).", file=sys.stderr)
+    stream = sys.stdin if args.bulk == "-" else open(args.bulk, "r", encoding="utf-8")
+    try:
+        ok, failed = run_bulk(invoke_url, session, read_items(stream, args.tool), concurrency,
+                              max(1, args.batch_size), timeout=args.timeout, run_id=run_id)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    print(f"Bulk done: {ok} ok, {failed} failed.", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+def main(argv):
+    if any(a == "--bulk" or a.startswith("--bulk=") for a in argv[1:]):
+        bulk_main(argv)
+        return
+
+    if len(argv) not in (5, 6):
+        print("Usage: python q_client.py <server_url> <eta> <api_key> <tool_name> [group_size]")
+        print("       python q_client.py --bulk <file.jsonl|-> <server_url> <api_key> [--concurrency N] [--batch-size N] [--resume RUN_ID]")
+        print("Example: python q_client.py http://localhost:8080/invoke 10 testkey123 my_tool")
+        print("         python q_client.py http://localhost:8080/invoke 10 testkey123 my_tool 12  (one batch of 12)")
+        sys.exit(1)
+
+    server_url = argv[1]
+    eta = argv[2]
+    api_key = argv[3]
+    tool_name = argv[4]
+    try:
+        group_size = int(argv[5]) if len(argv) == 6 else 1
+    except ValueError:
+        print("ERROR: group_size must be an integer")
+        sys.exit(1)
+
+    try:
+        invoke_url = check_invoke_endpoint(server_url)
+        print(f"[DEBUG] Using invoke endpoint URL: {invoke_url}")
+    except RuntimeError as e:
+        print("ERROR:", e)
+        sys.exit(1)
+
+    payload = {
+        "tool": tool_name,
+        "action": "reserve",
+        "payload": {
+            "eta_min": eta
+        }
     }
-}
-
-headers = {
-    "X-API-KEY": api_key,
-    "Content-Type": "application/json"
-}
-
-print(f"[DEBUG] Sending POST request to: {invoke_url}")
-print(f"[DEBUG] Payload: {json.dumps(payload)}")
-print(f"[DEBUG] Headers: {headers}")
-
-try:
-    response = requests.post(invoke_url, json=payload, headers=headers)
-except requests.RequestException as e:
-    print(f"ERROR: Failed to send POST request: {e}")
-    sys.exit(1)
-
-print(f"[DEBUG] HTTP Status: {response.status_code}")
-print(f"[DEBUG] Response text: {response.text}")
-
-if response.status_code == 404:
-    print("ERROR: 404 Not Found - The server endpoint was not found. Please verify your server URL and endpoint path.")
-    sys.exit(1)
-elif response.status_code >= 400:
-    print(f"ERROR: Server returned HTTP status {response.status_code}. Response:\n{response.text}")
-    sys.exit(1)
-else:
-    print("Request successful.")
+
+    if group_size > 1:
+        # whole group in one round-trip
+        try:
+            results = send_batch(invoke_url, api_key, [payload] * group_size)
+        except (requests.RequestException, RuntimeError, ValueError) as e:
+            print(f"ERROR: Batch request failed: {e}")
+            sys.exit(1)
+        for i, res in enumerate(results, 1):
+            print(f"[{i}] {json.dumps(res)}")
+        failed = sum(1 for res in results if not res.get("ok"))
+        print(f"Batch done: {len(results) - failed} ok, {failed} failed.")
+        sys.exit(1 if failed else 0)
+
+    headers = {
+        "X-API-KEY": api_key,
+        "Content-Type": "application/json",
+        # a retry with the same key gets the first answer (same token), not a second booking
+        "Idempotency-Key": uuid.uuid4().hex,
+    }
+
+    print(f"[DEBUG] Sending POST request to: {invoke_url}")
+    print(f"[DEBUG] Payload: {json.dumps(payload)}")
+    print(f"[DEBUG] Headers: {headers}")
+
+    response = None
+    for attempt in range(RESERVE_ATTEMPTS):
+        try:
+            response = requests.post(invoke_url, json=payload, headers=headers, timeout=RESERVE_TIMEOUT)
+            break
+        except (requests.ConnectionError, requests.Timeout) as e:
+            print(f"[DEBUG] Attempt {attempt + 1} failed: {e}")
+        except requests.RequestException as e:
+            print(f"ERROR: Failed to send POST request: {e}")
+            sys.exit(1)
+    if response is None:
+        print(f"ERROR: No answer after {RESERVE_ATTEMPTS} attempts.")
+        sys.exit(1)
+
+    print(f"[DEBUG] HTTP Status: {response.status_code}")
+    print(f"[DEBUG] Response text: {response.text}")
+
+    if response.status_code == 404:
+        print("ERROR: 404 Not Found - The server endpoint was not found. Please verify your server URL and endpoint path.")
+        sys.exit(1)
+    elif response.status_code >= 400:
+        print(f"ERROR: Server returned HTTP status {response.status_code}. Response:\n{response.text}")
+        sys.exit(1)
+    else:
+        print("Request successful.")
+
+if __name__ == "__main__":
+    main(sys.argv)
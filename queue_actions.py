@@ -0,0 +1,89 @@
+from queue_engine import parse_urgency
+from queue_sim import simulate, parse_mix, DEFAULT_SAMPLES
+
+# CPU-heavy: run in an executor rather than on the event loop in --asgi mode
+COMPUTE_ACTIONS = {"simulate"}
+
+
+class QueueActions:
+    """
+    The /invoke actions on the live queues (reserve, position, status/validate,
+    call_next, estimate, simulate) and the token lookups behind /stream, shared
+    by mcp_server.py and server.py. Arguments are checked with check_args()
+    by the caller.
+    """
+
+    def __init__(self, queues, registry, estimator):
+        self.queues = queues
+        self.registry = registry
+        self.estimator = estimator
+
+    def token_status(self, token):
+        """Registry state of a token plus its live position/ETA while it is waiting."""
+        res = self.registry.status(token)
+        if res["valid"] and res["state"] == "waiting":
+            pos = self.queues.position(token)
+            if pos is not None:
+                res.update(position=pos["position"], eta_min=pos["eta_min"])
+        return res
+
+    def stream_request(self, args):
+        """(token, domain, since) for /stream, or an error (body, status)."""
+        token = str(args.get("token", "")).upper()
+        rec = self.registry.lookup(token)
+        if rec is None:
+            return None, ({"ok": False, "error": "unknown or expired token"}, 404)
+        since = args.get("since")
+        try:
+            since = int(since) if since is not None else None
+        except ValueError:
+            return None, ({"ok": False, "error": "since must be an integer"}, 400)
+        return (token, rec["domain"], since), None
+
+    def handle(self, action, payload):
+        """(response body, http status) of a queue action, or None if action is not one."""
+        if action == "reserve":
+            # eta_min comes from the live queue; a client-sent eta_min is ignored
+            res = self.queues.reserve(payload.get("domain", "general"), payload.get("urgency", 1))
+            return {"ok": True, "type": "reservation", **res}, 200
+        elif action == "position":
+            res = self.queues.position(str(payload.get("token", "")).upper())
+            if res is None:
+                return {"ok": False, "error": "unknown or already served token"}, 404
+            return {"ok": True, "type": "position", **res}, 200
+        elif action in ("status", "validate"):
+            return {"ok": True, "type": "status", **self.token_status(str(payload.get("token", "")).upper())}, 200
+        elif action == "call_next":
+            called = self.queues.call_next(payload.get("domain", "general"), int(payload.get("desk", 1)),
+                                           payload.get("desks"))
+            if called is None:
+                return {"ok": True, "type": "call", "token": None, "waiting": 0}, 200
+            return {"ok": True, "type": "call", **called}, 200
+        elif action == "estimate":
+            try:
+                people = int(payload.get("people", 0))
+                desks = int(payload.get("desks", 1))
+            except (TypeError, ValueError, OverflowError):
+                return {"ok": False, "error": "people and desks must be integers"}, 400
+            if people < 0:
+                return {"ok": False, "error": "people must be >= 0"}, 400
+            est = self.estimator.estimate(payload.get("domain", "general"), people,
+                                          parse_urgency(payload.get("urgency", 1)), desks)
+            return {"ok": True, "type": "estimate", **est}, 200
+        elif action == "simulate":
+            try:
+                people = int(payload.get("people", 0))
+                desks = int(payload.get("desks", 1))
+                samples = int(payload.get("samples", DEFAULT_SAMPLES))
+                arrivals = float(payload.get("arrivals_per_hour", 0) or 0)
+                mix = parse_mix(payload.get("mix"))
+            except (TypeError, ValueError, OverflowError, AttributeError):
+                return {"ok": False, "error": "people, desks, samples, arrivals_per_hour and mix must be numbers"}, 400
+            domain = payload.get("domain", "general")
+            try:
+                res = simulate(people, self.estimator.service_mins(domain), desks,
+                               parse_urgency(payload.get("urgency", 1)), arrivals, mix, samples, payload.get("model"))
+            except ValueError as e:
+                return {"ok": False, "error": str(e)}, 400
+            return {"ok": True, "type": "simulate", "domain": domain, **res}, 200
+        return None
@@ -0,0 +1,274 @@
+import os
+import json
+import math
+import time
+import heapq
+import bisect
+import threading
+import uuid
+from token_registry import CALLED_TTL
+
+# Same urgency factors the GUI offers in QueueIdentifierApp.calculate()
+URGENCY_FACTORS = (1.0, 1.5, 2.0, 3.0)
+DEFAULT_SERVICE_MINS = 3
+MAX_DOMAIN_LENGTH = 64
+
+
+def check_args(payload):
+    """
+    Error message for payload fields the engine cannot take (a domain that is
+    not a string, a non-numeric urgency, non-integer desk/desks), else None.
+    """
+    domain = payload.get("domain", "general")
+    if not isinstance(domain, str) or len(domain) > MAX_DOMAIN_LENGTH:
+        return f"domain must be a string of at most {MAX_DOMAIN_LENGTH} characters"
+    if not isinstance(payload.get("urgency", 1), (int, float, str)):
+        return "urgency must be a number or a label"
+    for field in ("desk", "desks"):
+        value = payload.get(field)
+        if value is None:
+            continue
+        try:
+            int(value)
+        except (TypeError, ValueError):
+            return f"{field} must be an integer"
+        if isinstance(value, float) and not value.is_integer():
+            return f"{field} must be an integer"
+    return None
+
+
+def parse_urgency(value):
+    """Map 1 / 1.5 / "2 - High (must be quick)" / ... to one of URGENCY_FACTORS (default 1.0)."""
+    if isinstance(value, str):
+        value = value.split("-", 1)[0].strip()
+    try:
+        factor = float(value)
+    except (TypeError, ValueError):
+        return 1.0
+    # snap to the nearest known level so heap keys stay in four classes
+    return min(URGENCY_FACTORS, key=lambda f: abs(f - factor))
+
+
+def service_time(value):
+    """avg_service_time_mins as a float; ValueError unless it is a positive, finite number."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 < value < math.inf:
+        raise ValueError(f"avg_service_time_mins must be a positive number, not {value!r}")
+    return float(value)
+
+
+def load_service_times(data_dir):
+    """avg_service_time_mins per domain from data/*.json; invalid values are skipped."""
+    times = {}
+    if os.path.isdir(data_dir):
+        for fname in os.listdir(data_dir):
+            if not fname.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(data_dir, fname), "r", encoding="utf-8") as f:
+                    info = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if isinstance(info, dict) and "avg_service_time_mins" in info:
+                try:
+                    times[fname[:-5]] = service_time(info["avg_service_time_mins"])
+                except ValueError as e:
+                    print(f"{fname}: {e}")
+    return times
+
+
+def default_token():
+    return uuid.uuid4().hex[:8].upper()
+
+
+class DomainQueue:
+    """
+    Priority queue of reservations for one domain.
+
+    The heap is keyed by (-urgency, arrival seq) so more urgent people are called
+    first and ties keep arrival order. Because there are only a few urgency
+    classes and each class is served FIFO, a token's position is
+        (people of its own class ahead of it) + (people waiting in more urgent classes)
+    which needs only per-class issued/served counters: O(1), no heap scan.
+    """
+
+    def __init__(self, domain, service_mins=DEFAULT_SERVICE_MINS, desks=1):
+        self.domain = domain
+        self.service_mins = service_mins
+        self.desks = max(1, int(desks))
+        self.lock = threading.Lock()
+        self._heap = []
+        self._seq = 0
+        n = len(URGENCY_FACTORS)
+        self._issued = [0] * n  # reservations ever enqueued per class
+        self._served = [0] * n  # reservations ever called per class
+        self.entries = {}  # token -> (class index, rank within class, enqueued ts)
+        self.serving = {}  # desk -> token currently at that desk
+        # ranks of cancelled reservations still in the heap, per class (skipped when popped)
+        self._cancelled = [[] for _ in range(n)]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _position(self, cls, rank):
+        ahead = rank - self._served[cls] - bisect.bisect_left(self._cancelled[cls], rank)
+        for c in range(cls + 1, len(URGENCY_FACTORS)):
+            ahead += self._issued[c] - self._served[c] - len(self._cancelled[c])
+        return ahead
+
+    def eta_for(self, position, service_mins=None):
+        # people ahead are spread across all open desks
+        service = self.service_mins if service_mins is None else service_mins
+        return int(math.ceil(position / self.desks * service))
+
+    def enqueue(self, token, factor=1.0, ts=None):
+        """Add a reservation; returns its position (people ahead). O(log n)."""
+        cls = URGENCY_FACTORS.index(parse_urgency(factor))
+        with self.lock:
+            rank = self._issued[cls]
+            self._issued[cls] += 1
+            self._seq += 1
+            heapq.heappush(self._heap, (-cls, self._seq, token))
+            self.entries[token] = (cls, rank, ts if ts is not None else time.time())
+            return self._position(cls, rank)
+
+    def position(self, token):
+        """People ahead of token, or None if it is not waiting. O(1)."""
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry is None:
+                return None
+            return self._position(entry[0], entry[1])
+
+    def cancel(self, token):
+        """Drop a waiting reservation (e.g. its token expired); its heap slot is skipped later. O(log c)."""
+        with self.lock:
+            entry = self.entries.pop(token, None)
+            if entry is None:
+                return False
+            bisect.insort(self._cancelled[entry[0]], entry[1])
+            return True
+
+    def call_next(self, desk=1):
+        """Pop the most urgent, longest-waiting reservation for desk. O(log n)."""
+        with self.lock:
+            while True:
+                if not self._heap:
+                    self.serving.pop(desk, None)
+                    return None
+                neg_cls, _, token = heapq.heappop(self._heap)
+                self._served[-neg_cls] += 1
+                entry = self.entries.pop(token, None)
+                if entry is not None:
+                    break
+                # classes are served in rank order, so this is the lowest cancelled rank
+                self._cancelled[-neg_cls].pop(0)
+            self.serving[desk] = token
+            if len(self.serving) > self.desks:
+                self.desks = len(self.serving)
+            return {"token": token, "urgency": URGENCY_FACTORS[entry[0]], "enqueued_ts": entry[2]}
+
+
+class QueueEngine:
+    """
+    Per-domain queues plus a token -> domain index for lookups by token alone.
+    With an estimator (see wait_estimator.py), ETAs use learned service times
+    and every call_next is reported to it. With a registry (see token_registry.py),
+    tokens are allocated there and marked "called" when their desk calls them,
+    and a waiting token that expires in the registry leaves its queue.
+    on_change(domain) is called after every enqueue/call (see token_stream.py).
+    """
+
+    def __init__(self, service_times=None, token_factory=default_token, estimator=None, registry=None,
+                 on_change=None):
+        self.service_times = service_times or {}
+        self.token_factory = token_factory
+        self.estimator = estimator
+        self.registry = registry
+        self.on_change = on_change
+        self.queues = {}
+        self.token_domain = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.on_expire = self.expire
+
+    def queue(self, domain):
+        q = self.queues.get(domain)
+        if q is None:
+            with self._lock:
+                q = self.queues.get(domain)
+                if q is None:
+                    q = DomainQueue(domain, self.service_times.get(domain, DEFAULT_SERVICE_MINS))
+                    self.queues[domain] = q
+        return q
+
+    def set_service_times(self, service_times):
+        """Swap in new static service times (catalog reload), for existing queues too."""
+        with self._lock:
+            self.service_times = service_times or {}
+            for domain, q in self.queues.items():
+                q.service_mins = self.service_times.get(domain, DEFAULT_SERVICE_MINS)
+
+    def _service_mins(self, domain):
+        if self.estimator is None:
+            return None
+        return self.estimator.service_mins(domain)
+
+    def _new_token(self):
+        while True:
+            token = self.token_factory()
+            if token not in self.token_domain:
+                return token
+
+    def reserve(self, domain, urgency=1.0):
+        q = self.queue(domain)
+        with self._lock:
+            if self.registry is not None:
+                token = self.registry.allocate(domain=domain, urgency=parse_urgency(urgency))
+            else:
+                token = self._new_token()
+            self.token_domain[token] = domain
+        position = q.enqueue(token, urgency)
+        if self.on_change is not None:
+            self.on_change(domain)
+        return {"token": token, "domain": domain, "position": position,
+                "eta_min": q.eta_for(position, self._service_mins(domain)), "urgency": parse_urgency(urgency)}
+
+    def position(self, token):
+        domain = self.token_domain.get(token)
+        if domain is None:
+            return None
+        q = self.queue(domain)
+        position = q.position(token)
+        if position is None:
+            return None
+        return {"token": token, "domain": domain, "position": position,
+                "eta_min": q.eta_for(position, self._service_mins(domain))}
+
+    def expire(self, token, record=None):
+        """Remove a token that is no longer valid from its queue (registry on_expire hook)."""
+        with self._lock:
+            domain = self.token_domain.pop(token, None)
+        if domain is None:
+            return
+        if self.queue(domain).cancel(token) and self.on_change is not None:
+            self.on_change(domain)
+
+    def call_next(self, domain, desk=1, desks=None):
+        q = self.queue(domain)
+        if desks:
+            q.desks = max(1, int(desks))
+        called = q.call_next(desk)
+        if self.estimator is not None:
+            if called is None:
+                self.estimator.observe_idle(domain, desk)
+            else:
+                self.estimator.observe_serve(domain, desk)
+        if called is not None:
+            with self._lock:
+                self.token_domain.pop(called["token"], None)
+            if self.registry is not None:
+                self.registry.update(called["token"], "called", CALLED_TTL, desk=desk)
+            called.update({"domain": domain, "desk": desk, "waiting": len(q)})
+            if self.on_change is not None:
+                self.on_change(domain)
+        return called
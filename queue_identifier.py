@@ -1,34 +1,175 @@
+import time
+_T0 = time.perf_counter()  # for --startup-timing
+
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
-from PIL import Image, ImageTk
-import cv2
 import os
 import json
+import pickle
 import threading
 import random
 import webbrowser
-import time
-import requests
-import subprocess
 import sys
+from report_store import ReportStore
+from forecast import Forecaster
+from report_ingest import ReportUploader
+from venue_index import load_index, describe
+from domain_catalog import catalog_files, read_catalog, advice_for
+from net_worker import NetWorker
+
+# Heavy modules are imported on first use, not at startup:
+#   PIL (map background, notice preview), requests (network calls)
 
 # ---------------------- Project paths & data ---------------------- #
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
-domain_info = {}
-if os.path.isdir(DATA_DIR):
-    for fname in os.listdir(DATA_DIR):
-        if fname.endswith(".json"):
-            key = fname[:-5]
-            with open(os.path.join(DATA_DIR, fname), "r", encoding="utf-8") as f:
-                domain_info[key] = json.load(f)
-else:
-    messagebox.showerror("Error", f"Data directory not found: {DATA_DIR}")
-    raise SystemExit(1)
-
-REPORT_FILE = os.path.join(DATA_DIR, "reports.json")
-if not os.path.exists(REPORT_FILE):
-    with open(REPORT_FILE, "w", encoding="utf-8") as rf:
-        json.dump([], rf)
+REPORT_FILE = os.path.join(DATA_DIR, "reports.json")  # legacy format, migrated into REPORT_DB
+REPORT_DB = os.path.join(DATA_DIR, "reports.db")
+FORECAST_MIN_REPORTS = 10  # fewer reports than this: show a generic tip instead
+# parsed data/*.json, reused while no source file changed
+CATALOG_CACHE = os.path.join(DATA_DIR, ".catalog_cache.pickle")
+# last catalog downloaded from the MCP server's GET /catalog, with its ETag
+CATALOG_REMOTE = os.path.join(DATA_DIR, ".catalog_remote.json")
+CATALOG_REFRESH_MS = 10 * 60 * 1000
+# kiosk id + last report seq the server acknowledged (reports are uploaded to /ingest)
+INGEST_STATE = os.path.join(DATA_DIR, ".ingest_state.json")
+REPORT_UPLOAD_MS = 60 * 1000
+# reservations made while the server was unreachable, sent when it is back (net_worker.py)
+OUTBOX_FILE = os.path.join(DATA_DIR, ".outbox.jsonl")
+# venue registry for "nearest least-crowded" suggestions (venue_index.py)
+VENUES_FILE = os.path.join(DATA_DIR, "venues.csv")
+NEAREST_COUNT = 5
+LOOKUP_TIMEOUT = 1.0  # seconds for quick server lookups (estimate, nearest)
+
+_domain_info = None
+
+def _load_remote_catalog():
+    try:
+        with open(CATALOG_REMOTE, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        return cached if isinstance(cached.get("domains"), dict) else None
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def get_domain_info():
+    """
+    Domain catalog ({domain: {"checklist": [...], "avg_service_time_mins": n, "advice": [...]}}),
+    loaded on first use: the server's copy from CATALOG_REMOTE when there is
+    one, else data/*.json. The parsed local files are cached in CATALOG_CACHE
+    and reused as long as they are unchanged.
+    """
+    global _domain_info
+    if _domain_info is not None:
+        return _domain_info
+    remote = _load_remote_catalog()
+    if remote is not None:
+        _domain_info = remote["domains"]
+        return _domain_info
+    if not os.path.isdir(DATA_DIR):
+        _domain_info = {}
+        return _domain_info
+
+    sig = catalog_files(DATA_DIR)
+    try:
+        with open(CATALOG_CACHE, "rb") as f:
+            cached = pickle.load(f)
+        if cached.get("sig") == sig:
+            _domain_info = cached["domains"]
+            return _domain_info
+    except Exception:
+        pass
+
+    domains = read_catalog(DATA_DIR, sig)
+    try:
+        with open(CATALOG_CACHE, "wb") as f:
+            pickle.dump({"sig": sig, "domains": domains}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        pass
+    _domain_info = domains
+    return _domain_info
+
+def refresh_catalog(base_url, session=None):
+    """
+    Conditional GET of the server's catalog (If-None-Match with the cached
+    ETag). A 304 costs no download; a 200 replaces CATALOG_REMOTE and the
+    in-memory catalog. Returns True when the catalog changed.
+    """
+    global _domain_info
+    import requests
+    http = session or requests
+    cached = _load_remote_catalog() or {}
+    headers = {"If-None-Match": cached["etag"]} if cached.get("etag") else {}
+    r = http.get(base_url.rstrip("/") + "/catalog", headers=headers, timeout=3)
+    if r.status_code != 200:
+        return False
+    data = r.json()
+    if not isinstance(data.get("domains"), dict):
+        return False
+    tmp = CATALOG_REMOTE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"etag": r.headers.get("ETag"), "version": data.get("version"), "domains": data["domains"]}, f)
+    os.replace(tmp, CATALOG_REMOTE)
+    _domain_info = data["domains"]
+    return True
+
+class TokenFollower:
+    """
+    Reads the server's /stream (Server-Sent Events) for one token in a daemon
+    thread and calls on_status(dict) for every pushed update, or on_fail() if
+    the stream cannot be read. stop() ends it at once: the open response is
+    closed and neither callback runs afterwards.
+    """
+
+    def __init__(self, base_url, token, api_key, on_status, on_fail, read_timeout=60):
+        self.url = base_url.rstrip("/") + "/stream"
+        self.token = token
+        self.api_key = api_key
+        self.on_status = on_status
+        self.on_fail = on_fail
+        self.read_timeout = read_timeout
+        self.stopped = threading.Event()
+        self._response = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._run, name=f"follow-{self.token}", daemon=True).start()
+        return self
+
+    def stop(self, *_):
+        self.stopped.set()
+        with self._lock:
+            r, self._response = self._response, None
+        if r is not None:
+            r.close()  # wakes the reader blocked in iter_lines
+
+    def _run(self):
+        r = None
+        try:
+            import requests
+            r = requests.get(self.url, params={"token": self.token}, headers={"X-API-KEY": self.api_key or ""},
+                             stream=True, timeout=(5, self.read_timeout))
+            with self._lock:
+                if not self.stopped.is_set():
+                    self._response = r
+            if self.stopped.is_set():
+                return
+            r.raise_for_status()
+            for line in r.iter_lines(decode_unicode=True):
+                if self.stopped.is_set():
+                    return
+                if not line or not line.startswith("data:"):
+                    continue
+                st = json.loads(line[5:])
+                self.on_status(st)
+                if st.get("state") != "waiting":
+                    break
+        except Exception:
+            if not self.stopped.is_set():
+                self.on_fail()
+        finally:
+            with self._lock:
+                self._response = None
+            if r is not None:
+                r.close()
 
 # Defaults
 DEFAULT_SERVER_URL = "http://127.0.0.1:8080"
@@ -37,18 +178,14 @@ DEFAULT_API_KEY = "supersecret123"
 DEFAULT_TOOL_NAME = "my_tool"
 DEFAULT_ACTION = "reserve"
 
-# Try to read from command line, else use defaults
-server_url = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SERVER_URL
-eta = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_ETA
-api_key = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_API_KEY
-tool_name = sys.argv[4] if len(sys.argv) > 4 else DEFAULT_TOOL_NAME
-action = sys.argv[5] if len(sys.argv) > 5 else DEFAULT_ACTION
-
-# Call q_client.py with all arguments
-subprocess.run([
-    sys.executable, "q_client.py",
-    server_url, eta, api_key, tool_name
-])
+# Try to read from command line, else use defaults (flags like --startup-timing are skipped)
+STARTUP_TIMING = "--startup-timing" in sys.argv
+_args = [a for a in sys.argv[1:] if not a.startswith("--")]
+server_url = _args[0] if len(_args) > 0 else DEFAULT_SERVER_URL
+eta = _args[1] if len(_args) > 1 else DEFAULT_ETA
+api_key = _args[2] if len(_args) > 2 else DEFAULT_API_KEY
+tool_name = _args[3] if len(_args) > 3 else DEFAULT_TOOL_NAME
+action = _args[4] if len(_args) > 4 else DEFAULT_ACTION
 
 # simple config to remember last used MCP URL + API key
 CONFIG_FILE = os.path.join(os.path.dirname(__file__), "mcp_config.json")
@@ -85,18 +222,73 @@ class QueueIdentifierApp(tk.Tk):
         self.detected_var = tk.StringVar()
         self.people_var = tk.StringVar()
         self.urgency_combobox = None
+        self._scanner = None  # notice classifier, see notice_scanner()
+        self._venues = None  # venue index, loaded on first use (see venue_index())
+        # all HTTP calls except token streams go through one keep-alive worker thread
+        self.net = NetWorker(OUTBOX_FILE).start()
+        self.net.on_outbox_result = lambda entry, data: self.after(
+            0, lambda: self.on_reservation(data, entry["url"], entry["headers"].get("X-API-KEY", "")))
 
-        # load reports safely
-        try:
-            with open(REPORT_FILE, "r", encoding="utf-8") as rf:
-                self.reports = json.load(rf)
-        except Exception:
-            self.reports = []
+        self.timings = {"imports": time.perf_counter() - _T0}
+
+        # crowd reports (SQLite + in-memory per-domain aggregates, see report_store.py)
+        self.reports = ReportStore(REPORT_DB, legacy_file=REPORT_FILE)
+        self.forecaster = Forecaster(self.reports)  # least busy hours from those reports
+        self.uploader = ReportUploader(self.reports, INGEST_STATE)  # ships them to the server in batches
 
         # build UI
         self.build_ui()
-        # schedule heatmap updates
-        self.after(2500, self.update_heatmap)
+        self.timings["window_built"] = time.perf_counter() - _T0
+        # heatmap redraws on change only (new report / other domain), no polling
+        self.heatmap = None
+        self.domain_var.trace_add("write", self.update_heatmap)
+        self.after(200, self.update_heatmap)
+        # once the window is on screen: timing report + server check in the background
+        self.after_idle(self.on_first_idle)
+
+    def on_first_idle(self):
+        self.timings["first_idle"] = time.perf_counter() - _T0
+        if STARTUP_TIMING:
+            print("[startup] " + ", ".join(f"{k}={v * 1000:.1f}ms" for k, v in self.timings.items()))
+        self.net.submit(self.check_server)
+        self.schedule_catalog_refresh()
+        self.schedule_report_upload()
+
+    def mcp_base_url(self):
+        base = (config.get("mcp_url") or "").rstrip("/")
+        return base[:-len("/invoke")] if base.endswith("/invoke") else base
+
+    def schedule_catalog_refresh(self):
+        """Revalidate the catalog with the MCP server now and every CATALOG_REFRESH_MS."""
+        base = self.mcp_base_url()
+        if base:
+            # on failure the cached or local catalog stays in use
+            self.net.submit(lambda session: refresh_catalog(base, session), key=("catalog", base))
+        self.after(CATALOG_REFRESH_MS, self.schedule_catalog_refresh)
+
+    def upload_reports(self):
+        """Send reports the server has not acknowledged yet (on the network worker; one job at a time)."""
+        base = self.mcp_base_url()
+        if base and self.uploader.has_pending():
+            self.net.submit(lambda session: self.uploader.upload(session, base, config.get("api_key") or ""),
+                            key=("ingest", base))
+
+    def schedule_report_upload(self):
+        self.upload_reports()
+        self.after(REPORT_UPLOAD_MS, self.schedule_report_upload)
+
+    def check_server(self, session=None):
+        """Connectivity check (q_client's /invoke probe), run on the network worker."""
+        t0 = time.perf_counter()
+        try:
+            from q_client import check_invoke_endpoint
+            url = check_invoke_endpoint(server_url, session)
+            status = f"Server: online ({url})"
+        except Exception:
+            status = f"Server: offline ({server_url})"
+        if STARTUP_TIMING:
+            print(f"[startup] server_check={(time.perf_counter() - t0) * 1000:.1f}ms")
+        self.after(0, lambda: self.server_status.set(status))
 
     def build_ui(self):
         pad = {"padx": 10, "pady": 6}
@@ -114,8 +306,10 @@ class QueueIdentifierApp(tk.Tk):
         frm.pack(fill="x", **pad)
 
         ttk.Label(frm, text="1. Select or Scan Queue Type:").grid(row=0, column=0, sticky="w")
+        # values are filled on first open so the catalog is not parsed at startup
         self.combo = ttk.Combobox(
-            frm, values=list(domain_info.keys()), textvariable=self.domain_var, state="readonly"
+            frm, textvariable=self.domain_var, state="readonly",
+            postcommand=lambda: self.combo.configure(values=list(get_domain_info().keys())),
         )
         self.combo.grid(row=1, column=0, sticky="we", **pad)
         ttk.Button(frm, text="🔍 Scan Notice", command=self.scan_image).grid(row=1, column=1, **pad)
@@ -163,12 +357,15 @@ class QueueIdentifierApp(tk.Tk):
 
         footer = tk.Label(self, text="Powered by Generative AI ✨", bg="#f2f4f8", fg="#6c757d", font=("Arial", 9))
         footer.pack(pady=(6, 4))
+        self.server_status = tk.StringVar(value="Server: checking...")
+        tk.Label(self, textvariable=self.server_status, bg="#f2f4f8", fg="#6c757d", font=("Arial", 8)).pack()
 
         # Heatmap canvas (small preview)
         self.canvas = tk.Canvas(self, width=200, height=180, bg="#e0e0e0")
         self.canvas.pack(pady=(6, 12))
         map_img = os.path.join(os.path.dirname(__file__), "india_map.png")
         if os.path.exists(map_img):
+            from PIL import Image, ImageTk
             bg = Image.open(map_img).resize((200, 180), Image.LANCZOS).convert("RGBA")
             bg.putalpha(80)
             self.map_bg = ImageTk.PhotoImage(bg)
@@ -184,36 +381,25 @@ class QueueIdentifierApp(tk.Tk):
 
     def scan_image(self):
         """
-        Manual preview & selection flow (no OCR message shown).
-        Shows the notice preview and clear instructions for judges/users.
-        Includes a 'View Full Size' button to inspect the original image externally.
+        Preview a notice photo and classify it (notice_scanner.py). Decoding and
+        classification run off the UI thread; the window opens at once and the
+        preview and the detected category fill in when they are ready. The
+        category buttons and manual input stay available as a fallback.
         """
         filename = filedialog.askopenfilename(title="Select notice image", filetypes=[("Image Files", "*.png;*.jpg;*.jpeg")])
         if not filename:
             return
 
-        try:
-            img = Image.open(filename)
-        except Exception:
-            messagebox.showerror("Error", "Failed to open image.")
-            return
-
         win = tk.Toplevel(self)
         win.title("Preview & Select Category")
-        win.geometry("520x460")
+        win.geometry("520x480")
         win.transient(self)
 
         max_w, max_h = 480, 320
-        iw, ih = img.size
-        scale = min(max_w / iw, max_h / ih, 1.0)
-        preview = img.resize((int(iw * scale), int(ih * scale)), Image.LANCZOS)
-        preview_tk = ImageTk.PhotoImage(preview)
-        lbl = tk.Label(win, image=preview_tk)
-        lbl.image = preview_tk
+        lbl = tk.Label(win, text="Loading preview...", width=60, height=14)
         lbl.pack(pady=(8, 4))
 
-        # neutral, confident instruction (no mention of OCR)
-        note = tk.Label(win, text="Preview the notice below and choose the category that best matches it.", fg="#333")
+        note = tk.Label(win, text="Detecting category...", fg="#333")
         note.pack()
 
         # small helper frame for action buttons (view full size + manual input)
@@ -252,13 +438,126 @@ class QueueIdentifierApp(tk.Tk):
             self.domain_var.set(d)
             win.destroy()
 
-        domains = list(domain_info.keys())
+        domains = list(get_domain_info().keys())
         for i, d in enumerate(domains):
             b = ttk.Button(btn_frame, text=d.capitalize(), command=lambda dd=d: choose_domain(dd))
             b.grid(row=i // 3, column=i % 3, padx=6, pady=6, sticky="we")
 
         ttk.Button(win, text="Cancel", command=win.destroy).pack(pady=(0, 8))
 
+        def show_preview(img):
+            if not win.winfo_exists():
+                return
+            if img is None:
+                lbl.configure(text="Failed to open image.")
+                return
+            from PIL import ImageTk
+            preview_tk = ImageTk.PhotoImage(img)
+            lbl.configure(image=preview_tk, text="", width=0, height=0)
+            lbl.image = preview_tk
+
+        def show_result(res):
+            if not win.winfo_exists():
+                return
+            if res is None or not res.get("domain"):
+                note.configure(text="Could not detect the category; choose it below.")
+                return
+            d = res["domain"]
+            note.configure(text=f"Detected: {d} ({res['confidence']:.0%}). Confirm below or pick another.")
+            self.detected_var.set(d)
+
+        def work():
+            from notice_scanner import preview_image
+            try:
+                img = preview_image(filename, max_w, max_h)
+            except Exception:
+                img = None
+            self.after(0, lambda: show_preview(img))
+            try:
+                scanner = self.notice_scanner()
+                res = scanner.scan(filename).result()
+                scanner.cache.save()
+            except Exception as e:
+                print("notice scan failed:", e)
+                res = None
+            self.after(0, lambda: show_result(res))
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def notice_scanner(self):
+        """Process-pool notice classifier, created on the first scan."""
+        if self._scanner is None:
+            from notice_scanner import NoticeScanner
+            scanner = NoticeScanner(workers=2)
+            scanner.refresh_model(get_domain_info())
+            self._scanner = scanner
+        return self._scanner
+
+    def venue_index(self):
+        if self._venues is None:
+            self._venues = load_index(VENUES_FILE)
+        return self._venues
+
+    def user_location(self, ask=False):
+        """(lat, lon) from the config; with ask=True the user is asked when none is stored."""
+        try:
+            lat, lon = (float(x) for x in (config.get("location") or "").split(","))
+            return lat, lon
+        except ValueError:
+            pass
+        if not ask:
+            return None
+        ans = simpledialog.askstring("Your Location", "Enter your location as latitude, longitude "
+                                     "(e.g. 13.0827, 80.2707):")
+        try:
+            lat, lon = (float(x) for x in (ans or "").split(","))
+        except ValueError:
+            return None
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return None
+        config["location"] = f"{lat},{lon}"
+        save_config(config)
+        return lat, lon
+
+    def local_nearest(self, domain, location, count=NEAREST_COUNT):
+        """Nearest venues from the local registry, waits from this kiosk's own reports."""
+        index = self.venue_index()
+        avg = get_domain_info().get(domain, {}).get("avg_service_time_mins", 3)
+        hits = index.nearest(domain, location[0], location[1], count, service_mins=avg,
+                             people=self.forecaster.expected_now(domain))
+        return [describe(h, index) for h in hits]
+
+    def lookup(self, action, payload, on_result):
+        """
+        Quick /invoke lookup on the network worker. on_result(data) runs on the
+        Tk thread with the response, or None when no server is configured or
+        it does not answer within LOOKUP_TIMEOUT; the UI never waits for it.
+        """
+        mcp_url = config.get("mcp_url") or ""
+        if not mcp_url:
+            on_result(None)
+            return
+        invoke_url = mcp_url if mcp_url.endswith("/invoke") else mcp_url.rstrip("/") + "/invoke"
+        headers = {"X-API-KEY": config.get("api_key") or ""}
+
+        def deliver(data):
+            self.after(0, lambda: on_result(data if isinstance(data, dict) and data.get("ok") else None))
+        self.net.lookup(invoke_url, headers, {"tool": "q_intelli", "action": action, "payload": payload},
+                        deliver, timeout=LOOKUP_TIMEOUT)
+
+    def fetch_nearest(self, domain, location, on_result, count=NEAREST_COUNT):
+        """
+        on_result(venues): nearest venues ranked by travel time plus wait
+        (action=nearest), with waits from every kiosk's reports; the local
+        registry when no server is configured or it does not answer quickly.
+        """
+        def done(data):
+            if data and data.get("venues_indexed"):
+                on_result(data["venues"])
+            else:
+                on_result(self.local_nearest(domain, location, count))
+        self.lookup("nearest", {"domain": domain, "lat": location[0], "lon": location[1], "k": count}, done)
+
     def open_map(self):
         domain = self.domain_var.get()
         routes = {
@@ -269,14 +568,42 @@ class QueueIdentifierApp(tk.Tk):
             "restaurant": "https://www.google.com/maps/search/restaurant+open+now",
             "temple": "https://www.google.com/maps/search/temple",
         }
-        webbrowser.open(routes.get(domain, "https://www.google.com/maps"))
+        search_url = routes.get(domain, "https://www.google.com/maps")
+        location = self.user_location(ask=self.venue_index().count(domain) > 0)
+        if not location:
+            webbrowser.open(search_url)
+            return
+        self.fetch_nearest(domain, location, lambda venues: self.show_venues(domain, venues, search_url))
+
+    def show_venues(self, domain, venues, search_url):
+        if not venues:
+            # no registered venues for this queue type: plain map search
+            webbrowser.open(search_url)
+            return
+        popup = tk.Toplevel(self)
+        popup.title("Nearest Least-Crowded")
+        popup.configure(bg="#fffbe7")
+        tk.Label(popup, text=f"Best {domain} options (travel + wait):", bg="#fffbe7",
+                 font=("Arial", 10, "bold")).pack(padx=10, pady=(10, 4), anchor="w")
+        for v in venues:
+            wait = f"~{v['wait_min']:g} min wait" if v["wait_min"] is not None else "wait unknown"
+            url = f"https://www.google.com/maps/search/?api=1&query={v['lat']},{v['lon']}"
+            ttk.Button(popup, text=f"{v['name']} - {v['distance_km']:g} km, {wait}",
+                       command=lambda u=url: webbrowser.open(u)).pack(padx=10, pady=2, fill="x")
+        ttk.Button(popup, text="Search on Google Maps", command=lambda: webbrowser.open(search_url)).pack(pady=(8, 2))
+        ttk.Button(popup, text="Change location", command=lambda: self.change_location(popup)).pack(pady=(0, 10))
+
+    def change_location(self, popup):
+        popup.destroy()
+        config.pop("location", None)
+        self.open_map()
 
     def calculate(self):
         domain = self.domain_var.get().strip()
         if not domain:
             messagebox.showwarning("Warning", "Please select or scan a queue type.")
             return
-        info = domain_info.get(domain, {})
+        info = get_domain_info().get(domain, {})
         if not info:
             if not messagebox.askyesno("No data", f"No stored data for '{domain}'. Continue with default values?"):
                 return
@@ -284,6 +611,8 @@ class QueueIdentifierApp(tk.Tk):
         try:
             people = int(self.people_var.get() or 0)
         except ValueError:
+            people = -1
+        if people < 0:
             messagebox.showwarning("Warning", "Please enter a valid integer for people ahead.")
             return
 
@@ -306,31 +635,15 @@ class QueueIdentifierApp(tk.Tk):
         wait = round(people * avg * factor)
 
         # save a report record (crowd-sourced offline)
-        report = {"domain": domain, "people": people, "hour": time.localtime().tm_hour}
-        self.reports.append(report)
         try:
-            with open(REPORT_FILE, "w", encoding="utf-8") as rf:
-                json.dump(self.reports, rf, ensure_ascii=False, indent=2)
+            self.reports.add(domain, people)
+            self.upload_reports()
         except Exception:
             pass
 
         checklist = info.get("checklist", [])
-        adv = []
-        if domain == "bank":
-            adv.append("💳 Try using ATM or online services for quicker resolution.")
-        elif domain == "train":
-            adv.append("🚉 Check IRCTC or staff for fast-track options.")
-        elif domain == "hospital":
-            adv.append("🏥 If critical use emergency gate or notify staff.")
-        elif domain == "restaurant":
-            adv.append("🍽️ Ask for takeaway or reservation slots.")
-        elif domain == "temple":
-            adv.append("🛕 Check for VIP/darshan passes.")
-        elif domain == "traffic":
-            if people > 50:
-                adv.append("🚗 Try alternate route or public transport.")
-            else:
-                adv.append("🟢 Situation seems manageable.")
+        # per-domain advice comes from the catalog (data/<domain>.json)
+        adv = advice_for(info, people) if info else []
 
         if people < 5:
             adv.append("✅ Few people ahead; it's fine to wait.")
@@ -344,24 +657,54 @@ class QueueIdentifierApp(tk.Tk):
                 "Prompt AI: 'What time is least busy for this location?'",
             ]
         )
+        fc = self.forecaster.forecast(domain)
+        if fc["reports"] >= FORECAST_MIN_REPORTS and fc["best"]:
+            best = fc["best"][0]
+            gen_ai_tip = (f"Least busy in the next 24 h: {best['day']} {best['hour']:02d}:00 "
+                          f"(~{best['expected_people']:g} people, from {fc['reports']} reports)")
+
+        location = self.user_location()
+        if location:
+            nearby = self.local_nearest(domain, location, 1)
+            if nearby:
+                v = nearby[0]
+                wait_txt = f", ~{v['wait_min']:g} min wait" if v["wait_min"] is not None else ""
+                adv.append(f"📍 Best nearby: {v['name']} ({v['distance_km']:g} km{wait_txt})")
 
         popup = tk.Toplevel(self)
         popup.title("Your Fast Plan")
         popup.geometry("420x300")
         popup.configure(bg="#fffbe7")
-        txt = (
-            f"Queue: {domain}\n"
-            f"Wait: {wait} mins\n\n"
-            f"Checklist:\n" + ("\n".join(f"- {c}" for c in checklist) if checklist else "- (no checklist)") + "\n\n"
-            f"Advice:\n" + ("\n".join(adv) if adv else "- (no advice)") + "\n\n"
-            f"Tip: {gen_ai_tip}"
-        )
-        tk.Label(popup, text=txt, justify="left", bg="#fffbe7").pack(padx=10, pady=10, fill="both", expand=True)
-        ttk.Button(popup, text="Copy", command=lambda: self.clip_copy(txt)).pack(pady=(0, 10))
+
+        def plan(wait, wait_note=""):
+            return (
+                f"Queue: {domain}\n"
+                f"Wait: {wait} mins{wait_note}\n\n"
+                f"Checklist:\n" + ("\n".join(f"- {c}" for c in checklist) if checklist else "- (no checklist)") + "\n\n"
+                f"Advice:\n" + ("\n".join(adv) if adv else "- (no advice)") + "\n\n"
+                f"Tip: {gen_ai_tip}"
+            )
+        txt = tk.StringVar(popup, value=plan(wait))
+        tk.Label(popup, textvariable=txt, justify="left", bg="#fffbe7").pack(padx=10, pady=10, fill="both", expand=True)
+        ttk.Button(popup, text="Copy", command=lambda: self.clip_copy(txt.get())).pack(pady=(0, 10))
+
+        def apply_estimate(est):
+            # the popup shows the catalog figure at once; a learned estimate replaces it when it arrives
+            if est is not None and popup.winfo_exists():
+                txt.set(plan(est.get("wait_min", wait), f" ({est.get('source', 'server')} estimate)"))
+        self.fetch_estimate(domain, people, factor, apply_estimate)
 
         # trigger an immediate mini heatmap update
         self.update_heatmap()
 
+    def fetch_estimate(self, domain, people, factor, on_result):
+        """
+        Ask the MCP server for a learned wait estimate (action=estimate).
+        on_result(None) when no server is configured or it does not answer
+        quickly, so calculate() keeps the static data/*.json numbers.
+        """
+        self.lookup("estimate", {"domain": domain, "people": people, "urgency": factor}, on_result)
+
     def clip_copy(self, txt):
         self.clipboard_clear()
         self.clipboard_append(txt)
@@ -371,7 +714,7 @@ class QueueIdentifierApp(tk.Tk):
         """
         Networked reservation: calls MCP server /invoke?action=reserve
         Prompts for MCP URL and API key (saves them to mcp_config.json for reuse).
-        Runs request in a background thread to avoid blocking UI.
+        The request runs on the network worker (keep-alive, retries, offline outbox).
         """
         # get last config
         mcp_url = config.get("mcp_url") or ""
@@ -391,11 +734,10 @@ class QueueIdentifierApp(tk.Tk):
         config["api_key"] = api_key or ""
         save_config(config)
 
-        try:
-            eta_input = simpledialog.askstring("ETA (min)", "Enter desired ETA in minutes (or blank for default 15):")
-            eta = int(eta_input) if eta_input and eta_input.strip() else 15
-        except Exception:
-            eta = 15
+        # the server computes the ETA from its live queue for this domain/urgency
+        eta = 15
+        domain = self.domain_var.get().strip() or "general"
+        urgency = (self.urgency_combobox.get() or "1").strip()
 
         # Fix here to avoid double /invoke
         if mcp_url.endswith("/invoke"):
@@ -403,72 +745,112 @@ class QueueIdentifierApp(tk.Tk):
         else:
             invoke_url = mcp_url.rstrip("/") + "/invoke"
 
-        payload = {"tool": "q_intelli", "action": "reserve", "payload": {"eta_min": eta}}
+        payload = {"tool": "q_intelli", "action": "reserve", "payload": {"domain": domain, "urgency": urgency}}
+        headers = {"X-API-KEY": api_key} if api_key else {}
 
-        def worker():
-            headers = {}
-            if api_key:
-                headers["X-API-KEY"] = api_key
-            try:
-                print(f"[DEBUG] Sending POST to: {invoke_url}")
-                print(f"[DEBUG] Payload: {payload}")
-                print(f"[DEBUG] Headers: {headers}")
-                r = requests.post(invoke_url, json=payload, headers=headers, timeout=8)
-                r.raise_for_status()
-                data = r.json()
+        def done(data):
+            self.after(0, lambda: self.on_reservation(data, invoke_url, api_key, eta))
 
-                print("Worker thread response:", data)
+        def failed(err):
+            self.after(0, lambda: messagebox.showerror("Network Error", f"Request failed: {err}"))
 
-            except Exception as e:
-                self.after(0, lambda err=e: messagebox.showerror("Network Error", f"Request failed: {err}"))
+        def offline():
+            self.after(0, lambda: self.server_status.set(
+                f"Server: offline, {self.net.outbox_size()} reservation(s) will be sent when it is back"))
+
+        # a second click for the same domain/urgency while this one is pending is ignored
+        state = self.net.invoke(invoke_url, headers, payload, done, failed,
+                                key=("reserve", invoke_url, domain, urgency), outbox=True, on_offline=offline)
+        if state == "full":
+            messagebox.showwarning("Busy", "Too many requests are waiting; please try again shortly.")
+
+    def on_reservation(self, data, invoke_url, api_key, eta=15):
+        """Show the token window for a reservation answer (live or flushed from the outbox)."""
+        if not isinstance(data, dict) or not (data.get("ok") and data.get("type") == "reservation"):
+            err = data.get("error", "unknown error") if isinstance(data, dict) else "invalid response"
+            messagebox.showerror("MCP Error", str(err))
+            return
+        token = data.get("token")
+        eta_min = data.get("eta_min", eta)
+
+        win = tk.Toplevel(self)
+        win.title("Virtual Token")
+        win.geometry("340x180")
+        tk.Label(win, text=f"Your token: {token}", font=("Helvetica", 14, "bold")).pack(pady=(12,6))
+        ahead = tk.Label(win, text="", font=("Arial", 11))
+        ahead.pack()
+        if data.get("position") is not None:
+            ahead.config(text=f"People ahead: {data['position']}")
+        label = tk.Label(win, text=f"ETA ~ {eta_min} minutes", font=("Arial", 12))
+        label.pack(pady=(4,10))
+        def countdown(m):
+            if not win.winfo_exists():
                 return
+            if m <= 0:
+                label.config(text="🔔 It's your turn! Please rejoin the queue.")
+            else:
+                label.config(text=f"ETA ~ {m} minutes")
+                win.after(60 * 1000, lambda: countdown(m - 1))
 
-            if data.get("ok") and data.get("type") == "reservation":
-                token = data.get("token")
-                eta_min = data.get("eta_min", eta)
-
-                def show_token():
-                    win = tk.Toplevel(self)
-                    win.title("Virtual Token")
-                    win.geometry("340x180")
-                    tk.Label(win, text=f"Your token: {token}", font=("Helvetica", 14, "bold")).pack(pady=(12,6))
-                    label = tk.Label(win, text=f"ETA ~ {eta_min} minutes", font=("Arial", 12))
-                    label.pack(pady=(4,10))
-                    def countdown(m):
-                        if m <= 0:
-                            label.config(text="🔔 It's your turn! Please rejoin the queue.")
-                        else:
-                            label.config(text=f"ETA ~ {m} minutes")
-                            win.after(60 * 1000, lambda: countdown(m - 1))
-                    countdown(eta_min)
-                self.after(0, show_token)
+        def apply_status(st):
+            if not win.winfo_exists():
+                return
+            if st.get("state") == "waiting":
+                ahead.config(text=f"People ahead: {st.get('position', '?')}")
+                label.config(text=f"ETA ~ {st.get('eta_min', '?')} minutes")
+            elif st.get("state") == "called":
+                ahead.config(text=f"Desk: {st.get('desk', '-')}")
+                label.config(text="🔔 It's your turn! Please go to the desk.")
             else:
-                err = data.get("error", "unknown error")
-                self.after(0, lambda: messagebox.showerror("MCP Error", str(err)))
+                label.config(text="Token expired.")
+
+        def on_fail():
+            if win.winfo_exists():
+                countdown(eta_min)
 
-        threading.Thread(target=worker, daemon=True).start()
+        # live updates pushed by the server; local countdown only if streaming fails
+        # (a stream stays open for minutes, so it gets its own thread rather than the network worker)
+        base_url = invoke_url[:-len("/invoke")] if invoke_url.endswith("/invoke") else invoke_url
+        follower = TokenFollower(base_url, token, api_key, lambda st: self.after(0, lambda: apply_status(st)),
+                                 lambda: self.after(0, on_fail)).start()
+        # closing the window ends its stream (and its thread) right away
+        win.bind("<Destroy>", lambda e: e.widget is win and follower.stop(), add="+")
 
-    def update_heatmap(self):
+    def update_heatmap(self, *_):
         """
-        Updates the heatmap canvas with simple visualization from recent reports.
+        Redraws the crowd heatmap (domain x hour for all domains, day x hour for the
+        selected one, see heatmap.py). Called when a report is added or the domain
+        changes; the renderer returns nothing if its inputs did not change.
         """
-        if not self.reports:
-            self.after(2500, self.update_heatmap)
+        if not self.reports.totals:
+            return
+        if self.heatmap is None:
+            from heatmap import HeatmapRenderer
+            self.heatmap = HeatmapRenderer(self.reports, 200, 180)
+
+        domains = sorted(self.reports.totals)
+        selected = self.domain_var.get()
+        img = self.heatmap.render(domains, selected)
+        if img is None:
             return
 
-        # Simple heatmap visualization (circle intensity = people count)
+        from PIL import ImageTk
+        self.heat_img = ImageTk.PhotoImage(img)
         self.canvas.delete("heat")
-        cx, cy = 100, 90  # center
-
-        count = sum(r.get("people", 0) for r in self.reports if r.get("domain") == self.domain_var.get())
-        count = min(count, 50)
-
-        r = 20 + count * 2
-        color = f"#ff{int(255 - count*5):02x}00"
-        self.canvas.create_oval(cx-r, cy-r, cx+r, cy+r, fill=color, outline="", tags="heat")
-
-        self.after(2500, self.update_heatmap)
+        self.canvas.create_image(0, 0, anchor="nw", image=self.heat_img, tags="heat")
+        lay = self.heatmap.layout
+        for i, d in enumerate(domains):
+            y = i * lay["row_h"] + lay["row_h"] // 2
+            self.canvas.create_text(2, y, anchor="w", text=d[:8], font=("Arial", 7), tags="heat")
+        if selected in domains:
+            for i, day in enumerate(("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")):
+                y = lay["top_h"] + 4 + i * lay["day_h"] + lay["day_h"] // 2
+                self.canvas.create_text(2, y, anchor="w", text=day, font=("Arial", 6), tags="heat")
 
 if __name__ == "__main__":
+    if not os.path.isdir(DATA_DIR):
+        tk.Tk().withdraw()
+        messagebox.showerror("Error", f"Data directory not found: {DATA_DIR}")
+        raise SystemExit(1)
     app = QueueIdentifierApp()
     app.mainloop()
@@ -0,0 +1,144 @@
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+from queue_engine import URGENCY_FACTORS
+
+PERCENTILES = (50, 75, 90, 95, 99)
+DEFAULT_SAMPLES = 10000
+MAX_SAMPLES = 200000
+BLOCK = 64  # random-walk steps drawn per vectorised round (priority model)
+MAX_STEPS = 20000  # events per sample; not served by then counts as "unserved"
+MAX_WALK_STEPS = 10000000  # random-walk steps per priority simulation; fewer samples above it
+MIN_WALK_SAMPLES = 500
+
+
+def simulate(people, service_mins, desks=1, urgency=1.0, arrivals_per_hour=0.0, mix=None,
+             samples=DEFAULT_SAMPLES, model=None):
+    """
+    Monte Carlo wait-time distribution (minutes) for someone with `people`
+    ahead of them.
+
+    Service times are exponential with mean service_mins at each of `desks`
+    counters, all busy when the person joins (M/M/c). With model="mmc" the
+    queue is first come, first served, so the wait is the time until
+    people + 1 departures. With model="priority", people with a higher urgency
+    than the person (mix: {urgency factor: share of arrivals}) who arrive
+    during the wait, at arrivals_per_hour, are served first (non-preemptive).
+    The model defaults to "priority" when arrivals are given. A priority
+    simulation takes about people x samples steps, so samples are reduced to
+    keep it within MAX_WALK_STEPS (the result's "samples" says how many ran).
+
+    Results are deterministic for a parameter set (the RNG is seeded from it)
+    and cached, so repeated questions cost a dict lookup.
+    """
+    samples = max(1, min(int(samples), MAX_SAMPLES))
+    if not 0 < round(float(service_mins), 4) < float("inf"):
+        raise ValueError("service_mins must be positive")
+    model = model or ("priority" if arrivals_per_hour and mix else "mmc")
+    if model not in ("mmc", "priority"):
+        raise ValueError("model must be 'mmc' or 'priority'")
+    mix_key = tuple(sorted((float(k), float(v)) for k, v in (mix or {}).items()))
+    people, service_mins, desks = max(0, int(people)), round(float(service_mins), 4), max(1, int(desks))
+    urgency, arrivals_per_hour = float(urgency), round(float(arrivals_per_hour), 4)
+    if model == "priority":
+        steps = _walk_steps(people, desks / service_mins, _jump_rate(urgency, arrivals_per_hour, mix_key))
+        samples = min(samples, max(MIN_WALK_SAMPLES, MAX_WALK_STEPS // steps))
+    return dict(_simulate(people, service_mins, desks, urgency, arrivals_per_hour, mix_key, samples, model))
+
+
+def _jump_rate(urgency, arrivals_per_hour, mix_key):
+    """Per minute, arrivals more urgent than urgency (they are served first)."""
+    total = sum(w for _, w in mix_key) or 1.0
+    higher = sum(w for f, w in mix_key if f > urgency) / total
+    return arrivals_per_hour / 60.0 * higher
+
+
+def _walk_steps(people, departure_rate, jump_rate):
+    """Expected random-walk steps per priority sample (0 when there are no jumps)."""
+    if not jump_rate:
+        return 1
+    if departure_rate <= jump_rate:
+        return MAX_STEPS
+    drift = (departure_rate - jump_rate) / (departure_rate + jump_rate)
+    return max(1, min(MAX_STEPS, int((people + 1) / drift)))
+
+
+@lru_cache(maxsize=2048)
+def _simulate(people, service_mins, desks, urgency, arrivals_per_hour, mix_key, samples, model):
+    rng = np.random.default_rng(zlib.crc32(repr((people, service_mins, desks, urgency, arrivals_per_hour,
+                                                 mix_key, samples, model)).encode("ascii")))
+    departure_rate = desks / service_mins  # per minute, while all desks are busy
+    jump_rate = _jump_rate(urgency, arrivals_per_hour, mix_key) if model == "priority" else 0.0
+    if not jump_rate:
+        # the person starts after people + 1 departures: a Gamma(people + 1) wait
+        waits = rng.gamma(people + 1, 1.0 / departure_rate, size=samples)
+        served = np.ones(samples, dtype=bool)
+    else:
+        waits, served = _priority_waits(rng, people, departure_rate, jump_rate, samples)
+
+    out = {"model": model, "samples": samples, "people": people, "desks": desks, "service_mins": service_mins}
+    if not served.any():
+        out.update(mean=None, unserved=1.0, **{f"p{p}": None for p in PERCENTILES})
+        return tuple(out.items())
+    w = waits[served]
+    pct = np.percentile(w, PERCENTILES)
+    out.update({f"p{p}": round(float(v), 1) for p, v in zip(PERCENTILES, pct)})
+    out.update(mean=round(float(w.mean()), 1), std=round(float(w.std()), 1),
+               unserved=round(1.0 - float(served.mean()), 4))
+    return tuple(out.items())
+
+
+def _priority_waits(rng, people, departure_rate, jump_rate, samples):
+    """
+    Events are departures (rate departure_rate) or higher-urgency arrivals
+    jumping ahead (rate jump_rate). The person is served at the first event
+    where departures exceed people + jumps. Event counts come from a
+    vectorised random walk (BLOCK steps per round for all unfinished
+    samples); the wait is then a Gamma(events) draw at the total event rate.
+    """
+    rate = departure_rate + jump_rate
+    p_departure = departure_rate / rate
+    need = people + 1
+    # when jumps outpace departures, a walk that drifted this far below need
+    # recovers with probability < 1e-4: stop simulating it (unserved)
+    q = 1.0 - p_departure
+    floor = need - int(np.ceil(np.log(1e-4) / np.log(p_departure / q))) if 0 < p_departure < q else None
+    level = np.zeros(samples, dtype=np.int64)  # departures minus jumps so far
+    events = np.zeros(samples, dtype=np.int64)
+    active = np.arange(samples)
+    steps = 0
+    while active.size and steps < MAX_STEPS:
+        walk = np.where(rng.random((active.size, BLOCK)) < p_departure, 1, -1).cumsum(axis=1)
+        walk += level[active, None]
+        hit = walk >= need
+        done = hit.any(axis=1)
+        first = hit.argmax(axis=1)
+        idx = active[done]
+        events[idx] += first[done] + 1
+        level[idx] = need
+        still = active[~done]
+        events[still] += BLOCK
+        level[still] = walk[~done, -1]
+        if floor is not None:
+            still = still[level[still] > floor]
+        active = still
+        steps += BLOCK
+    served = level >= need
+    waits = np.zeros(samples)
+    waits[served] = rng.gamma(events[served], 1.0 / rate)
+    return waits, served
+
+
+def parse_mix(value):
+    """Urgency mix from {"1": 0.7, "3": 0.1} or "1:0.7,3:0.1"; keys snap to URGENCY_FACTORS."""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = dict(part.split(":", 1) for part in value.split(",") if ":" in part)
+    mix = {}
+    for k, v in dict(value).items():
+        f = min(URGENCY_FACTORS, key=lambda u: abs(u - float(k)))
+        mix[f] = mix.get(f, 0.0) + float(v)
+    return mix
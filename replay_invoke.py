@@ -0,0 +1,273 @@
+"""
+Replay captured /invoke traffic, time-scaled.
+
+Record with MCP_CAPTURE (see traffic_capture.py), then re-issue the same
+requests against a local server at 1x, 10x or 100x speed:
+
+    MCP_CAPTURE=festival.ndjson.gz python mcp_server.py
+    python replay_invoke.py festival.ndjson.gz --speed 10
+    python replay_invoke.py festival.ndjson.gz* --url http://127.0.0.1:8080/invoke --speed 100 --out replay.json
+
+Each request is sent at its captured offset divided by --speed, on its own
+worker thread, so bursts arrive with their original overlap (open loop: a
+slow server does not slow the schedule, the lag is reported instead).
+Tokens issued by captured reservations are mapped to the tokens the target
+issues, so follow-up position/status calls refer to live tokens.
+
+The report compares, per action, the captured server time with the
+target's (Server-Timing header) and gives the per-request deviation, the
+client round trip, schedule lag and status changes (e.g. 200 -> 429).
+Multiple files (one per cluster worker) are merged by timestamp. A server
+started by this tool has its quotas lifted (as in bench_invoke.py); use
+--url against a normally configured server to rehearse load shedding.
+"""
+import json
+import time
+import heapq
+import shutil
+import argparse
+import tempfile
+import itertools
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+from bench_invoke import SERVERS, percentile, start_server
+from traffic_capture import read_capture
+
+
+def load_capture(paths, limit=None):
+    """Captured requests of all files, oldest first (each file is already in order)."""
+    merged = heapq.merge(*(read_capture(p) for p in paths), key=lambda r: r.get("ts", 0))
+    return itertools.islice(merged, limit) if limit else merged
+
+
+def label(body):
+    if isinstance(body, list) or (isinstance(body, dict) and "batch" in body):
+        return "batch"
+    if isinstance(body, dict):
+        return str(body.get("action", "advice"))
+    return "invalid"
+
+
+def server_ms(headers):
+    """Handler time from 'Server-Timing: app;dur=1.234', or None."""
+    for part in headers.get("Server-Timing", "").split(";"):
+        if part.strip().startswith("dur="):
+            try:
+                return float(part.strip()[4:])
+            except ValueError:
+                return None
+    return None
+
+
+class TokenMap:
+    """
+    Captured reservation token -> token issued by the replay target. A call
+    that uses a token whose reservation is still in flight waits for it, so
+    a position check never overtakes its own reservation.
+    """
+
+    def __init__(self, wait=30.0):
+        self.wait = wait
+        self._map = {}
+        self._pending = {}  # old token -> Event, set when its reservation has been answered
+        self._lock = threading.Lock()
+        self.mapped = 0
+        self.unmapped = 0
+
+    def expect(self, captured):
+        """Called in schedule order, before the reservation carrying these tokens is sent."""
+        if captured:
+            with self._lock:
+                for old in captured.values():
+                    self._pending[str(old).upper()] = threading.Event()
+
+    def remap(self, body):
+        items = body if isinstance(body, list) else body.get("batch") if isinstance(body, dict) else None
+        if not isinstance(items, list):
+            return self._item(body) if isinstance(body, dict) else body
+        items = [self._item(i) if isinstance(i, dict) else i for i in items]
+        return items if isinstance(body, list) else dict(body, batch=items)
+
+    def _item(self, item):
+        payload = item.get("payload")
+        if not isinstance(payload, dict) or "token" not in payload:
+            return item
+        old = str(payload["token"]).upper()
+        with self._lock:
+            ready = self._pending.get(old)
+        if ready is not None:
+            ready.wait(self.wait)
+        with self._lock:
+            new = self._map.get(old)
+            if new is None:
+                self.unmapped += 1
+                return item
+            self.mapped += 1
+        return dict(item, payload=dict(payload, token=new))
+
+    def learn(self, captured, result):
+        """captured: {item index: old token} from the capture; result: the target's response body."""
+        if not captured:
+            return
+        results = None
+        if isinstance(result, dict):
+            results = result.get("results") if "results" in result else [result]
+        with self._lock:
+            for idx, old in captured.items():
+                old, i = str(old).upper(), int(idx)
+                if isinstance(results, list) and i < len(results) and isinstance(results[i], dict):
+                    new = results[i].get("token")
+                    if new:
+                        self._map[old] = new
+                ready = self._pending.pop(old, None)
+                if ready is not None:
+                    ready.set()  # answered, mapped or not
+
+
+def summary(vals):
+    vals = sorted(vals)
+    return {
+        "count": len(vals),
+        "mean_ms": round(sum(vals) / len(vals), 3) if vals else None,
+        "p50_ms": percentile(vals, 50),
+        "p95_ms": percentile(vals, 95),
+        "p99_ms": percentile(vals, 99),
+        "max_ms": round(vals[-1], 3) if vals else None,
+    }
+
+
+def replay(url, api_key, records, speed=1.0, max_workers=256, timeout=30):
+    """Open-loop replay of captured requests; returns the JSON report."""
+    tokens = TokenMap()
+    lock = threading.Lock()
+    local = threading.local()
+    by_action = {}
+    lag, statuses, errors = [], {}, []
+
+    def send(rec, due):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+            session.headers.update({"X-API-KEY": api_key})
+        late = (time.perf_counter() - due) * 1000.0
+        body = tokens.remap(rec.get("b"))
+        started = time.perf_counter()
+        result, srv = None, None
+        try:
+            headers = {"Idempotency-Key": rec["k"]} if rec.get("k") else None
+            r = session.post(url, json=body, headers=headers, timeout=timeout)
+            status = r.status_code
+            srv = server_ms(r.headers)
+            try:
+                result = r.json()
+            except ValueError:
+                pass
+        except requests.RequestException as e:
+            status = "conn_error"
+            with lock:
+                if len(errors) < 5:
+                    errors.append(str(e))
+        rtt = (time.perf_counter() - started) * 1000.0
+        tokens.learn(rec.get("tok"), result)
+        key = f"{rec.get('s')}->{status}"
+        with lock:
+            lag.append(late)
+            statuses[key] = statuses.get(key, 0) + 1
+            s = by_action.setdefault(label(rec.get("b")), {"captured": [], "replay": [], "rtt": [], "deviation": []})
+            s["rtt"].append(rtt)
+            if srv is not None and rec.get("ms") is not None:
+                s["captured"].append(rec["ms"])
+                s["replay"].append(srv)
+                s["deviation"].append(srv - rec["ms"])
+
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="replay")
+    first_ts = last_ts = None
+    t0 = time.perf_counter()
+    count = 0
+    for rec in records:
+        ts = rec.get("ts", 0)
+        if first_ts is None:
+            first_ts = ts
+        last_ts = ts
+        due = t0 + (ts - first_ts) / speed
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        tokens.expect(rec.get("tok"))
+        pool.submit(send, rec, due)
+        count += 1
+    pool.shutdown(wait=True)
+    elapsed = time.perf_counter() - t0
+
+    def merged(field):
+        return [v for s in by_action.values() for v in s[field]]
+
+    changed = {k: n for k, n in statuses.items() if k.split("->")[0] != k.split("->")[1]}
+    return {
+        "requests": count,
+        "speed": speed,
+        "captured_span_s": round((last_ts - first_ts), 3) if count else 0.0,
+        "replay_span_s": round(elapsed, 3),
+        "throughput_rps": round(count / elapsed, 1) if elapsed else None,
+        "schedule_lag": summary(lag),
+        "latency": {"captured": summary(merged("captured")), "replay": summary(merged("replay")),
+                    "deviation": summary(merged("deviation")), "round_trip": summary(merged("rtt"))},
+        "by_action": {name: {"captured": summary(s["captured"]), "replay": summary(s["replay"]),
+                             "deviation": summary(s["deviation"]), "round_trip": summary(s["rtt"])}
+                      for name, s in sorted(by_action.items())},
+        "status_changes": changed,
+        "status_counts": statuses,
+        "tokens": {"mapped": tokens.mapped, "unmapped": tokens.unmapped},
+        "sample_errors": errors,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("capture", nargs="+", help="capture file(s) written with MCP_CAPTURE")
+    ap.add_argument("--speed", type=float, default=1.0, help="time scale: 1, 10, 100, ... (default 1)")
+    ap.add_argument("--url", help="replay against an already running /invoke URL instead of starting a server")
+    ap.add_argument("--server", choices=sorted(SERVERS), default="mcp", help="which server script to start")
+    ap.add_argument("--asgi", action="store_true", help="start the server in --asgi mode")
+    ap.add_argument("--api-key", help="API key (defaults to the server's demo key)")
+    ap.add_argument("--port", type=int, default=18080)
+    ap.add_argument("--max-concurrency", type=int, default=256, help="sender threads (bounds in-flight requests)")
+    ap.add_argument("--limit", type=int, help="replay only the first N requests")
+    ap.add_argument("--out", help="also write the JSON report to this file")
+    args = ap.parse_args()
+    if args.speed <= 0:
+        ap.error("--speed must be positive")
+
+    api_key = args.api_key or SERVERS[args.server][1]
+    records = load_capture(args.capture, args.limit)
+    proc = workdir = None
+    try:
+        url = args.url
+        if not url:
+            workdir = tempfile.mkdtemp(prefix="qintelli-replay-")
+            proc, url = start_server(args.server, args.port, workdir, args.asgi)
+        result = replay(url, api_key, records, args.speed, args.max_concurrency)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"started": int(time.time()),
+              "config": {k: v for k, v in vars(args).items() if k != "api_key"}, **result}
+    out = json.dumps(report, indent=2)
+    print(out)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(out)
+
+
+if __name__ == "__main__":
+    main()
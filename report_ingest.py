@@ -0,0 +1,204 @@
+import os
+import json
+import zlib
+import uuid
+
+from report_store import MAX_PEOPLE, report_ts
+
+MAX_LINE_BYTES = 64 * 1024  # one NDJSON report; longer lines are dropped
+INFLATE_STEP = 256 * 1024  # bytes decompressed per step, bounds memory per request
+FOLD_ROWS = 2000  # reports per ReportStore.ingest() transaction
+UPLOAD_ROWS = 5000  # reports per upload request (GUI)
+
+
+def parse_report(r):
+    """(kiosk, seq, domain, people, ts) from one decoded NDJSON object, or None if invalid."""
+    try:
+        kiosk = str(r["kiosk"])
+        seq = int(r["seq"])
+        people = int(r["people"])
+        ts = report_ts(r.get("ts"))
+    except (KeyError, TypeError, ValueError, OverflowError):
+        return None
+    domain = r.get("domain")
+    if not kiosk or not 0 < seq < 2 ** 63 or not 0 <= people <= MAX_PEOPLE:
+        return None
+    if not isinstance(domain, str) or not domain:
+        return None
+    return kiosk, seq, domain, people, ts
+
+
+class NDJSONReports:
+    """
+    Incremental parser for a (optionally gzip-compressed) NDJSON body of kiosk
+    reports. Bytes are fed as they arrive and complete lines come back as
+    report tuples, so a batch of any size is handled in bounded memory.
+    """
+
+    def __init__(self, gzip=False):
+        self._inflate = zlib.decompressobj(wbits=31) if gzip else None  # wbits=31: gzip container
+        self._buf = b""
+        self._skipping = False  # inside an over-long line
+        self.invalid = 0
+        self.max_seq = {}  # kiosk -> highest seq seen in this body
+
+    def feed(self, data):
+        if self._inflate is None:
+            return self._lines(data)
+        rows = []
+        try:
+            chunk = self._inflate.decompress(data, INFLATE_STEP)
+            rows.extend(self._lines(chunk))
+            while self._inflate.unconsumed_tail:
+                chunk = self._inflate.decompress(self._inflate.unconsumed_tail, INFLATE_STEP)
+                rows.extend(self._lines(chunk))
+        except zlib.error as e:
+            raise ValueError(f"bad gzip data: {e}")
+        return rows
+
+    def close(self):
+        """Rows of a last line without a trailing newline; ValueError if the gzip stream is truncated."""
+        if self._inflate is not None and not self._inflate.eof:
+            raise ValueError("truncated gzip data")
+        rest, self._buf = self._buf, b""
+        return self._lines(rest + b"\n") if rest.strip() else []
+
+    def _lines(self, data):
+        rows = []
+        buf = self._buf + data
+        start = 0
+        while True:
+            end = buf.find(b"\n", start)
+            if end < 0:
+                break
+            line = buf[start:end]
+            start = end + 1
+            if self._skipping:
+                self._skipping = False
+                continue
+            if line.strip():
+                self._parse(line, rows)
+        self._buf = buf[start:]
+        if len(self._buf) > MAX_LINE_BYTES or (self._skipping and self._buf):
+            if not self._skipping:
+                self.invalid += 1
+            self._buf = b""
+            self._skipping = True
+        return rows
+
+    def _parse(self, line, rows):
+        try:
+            row = parse_report(json.loads(line))
+        except (ValueError, AttributeError):
+            row = None
+        if row is None:
+            self.invalid += 1
+            return
+        if row[1] > self.max_seq.get(row[0], 0):
+            self.max_seq[row[0]] = row[1]
+        rows.append(row)
+
+
+def ingest_stream(store, chunks, gzip=False):
+    """
+    Parse an iterable of body chunks and fold the reports into store
+    (ReportStore.ingest, FOLD_ROWS per transaction). Returns the /ingest
+    response body; ValueError for a corrupt body (reports folded before the
+    error stay stored and are skipped as duplicates when the kiosk resends).
+    """
+    parser = NDJSONReports(gzip)
+    totals = [0, 0]
+    pending = []
+
+    def fold(rows):
+        stored, dups = store.ingest(rows)
+        totals[0] += stored
+        totals[1] += dups
+
+    for chunk in chunks:
+        pending.extend(parser.feed(chunk))
+        while len(pending) >= FOLD_ROWS:
+            fold(pending[:FOLD_ROWS])
+            del pending[:FOLD_ROWS]
+    pending.extend(parser.close())
+    if pending:
+        fold(pending)
+    return ingest_reply(parser, *totals)
+
+
+def ingest_reply(parser, stored, duplicates):
+    # everything up to max_seq is now stored (or was already): the kiosk's new offset
+    return {"ok": True, "stored": stored, "duplicates": duplicates, "invalid": parser.invalid,
+            "acked": parser.max_seq}
+
+
+# ---------------------- kiosk side ---------------------- #
+class ReportUploader:
+    """
+    Ships a kiosk's local reports to the server's /ingest as gzip NDJSON.
+
+    The local ReportStore row id is the report's sequence number. The last
+    seq the server acknowledged is kept in state_path with the kiosk id, so
+    each upload sends only the reports added since, and a resend after a
+    lost answer is dropped by the server's per-kiosk dedupe.
+    """
+
+    def __init__(self, store, state_path, batch_rows=UPLOAD_ROWS):
+        self.store = store
+        self.state_path = state_path
+        self.batch_rows = batch_rows
+        self.state = self._load()
+
+    def _load(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("kiosk"):
+                return {"kiosk": state["kiosk"], "acked": int(state.get("acked", 0))}
+        except (OSError, ValueError, TypeError):
+            pass
+        self.state = {"kiosk": uuid.uuid4().hex, "acked": 0}
+        try:
+            self._save()  # keep the id even if the first upload's answer is lost
+        except OSError:
+            pass
+        return self.state
+
+    def _save(self):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.state_path)
+
+    def pending(self, limit=None):
+        return self.store.since(self.state["acked"], limit or self.batch_rows)
+
+    def has_pending(self):
+        return bool(self.pending(1))
+
+    def body(self, rows):
+        kiosk = self.state["kiosk"]
+        lines = "".join(json.dumps({"kiosk": kiosk, "seq": rid, "ts": ts, "domain": domain, "people": people},
+                                   separators=(",", ":")) + "\n" for rid, ts, domain, people in rows)
+        c = zlib.compressobj(6, zlib.DEFLATED, 31)
+        return c.compress(lines.encode("utf-8")) + c.flush()
+
+    def upload(self, session, base_url, api_key, timeout=10):
+        """Send all unacknowledged reports, batch_rows per request; returns how many were acknowledged."""
+        sent = 0
+        while True:
+            rows = self.pending()
+            if not rows:
+                return sent
+            r = session.post(base_url.rstrip("/") + "/ingest", data=self.body(rows), timeout=timeout,
+                             headers={"X-API-KEY": api_key, "Content-Type": "application/x-ndjson",
+                                      "Content-Encoding": "gzip"})
+            r.raise_for_status()
+            acked = r.json().get("acked", {}).get(self.state["kiosk"])
+            if not acked or acked <= self.state["acked"]:
+                return sent
+            sent += sum(1 for rid, _, _, _ in rows if rid <= acked)
+            self.state["acked"] = acked
+            self._save()
+            if len(rows) < self.batch_rows:
+                return sent
@@ -0,0 +1,212 @@
+import os
+import json
+import math
+import time
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    domain TEXT NOT NULL,
+    people INTEGER NOT NULL,
+    hour INTEGER NOT NULL,
+    dow INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_domain_hour ON reports (domain, hour);
+CREATE TABLE IF NOT EXISTS report_agg (
+    domain TEXT NOT NULL,
+    dow INTEGER NOT NULL,
+    hour INTEGER NOT NULL,
+    reports INTEGER NOT NULL,
+    people INTEGER NOT NULL,
+    PRIMARY KEY (domain, dow, hour)
+);
+CREATE TABLE IF NOT EXISTS kiosk_seq (
+    kiosk TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL
+);
+"""
+
+
+MAX_PEOPLE = 100000  # in one report; more is a typo or garbage
+MIN_TS = 946684800.0  # 2000-01-01
+MAX_FUTURE_SECS = 86400  # allowed clock skew of a reporting device
+
+
+def report_ts(value, now=None):
+    """
+    A report's timestamp as a float, None when not given; ValueError unless it
+    is a finite epoch time between MIN_TS and a day from now.
+    """
+    if value is None:
+        return None
+    ts = float(value)
+    now = time.time() if now is None else now
+    if not math.isfinite(ts) or not MIN_TS <= ts <= now + MAX_FUTURE_SECS:
+        raise ValueError(f"ts out of range: {value!r}")
+    return ts
+
+
+class ReportStore:
+    """
+    Crowd reports in SQLite (WAL mode) with per-domain aggregates kept in memory.
+
+    Each add() is one INSERT plus one UPSERT into report_agg in a single short
+    transaction, so the cost does not depend on how many reports exist. The
+    aggregate table (at most domains x 7 x 24 rows) is all that is read at
+    startup; totals for the heatmap are plain dict lookups.
+    """
+
+    def __init__(self, path, legacy_file=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self.version = 0  # bumped on every change, lets views skip redraws
+        self.domain_versions = {}  # domain -> bumped when its cells change (forecast.py caches on it)
+
+        # domain -> [reports, people]; (domain, dow, hour) -> [reports, people]
+        self.totals = {}
+        self.cells = {}
+        for domain, dow, hour, n, people in self._conn.execute(
+                "SELECT domain, dow, hour, reports, people FROM report_agg"):
+            self._fold(domain, dow, hour, n, people)
+        # highest report sequence number stored per kiosk (see ingest())
+        self.kiosk_seqs = dict(self._conn.execute("SELECT kiosk, seq FROM kiosk_seq"))
+
+        if legacy_file and os.path.exists(legacy_file):
+            self.migrate(legacy_file)
+
+    def _fold(self, domain, dow, hour, n, people):
+        t = self.totals.setdefault(domain, [0, 0])
+        t[0] += n
+        t[1] += people
+        c = self.cells.setdefault((domain, dow, hour), [0, 0])
+        c[0] += n
+        c[1] += people
+        self.domain_versions[domain] = self.domain_versions.get(domain, 0) + 1
+
+    def _insert(self, rows):
+        self._conn.executemany(
+            "INSERT INTO reports (ts, domain, people, hour, dow) VALUES (?, ?, ?, ?, ?)", rows)
+        self._conn.executemany(
+            "INSERT INTO report_agg (domain, dow, hour, reports, people) VALUES (?, ?, ?, 1, ?) "
+            "ON CONFLICT (domain, dow, hour) DO UPDATE SET "
+            "reports = reports + 1, people = people + excluded.people",
+            [(domain, dow, hour, people) for _, domain, people, hour, dow in rows])
+
+    @staticmethod
+    def _row(domain, people, ts=None, hour=None):
+        ts = time.time() if ts is None else ts
+        lt = time.localtime(ts)
+        return (ts, domain, int(people), lt.tm_hour if hour is None else int(hour), lt.tm_wday)
+
+    def add(self, domain, people, ts=None):
+        """Store one report (same fields the GUI used to write to reports.json)."""
+        row = self._row(domain, people, ts)
+        with self._lock:
+            with self._conn:
+                self._insert([row])
+            self._fold(row[1], row[4], row[3], 1, row[2])
+            self.version += 1
+        return row
+
+    def add_many(self, records, chunk=10000):
+        """
+        Store (domain, people, ts) records from any iterable, chunk rows per
+        transaction, so a history of any length is loaded with bounded memory.
+        Returns the number of rows stored.
+        """
+        count = 0
+        rows = []
+        for domain, people, ts in records:
+            rows.append(self._row(domain, people, ts))
+            if len(rows) >= chunk:
+                count += self._add_rows(rows)
+                rows = []
+        if rows:
+            count += self._add_rows(rows)
+        return count
+
+    def _add_rows(self, rows):
+        with self._lock:
+            with self._conn:
+                self._insert(rows)
+            for ts, domain, people, hour, dow in rows:
+                self._fold(domain, dow, hour, 1, people)
+            self.version += 1
+        return len(rows)
+
+    def ingest(self, rows):
+        """
+        Store kiosk reports [(kiosk, seq, domain, people, ts)] exactly once.
+        A kiosk numbers its reports in increasing order, so anything at or
+        below its highest stored seq is a resend and is skipped; reports and
+        the new high-water marks are written in one transaction.
+        Returns (stored, duplicates).
+        """
+        with self._lock:
+            marks = {}
+            fresh = []
+            for kiosk, seq, domain, people, ts in rows:
+                if seq <= marks.get(kiosk, self.kiosk_seqs.get(kiosk, 0)):
+                    continue
+                marks[kiosk] = seq
+                fresh.append(self._row(domain, people, ts))
+            if not marks:
+                return 0, len(rows)
+            with self._conn:
+                self._insert(fresh)
+                self._conn.executemany(
+                    "INSERT INTO kiosk_seq (kiosk, seq) VALUES (?, ?) "
+                    "ON CONFLICT (kiosk) DO UPDATE SET seq = max(seq, excluded.seq)", list(marks.items()))
+            for ts, domain, people, hour, dow in fresh:
+                self._fold(domain, dow, hour, 1, people)
+            self.kiosk_seqs.update(marks)
+            self.version += 1
+        return len(fresh), len(rows) - len(fresh)
+
+    def since(self, seq, limit=1000):
+        """Reports with id > seq, oldest first: [(id, ts, domain, people)] (for uploading deltas)."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, ts, domain, people FROM reports WHERE id > ? ORDER BY id LIMIT ?",
+                (seq, limit)).fetchall()
+
+    def migrate(self, legacy_file):
+        """One-time import of reports.json; the file is renamed to *.migrated."""
+        try:
+            with open(legacy_file, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except (OSError, ValueError):
+            legacy = []
+        # old records carry only an hour of day; keep it and stamp them with the import time
+        rows = [self._row(r.get("domain", ""), r.get("people", 0), r.get("ts"), r.get("hour"))
+                for r in legacy if isinstance(r, dict) and r.get("domain")]
+        self._add_rows(rows)
+        os.replace(legacy_file, legacy_file + ".migrated")
+
+    # ---------------------- reads (O(1), in memory) ---------------------- #
+    def __len__(self):
+        return sum(t[0] for t in self.totals.values())
+
+    def total_people(self, domain):
+        t = self.totals.get(domain)
+        return t[1] if t else 0
+
+    def report_count(self, domain):
+        t = self.totals.get(domain)
+        return t[0] if t else 0
+
+    def cell(self, domain, dow, hour):
+        """(reports, people) for one domain at one day-of-week/hour."""
+        c = self.cells.get((domain, dow, hour))
+        return (c[0], c[1]) if c else (0, 0)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
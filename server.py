@@ -1,47 +1,141 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+import os
+import sys
+import time
 import random
 import string
+from queue_engine import QueueEngine, load_service_times, check_args
+from queue_actions import QueueActions, COMPUTE_ACTIONS
+from wait_estimator import WaitEstimator
+from token_registry import TokenRegistry
+from token_stream import StreamHub, stream_events, async_stream_events, long_poll, async_long_poll
+from metrics import Metrics, instrument_flask
 
 app = Flask(__name__)
 
+# GET /metrics: request/action latency histograms and queue gauges (see metrics.py)
+metrics = Metrics()
+instrument_flask(app, metrics)
+metrics.describe("action_duration_seconds", "histogram", "Time to run one /invoke item, by action.")
+
 API_KEY = "supersecret123"  # Change this to your actual API key
+PORT = int(os.environ.get("PORT", 8080))
 
 def generate_token(length=8):
     """Generate an uppercase alphanumeric token (letters + numbers)."""
     characters = string.ascii_uppercase + string.digits
     return ''.join(random.choices(characters, k=length))
 
+# Live reservation queues, one per domain (see queue_engine.py)
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+SERVICE_TIMES = load_service_times(DATA_DIR)
+estimator = WaitEstimator(SERVICE_TIMES)
+registry = TokenRegistry(token_factory=generate_token)
+hub = StreamHub()  # pushes queue changes to /stream subscribers
+queues = QueueEngine(SERVICE_TIMES, estimator=estimator, registry=registry, on_change=hub.publish)
+actions = QueueActions(queues, registry, estimator)  # same actions as mcp_server.py (see queue_actions.py)
+token_status = actions.token_status
+stream_request = actions.stream_request
+metrics.gauge("queue_length", "People waiting, per domain.",
+              lambda: {(("domain", d),): len(q) for d, q in list(queues.queues.items())})
+
+MAX_BATCH_ITEMS = 500
+
+def handle_action(action, payload):
+    """Run one action; returns (response body, http status)."""
+    error = check_args(payload)
+    if error:
+        return {"ok": False, "error": error}, 400
+    res = actions.handle(action, payload)
+    if res is None:
+        return {"ok": False, "error": "Unknown action"}, 400
+    return res
+
+def handle_item(data):
+    # Basic payload validation
+    if not isinstance(data, dict) or "tool" not in data or "action" not in data:
+        return {"ok": False, "error": "Invalid payload"}, 400
+    payload = data.get("payload") or {}
+    if not isinstance(payload, dict):
+        return {"ok": False, "error": "Invalid payload"}, 400
+    t0 = time.perf_counter()
+    res = handle_action(data["action"], payload)
+    metrics.observe("action_duration_seconds", (("action", metrics.bounded("action", str(data["action"]))),),
+                    time.perf_counter() - t0)
+    return res
+
+def handle_invoke(data):
+    """Single call ({tool, action, payload}) or batch ([...] or {"batch": [...]})."""
+    items = data if isinstance(data, list) else data.get("batch") if isinstance(data, dict) else None
+    if items is None:
+        return handle_item(data)
+    if not isinstance(items, list):
+        return {"ok": False, "error": "Batch must be a list"}, 400
+    if len(items) > MAX_BATCH_ITEMS:
+        return {"ok": False, "error": f"Batch too large (max {MAX_BATCH_ITEMS} items)"}, 413
+    results = []
+    for item in items:
+        body, status = handle_item(item)
+        results.append({**body, "status": status})
+    return {"ok": True, "type": "batch", "results": results}, 200
+
+def require_api_key(req):
+    return req.headers.get('X-API-KEY') == API_KEY
+
 @app.route('/invoke', methods=['POST'])
 @app.route('/invoke/invoke', methods=['POST'])
 def invoke():
-    # API key validation
-    api_key = request.headers.get('X-API-KEY')
-    if api_key != API_KEY:
+    # API key validation (once per request, also for batches)
+    if not require_api_key(request):
         return jsonify({"ok": False, "error": "Invalid API key"}), 403
 
-    data = request.get_json()
+    body, status = handle_invoke(request.get_json(silent=True))
+    return jsonify(body), status
 
-    # Basic payload validation
-    if not data or "tool" not in data or "action" not in data:
-        return jsonify({"ok": False, "error": "Invalid payload"}), 400
+@app.route('/stream', methods=['GET'])
+def stream():
+    # Server-Sent Events of a token's position/ETA (?since=<version> for long-poll)
+    if not (require_api_key(request) or request.args.get('key') == API_KEY):
+        return jsonify({"ok": False, "error": "Invalid API key"}), 403
+    sub, err = stream_request(request.args)
+    if err:
+        return jsonify(err[0]), err[1]
+    token, domain, since = sub
+    if since is not None or request.args.get('mode') == 'poll':
+        return jsonify({"ok": True, **long_poll(hub, domain, token_status, token, since)})
+    return Response(stream_events(hub, domain, token_status, token), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def create_asgi_app():
+    """Same routes served on asyncio (see asgi_server.py)."""
+    from asgi_server import ASGIApp, StreamingResponse, run_invoke
 
-    tool = data["tool"]
-    action = data["action"]
-    payload = data.get("payload", {})
+    async def a_invoke(req):
+        if not require_api_key(req):
+            return {"ok": False, "error": "Invalid API key"}, 403
+        data = req.get_json(silent=True)
+        # simulations run in an executor so they do not stall other connections
+        return await run_invoke(data, lambda: handle_invoke(data), COMPUTE_ACTIONS)
 
-    # Simulate reservation action
-    if action == "reserve":
-        eta_min = int(payload.get("eta_min", 0))
-        token = generate_token()
-        return jsonify({
-            "eta_min": eta_min,
-            "ok": True,
-            "token": token,
-            "type": "reservation"
-        })
+    async def a_stream(req):
+        if not (require_api_key(req) or req.args.get('key') == API_KEY):
+            return {"ok": False, "error": "Invalid API key"}, 403
+        sub, err = stream_request(req.args)
+        if err:
+            return err
+        token, domain, since = sub
+        if since is not None or req.args.get('mode') == 'poll':
+            return {"ok": True, **(await async_long_poll(hub, domain, token_status, token, since))}, 200
+        return StreamingResponse(async_stream_events(hub, domain, token_status, token))
 
-    return jsonify({"ok": False, "error": "Unknown action"}), 400
+    return ASGIApp({("POST", "/invoke"): a_invoke, ("POST", "/invoke/invoke"): a_invoke,
+                    ("GET", "/stream"): a_stream}, metrics=metrics)
 
 
 if __name__ == '__main__':
-    app.run(host="0.0.0.0", port=8080)
+    # python server.py --asgi  -> asyncio mode (needs uvicorn)
+    if "--asgi" in sys.argv:
+        import asgi_server
+        asgi_server.run(create_asgi_app(), host="0.0.0.0", port=PORT)
+    else:
+        app.run(host="0.0.0.0", port=PORT)
@@ -0,0 +1,52 @@
+import json
+import time
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shard_state (
+    shard INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (shard, name)
+);
+"""
+
+
+class SharedStore:
+    """
+    Small key/value table shared by the worker processes of one box (SQLite, WAL).
+
+    Every worker writes only its own rows (shard, name), so writers never
+    contend on a row; readers such as the leaderboard read all shards' rows
+    and merge them. WAL lets those reads run while another process writes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def put(self, shard, name, value):
+        data = json.dumps(value, separators=(",", ":"))
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO shard_state (shard, name, value, updated) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (shard, name) DO UPDATE SET value = excluded.value, updated = excluded.updated",
+                    (shard, name, data, time.time()))
+
+    def get_all(self, name, shards=None):
+        """{shard: value} for one name, optionally limited to the given shards."""
+        with self._lock:
+            rows = self._conn.execute("SELECT shard, value FROM shard_state WHERE name = ?", (name,)).fetchall()
+        wanted = None if shards is None else set(shards)
+        return {s: json.loads(v) for s, v in rows if wanted is None or s in wanted}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
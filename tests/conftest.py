@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+import asyncio
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+API_KEY = "testkey123"
+SMALL_KEY = "smallkey"  # default per-key quotas (admission.DEFAULT_KEY_QUOTA)
+UNLIMITED = {"rate": 1e6, "burst": 1e6, "tool_rate": 1e6, "tool_burst": 1e6}
+# the old single-file usage log, migrated into the journal when the server starts
+LEGACY_CALLS = [{"ts": 1700000000 + i, "tool": "legacy_tool", "action": "reserve"} for i in range(5)]
+
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    """mcp_server, imported with its journal, databases and keys in a temporary directory."""
+    tmp = tmp_path_factory.mktemp("mcp")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(tmp)
+        (tmp / "mcp_usage.json").write_text(json.dumps({"calls": LEGACY_CALLS, "counts": {"legacy_tool": 5}}))
+        mp.setenv("MCP_USAGE_DIR", str(tmp / "usage.d"))
+        mp.setenv("MCP_REPORTS_DB", str(tmp / "reports.db"))
+        mp.setenv("MCP_API_KEYS", json.dumps({API_KEY: UNLIMITED, SMALL_KEY: {}}))
+        mp.setenv("MCP_GLOBAL_QUOTA", json.dumps({"rate": 1e6, "burst": 1e6}))
+        mp.delenv("MCP_CAPTURE", raising=False)
+        import mcp_server
+        yield mcp_server
+
+
+class FlaskClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        r = self.client.open(path, method=method, json=body, headers=headers or {})
+        return r.status_code, {k.lower(): v for k, v in r.headers.items()}, r.get_json(silent=True)
+
+
+class ASGIClient:
+    """Drives the ASGI app directly: one http scope per request, on one event loop."""
+
+    def __init__(self, app):
+        self.app = app
+        self.loop = asyncio.new_event_loop()
+
+    def request(self, method, path, body=None, headers=None):
+        path, _, query = path.partition("?")
+        raw = json.dumps(body).encode("utf-8") if body is not None else b""
+        scope = {"type": "http", "method": method, "path": path, "query_string": query.encode("latin-1"),
+                 "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in (headers or {}).items()]}
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": raw, "more_body": False}
+
+        async def send(msg):
+            sent.append(msg)
+
+        self.loop.run_until_complete(self.app(scope, receive, send))
+        start = sent[0]
+        data = b"".join(m.get("body", b"") for m in sent[1:])
+        resp_headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in start["headers"]}
+        try:
+            parsed = json.loads(data) if data else None
+        except ValueError:
+            parsed = None
+        return start["status"], resp_headers, parsed
+
+    def close(self):
+        self.loop.close()
+
+
+def runs_off_loop(app, headers, body, release, method="POST", path="/invoke"):
+    """
+    Send body to the ASGI app's path while its handler is held until release
+    is set. Returns (whether the event loop kept running meanwhile, status).
+    """
+    async def scenario():
+        path_only, _, query = path.partition("?")
+        scope = {"type": "http", "method": method, "path": path_only, "query_string": query.encode("latin-1"),
+                 "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()]}
+        raw = json.dumps(body).encode("utf-8") if body is not None else b""
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": raw, "more_body": False}
+
+        async def send(msg):
+            sent.append(msg)
+
+        task = asyncio.ensure_future(app(scope, receive, send))
+        await asyncio.sleep(0.05)
+        running = not task.done()
+        release.set()
+        await asyncio.wait_for(task, 5)
+        return running, sent[0]["status"]
+
+    return asyncio.run(scenario())
+
+
+@pytest.fixture(scope="session")
+def flask_client(server):
+    return FlaskClient(server.app)
+
+
+@pytest.fixture(scope="session")
+def asgi_client(server):
+    client = ASGIClient(server.create_asgi_app())
+    yield client
+    client.close()
+
+
+@pytest.fixture(params=["flask", "asgi"])
+def client(request):
+    """The same API tests run against the Flask app and the ASGI app."""
+    return request.getfixturevalue(f"{request.param}_client")
+
+
+@pytest.fixture(scope="session")
+def plain_server():
+    """server.py, the single-key server without journal or admission control."""
+    import server
+    return server
+
+
+@pytest.fixture(scope="session")
+def plain_flask_client(plain_server):
+    return FlaskClient(plain_server.app)
+
+
+@pytest.fixture(scope="session")
+def plain_asgi_client(plain_server):
+    client = ASGIClient(plain_server.create_asgi_app())
+    yield client
+    client.close()
+
+
+@pytest.fixture(params=["flask", "asgi"])
+def plain_client(request):
+    return request.getfixturevalue(f"plain_{request.param}_client")
@@ -0,0 +1,43 @@
+from admission import AdmissionController, DEFAULT_KEY_QUOTA, load_keys
+
+
+def controller(**quota):
+    return AdmissionController({"k": dict(DEFAULT_KEY_QUOTA, **quota)})
+
+
+def test_routine_calls_leave_the_emergency_reserve():
+    ac = controller(tool_rate=0.001)
+    assert ac.admit("k", ["t"] * 40) == (True, 0.0)
+    ok, wait = ac.admit("k", ["t"])
+    assert not ok and wait > 0
+    assert ac.admit("k", ["t"] * 10, emergency=True) == (True, 0.0)
+    assert not ac.admit("k", ["t"], emergency=True)[0]
+
+
+def test_tools_have_separate_buckets():
+    ac = controller(tool_rate=0.001)
+    assert ac.admit("k", ["a"] * 40)[0]
+    assert ac.admit("k", ["b"] * 40)[0]
+    assert not ac.admit("k", ["a"])[0]
+
+
+def test_request_larger_than_any_bucket_gets_no_retry_time():
+    ac = controller()
+    assert ac.admit("k", ["t"] * 41) == (False, None)
+    assert ac.max_calls("k", ["t"]) == 40
+    assert ac.max_calls("k", ["t"], emergency=True) == 50
+    assert ac.admit("k", ["t"] * 50, emergency=True)[0]
+
+
+def test_share_splits_quotas_between_workers():
+    ac = AdmissionController({"k": dict(DEFAULT_KEY_QUOTA)}, share=0.5)
+    assert ac.max_calls("k", ["t"]) == 20
+
+
+def test_load_keys_fills_in_default_quotas(monkeypatch):
+    monkeypatch.setenv("MCP_API_KEYS", '{"a": {"rate": 5}, "b": null}')
+    keys = load_keys("default")
+    assert set(keys) == {"a", "b"}
+    assert keys["a"]["rate"] == 5 and keys["a"]["tool_burst"] == DEFAULT_KEY_QUOTA["tool_burst"]
+    monkeypatch.delenv("MCP_API_KEYS")
+    assert set(load_keys("default")) == {"default"}
@@ -0,0 +1,170 @@
+import uuid
+import threading
+
+from conftest import API_KEY, SMALL_KEY, runs_off_loop
+
+HEADERS = {"X-API-KEY": API_KEY}
+
+
+def domain():
+    return "test-" + uuid.uuid4().hex[:12]
+
+
+def invoke(client, body, headers=HEADERS):
+    return client.request("POST", "/invoke", body, headers)
+
+
+def call(action, **payload):
+    return {"tool": "q_intelli", "action": action, "payload": payload}
+
+
+def test_health(client):
+    status, _, body = client.request("GET", "/health")
+    assert status == 200 and body["ok"] is True
+
+
+def test_invoke_requires_api_key(client):
+    status, _, body = invoke(client, call("reserve", domain=domain()), {"X-API-KEY": "wrong"})
+    assert status == 401 and body["ok"] is False
+
+
+def test_reserve_returns_token_and_position(client):
+    d = domain()
+    _, _, first = invoke(client, call("reserve", domain=d))
+    status, _, second = invoke(client, call("reserve", domain=d))
+    assert status == 200 and second["type"] == "reservation"
+    assert (first["position"], second["position"]) == (0, 1)
+    assert first["token"] != second["token"]
+
+
+def test_urgent_reservation_goes_ahead(client):
+    d = domain()
+    _, _, routine = invoke(client, call("reserve", domain=d))
+    _, _, urgent = invoke(client, call("reserve", domain=d, urgency=3))
+    assert urgent["position"] == 0
+    _, _, pos = invoke(client, call("position", token=routine["token"]))
+    assert pos["position"] == 1
+    _, _, called = invoke(client, call("call_next", domain=d))
+    assert called["token"] == urgent["token"]
+
+
+def test_status_of_waiting_and_unknown_tokens(client):
+    _, _, res = invoke(client, call("reserve", domain=domain()))
+    status, _, body = invoke(client, call("status", token=res["token"]))
+    assert status == 200 and body["valid"] is True and body["state"] == "waiting" and body["position"] == 0
+    status, _, body = invoke(client, call("status", token="NOSUCHTOKEN"))
+    assert status == 200 and body["valid"] is False
+
+
+def test_batch_results_in_order(client):
+    d = domain()
+    status, _, body = invoke(client, {"batch": [call("reserve", domain=d), "not an item", call("reserve", domain=d)]})
+    assert status == 200 and body["type"] == "batch"
+    assert [r["status"] for r in body["results"]] == [200, 400, 200]
+    assert [body["results"][0]["position"], body["results"][2]["position"]] == [0, 1]
+    status, _, body = invoke(client, [call("status", token="NOSUCHTOKEN")])
+    assert status == 200 and body["results"][0]["valid"] is False
+
+
+def test_batch_limits(client, server):
+    status, _, body = invoke(client, {"batch": [call("status", token="X")] * (server.MAX_BATCH_ITEMS + 1)})
+    assert status == 413 and body["ok"] is False
+    status, _, body = invoke(client, {"batch": "nope"})
+    assert status == 400
+
+
+def test_batch_larger_than_quota_is_413_without_retry_after(client):
+    status, headers, body = invoke(client, {"batch": [call("status", token="X")] * 45}, {"X-API-KEY": SMALL_KEY})
+    assert status == 413 and body["max_calls"] == 40
+    assert "retry-after" not in headers
+
+
+def test_invalid_arguments_are_400(client):
+    for payload in ({"domain": ["bank"]}, {"domain": "x" * 65}, {"urgency": {"level": 3}}):
+        status, _, body = invoke(client, call("reserve", **payload))
+        assert status == 400 and body["ok"] is False
+    assert invoke(client, call("call_next", domain=domain(), desk="two"))[0] == 400
+    assert invoke(client, call("estimate", domain="bank", people=-1))[0] == 400
+    assert invoke(client, call("no_such_action"))[0] == 400
+    assert invoke(client, {"tool": "q_intelli", "payload": "x"})[0] == 400
+
+
+def test_position_of_unknown_token_is_404(client):
+    assert invoke(client, call("position", token="NOSUCHTOKEN"))[0] == 404
+
+
+def test_idempotency_key_replays_the_first_response(client):
+    headers = dict(HEADERS, **{"Idempotency-Key": uuid.uuid4().hex})
+    body = call("reserve", domain=domain())
+    _, first_headers, first = invoke(client, body, headers)
+    status, again_headers, again = invoke(client, body, headers)
+    assert status == 200 and again["token"] == first["token"]
+    assert "idempotent-replayed" not in first_headers and again_headers["idempotent-replayed"] == "true"
+    status, _, _ = invoke(client, call("reserve", domain=domain()), headers)
+    assert status == 422
+
+
+def test_batch_item_key_replays_its_single_answer(client):
+    key = uuid.uuid4().hex
+    item = call("reserve", domain=domain())
+    _, _, first = invoke(client, item, dict(HEADERS, **{"Idempotency-Key": key}))
+    status, _, body = invoke(client, [dict(item, idempotency_key=key), call("reserve", domain=domain()),
+                                      dict(item, idempotency_key="x" * 300)])
+    assert status == 200
+    replay, fresh, bad = body["results"]
+    assert replay["token"] == first["token"] and fresh["token"] != first["token"]
+    assert bad["status"] == 400 and "idempotency_key" in bad["error"]
+    # another key's item with the same key is a different booking
+    _, _, other = invoke(client, [dict(item, idempotency_key=key)], {"X-API-KEY": SMALL_KEY})
+    assert other["results"][0]["token"] != first["token"]
+
+
+def test_leaderboard_keeps_migrated_usage(client):
+    status, _, body = client.request("GET", "/leaderboard.json?window=all")
+    assert status == 200 and body["tools"]["legacy_tool"] == 5
+    assert body["actions"]["legacy_tool/reserve"] == 5
+    status, _, _ = client.request("GET", "/leaderboard")
+    assert status == 200
+
+
+def test_report_validates_people_and_ts(client):
+    status, _, body = invoke(client, call("report", domain="bank", people=4))
+    assert status == 200 and body["reports"] >= 1
+    for ts in ("nan", "inf", 1e300, -5, "soon"):
+        status, _, body = invoke(client, call("report", domain="bank", people=4, ts=ts))
+        assert status == 400 and "ts" in body["error"]
+    for people in (-1, 10 ** 9, "many"):
+        status, _, body = invoke(client, call("report", domain="bank", people=people))
+        assert status == 400 and "people" in body["error"]
+
+
+def test_asgi_runs_simulate_and_report_off_the_event_loop(server, monkeypatch):
+    import queue_actions
+    release = threading.Event()
+
+    def slow_simulate(*args, **kwargs):
+        release.wait(5)
+        return {"model": "mmc"}
+
+    def slow_add(*args, **kwargs):
+        release.wait(5)
+    app = server.create_asgi_app()
+    monkeypatch.setattr(queue_actions, "simulate", slow_simulate)
+    assert runs_off_loop(app, HEADERS, call("simulate", domain="bank"), release) == (True, 200)
+    release.clear()
+    monkeypatch.setattr(server.reports, "add", slow_add)
+    assert runs_off_loop(app, HEADERS, call("report", domain="bank", people=1), release) == (True, 200)
+
+
+def test_asgi_reads_leaderboard_totals_off_the_event_loop(server, monkeypatch):
+    release = threading.Event()
+    usage_totals = server.usage_totals
+
+    def slow_totals(window):
+        release.wait(5)  # as the shared store's SQLite read in multi-worker mode
+        return usage_totals(window)
+    app = server.create_asgi_app()
+    monkeypatch.setattr(server, "usage_totals", slow_totals)
+    for path in ("/leaderboard.json?window=1h", "/leaderboard"):
+        release.clear()
+        assert runs_off_loop(app, {}, None, release, "GET", path) == (True, 200)
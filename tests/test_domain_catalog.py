@@ -0,0 +1,44 @@
+import os
+import json
+
+import pytest
+
+from domain_catalog import Catalog, etag_matches
+
+
+def write(data_dir, name, info):
+    (data_dir / f"{name}.json").write_text(json.dumps(info))
+
+
+def bump(data_dir, name, info):
+    write(data_dir, name, info)
+    path = data_dir / f"{name}.json"
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+
+def test_reload_publishes_a_new_snapshot(tmp_path):
+    write(tmp_path, "bank", {"avg_service_time_mins": 4})
+    seen = []
+    catalog = Catalog(str(tmp_path), on_reload=seen.append)
+    assert catalog.snapshot.service_times() == {"bank": 4.0}
+    assert not catalog.reload()
+    bump(tmp_path, "bank", {"avg_service_time_mins": 6})
+    assert catalog.reload() and catalog.snapshot.version == 2
+    assert seen[0].service_times() == {"bank": 6.0}
+    assert etag_matches(catalog.snapshot.etag, catalog.snapshot.etag)
+
+
+@pytest.mark.parametrize("bad", [0, -2, "five", None, True])
+def test_invalid_service_time_keeps_the_previous_snapshot(tmp_path, bad):
+    write(tmp_path, "bank", {"avg_service_time_mins": 4})
+    catalog = Catalog(str(tmp_path))
+    bump(tmp_path, "bank", {"avg_service_time_mins": bad})
+    assert not catalog.reload()
+    assert catalog.snapshot.version == 1 and catalog.snapshot.service_times() == {"bank": 4.0}
+
+
+def test_invalid_service_time_is_refused_at_startup(tmp_path):
+    write(tmp_path, "bank", {"avg_service_time_mins": 0})
+    with pytest.raises(ValueError, match="bank.json"):
+        Catalog(str(tmp_path))
@@ -0,0 +1,47 @@
+import time
+
+from forecast import Forecaster
+from report_store import ReportStore
+
+
+def at(hour, day=1):
+    """Local epoch time on day `day` of January 2024 (the 1st is a Monday)."""
+    return time.mktime((2024, 1, day, hour, 30, 0, 0, 0, -1))
+
+
+def busy_mondays(store):
+    for week in range(3):
+        for hour in range(24):
+            people = 2 if hour == 6 else 50 if 9 <= hour <= 17 else 10
+            store.add("bank", people, at(hour, 1 + 7 * week))
+
+
+def test_least_busy_hour_comes_first(tmp_path):
+    store = ReportStore(str(tmp_path / "r.db"))
+    busy_mondays(store)
+    f = Forecaster(store)
+    res = f.forecast("bank", now=at(5), hours=24, count=2)
+    assert res["reports"] == 72 and res["now"]["hour"] == 5
+    first, second = res["best"]
+    assert (first["day"], first["hour"], first["starts_in_hours"]) == ("Mon", 6, 1)
+    assert first["expected_people"] < second["expected_people"] <= res["now"]["expected_people"]
+    assert all(s["starts_in_hours"] < 24 for s in res["best"])
+    assert f.forecast("nowhere")["best"] == [] and f.expected_now("nowhere") is None
+
+
+def test_sparse_cells_lean_on_their_hour(tmp_path):
+    store = ReportStore(str(tmp_path / "r.db"))
+    busy_mondays(store)
+    f = Forecaster(store)
+    # no Tuesday reports: Tuesday 06:00 borrows Monday's quiet hour, 12:00 its rush
+    assert f.expected_now("bank", at(6, 2)) < f.expected_now("bank", at(12, 2))
+
+
+def test_profile_is_rebuilt_only_after_new_reports(tmp_path):
+    store = ReportStore(str(tmp_path / "r.db"))
+    busy_mondays(store)
+    f = Forecaster(store)
+    p = f.profile("bank")
+    assert f.profile("bank") is p
+    store.add("bank", 100, at(6))
+    assert f.profile("bank") is not p and f.profile("bank").total == 73
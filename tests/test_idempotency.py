@@ -0,0 +1,67 @@
+import threading
+
+from idempotency import IdempotencyCache, fingerprint
+
+
+def test_first_response_is_replayed():
+    cache = IdempotencyCache()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return {"token": f"T{len(calls)}"}, 200
+
+    fp = fingerprint({"a": 1})
+    assert cache.run("k", fp, fn) == (({"token": "T1"}, 200), False)
+    assert cache.run("k", fp, fn) == (({"token": "T1"}, 200), True)
+    assert len(calls) == 1
+
+
+def test_key_reused_for_another_body_is_422():
+    cache = IdempotencyCache()
+    cache.run("k", fingerprint({"a": 1}), lambda: ({}, 200))
+    (body, status), replayed = cache.run("k", fingerprint({"a": 2}), lambda: ({}, 200))
+    assert status == 422 and not replayed
+
+
+def test_transient_failures_are_not_kept():
+    cache = IdempotencyCache()
+    fp = fingerprint({})
+    cache.run("k", fp, lambda: ({"error": "rate limited"}, 429))
+    assert cache.run("k", fp, lambda: ({"ok": True}, 200)) == (({"ok": True}, 200), False)
+
+
+def test_expired_and_evicted_entries_run_again():
+    cache = IdempotencyCache(ttl=0, max_entries=1)
+    fp = fingerprint({})
+    cache.run("k", fp, lambda: ({"n": 1}, 200))
+    assert cache.run("k", fp, lambda: ({"n": 2}, 200))[1] is False
+    cache = IdempotencyCache(max_entries=1)
+    cache.run("a", fp, lambda: ({"n": 1}, 200))
+    cache.run("b", fp, lambda: ({"n": 2}, 200))
+    assert len(cache) == 1
+    assert cache.run("a", fp, lambda: ({"n": 3}, 200)) == (({"n": 3}, 200), False)
+
+
+def test_concurrent_duplicate_waits_for_the_first():
+    cache = IdempotencyCache()
+    fp = fingerprint({})
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"n": 1}, 200
+
+    first = threading.Thread(target=cache.run, args=("k", fp, slow))
+    first.start()
+    started.wait(5)
+    result = []
+    dup = threading.Thread(target=lambda: result.append(cache.run("k", fp, slow)))
+    dup.start()
+    release.set()
+    first.join()
+    dup.join()
+    assert result == [(({"n": 1}, 200), True)] and len(calls) == 1
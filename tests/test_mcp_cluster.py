@@ -0,0 +1,96 @@
+import asyncio
+import socket
+
+from mcp_cluster import HashRing, Shard, route_key
+
+
+def shard(index=0, count=3, port_base=None):
+    return Shard(index, count, port_base or free_port(), "secret")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def call(action, **payload):
+    return {"tool": "q_intelli", "action": action, "payload": payload}
+
+
+def test_ring_is_stable_and_balanced():
+    ring = HashRing(range(4))
+    keys = [f"domain-{i}" for i in range(4000)]
+    owners = [ring.node_for(k) for k in keys]
+    again, grown = HashRing(range(4)), HashRing(range(5))
+    assert owners == [again.node_for(k) for k in keys]
+    assert all(600 < owners.count(n) < 1400 for n in range(4))
+    # a fifth worker takes keys only from the others, about a fifth of them
+    moved = [(a, b) for a, b in zip(owners, (grown.node_for(k) for k in keys)) if a != b]
+    assert all(b == 4 for _, b in moved) and 400 < len(moved) < 1300
+
+
+def test_route_key_uses_the_token_for_token_lookups():
+    assert route_key(call("reserve", domain="bank")) == "bank"
+    assert route_key(call("advice")) == "general"
+    assert route_key(call("position", token="ab12")) == "AB12"
+    assert route_key({"payload": "nope"}) is None and route_key([]) is None
+
+
+def test_tokens_are_issued_by_their_owner():
+    s = shard(index=1)
+    counter = iter(range(10 ** 6))
+    factory = s.token_factory(lambda: f"T{next(counter)}")
+    assert all(s.owner(factory()) == 1 for _ in range(50))
+
+
+def test_batch_is_split_by_owner_and_put_back_in_order():
+    s = shard(index=0)
+    items = [call("reserve", domain=f"d{i}") for i in range(30)]
+    owners = [s.owner(route_key(i)) for i in items]
+    assert len(set(owners)) == 3
+    seen = {}
+
+    async def local(part):
+        seen[0] = part
+        return {"ok": True, "results": [{"domain": i["payload"]["domain"], "status": 200} for i in part]}, 200
+
+    async def forward(owner, part, headers):
+        seen[owner] = part
+        if owner == 2:
+            return {"ok": False, "error": "shard 2 unavailable"}, 503
+        return {"ok": True, "results": [{"domain": i["payload"]["domain"], "status": 200} for i in part]}, 200
+    s.forward_invoke = forward
+
+    body, status = asyncio.run(s.dispatch(items, {}, local, 500))
+    assert status == 200 and sorted(seen) == [0, 1, 2]
+    for item, owner, res in zip(items, owners, body["results"]):
+        if owner == 2:
+            assert res["status"] == 503
+        else:
+            assert res["domain"] == item["payload"]["domain"]
+
+
+def test_single_call_goes_to_its_owner():
+    s = shard(index=0)
+    domain = next(f"d{i}" for i in range(100) if s.owner(f"d{i}") == 1)
+    routed = []
+
+    async def local(data):
+        routed.append("local")
+        return {}, 200
+
+    async def forward(owner, data, headers):
+        routed.append(owner)
+        return {}, 200
+    s.forward_invoke = forward
+    asyncio.run(s.dispatch(call("reserve", domain=domain), {}, local, 500))
+    asyncio.run(s.dispatch(call("reserve", domain=next(f"d{i}" for i in range(100) if s.owner(f"d{i}") == 0)),
+                           {}, local, 500))
+    assert routed == [1, "local"]
+
+
+def test_unreachable_peer_is_a_503():
+    s = shard(index=0, count=2)
+    body, status = asyncio.run(s.forward_invoke(1, call("reserve", domain="bank"), {}))
+    assert status == 503 and "shard 1 unavailable" in body["error"]
@@ -0,0 +1,176 @@
+import json
+import threading
+
+import pytest
+import requests
+
+from net_worker import BadReplyError, NetWorker
+
+
+class FakeResponse:
+    def __init__(self, status=200, body=None, text=None, headers=None):
+        self.status_code = status
+        self.text = text if text is not None else json.dumps(body)
+        self.headers = headers or {}
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class FakeSession:
+    """Scripted answers per URL (an exception is raised; the last answer repeats), all calls kept."""
+
+    def __init__(self, routes):
+        self.routes = {url: list(answers) for url, answers in routes.items()}
+        self.calls = []
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        self.calls.append((url, json, dict(headers or {})))
+        answers = self.routes[url]
+        answer = answers.pop(0) if len(answers) > 1 else answers[0]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+def ok(**body):
+    return FakeResponse(200, dict(body, ok=True))
+
+
+@pytest.fixture
+def worker(tmp_path, monkeypatch):
+    def make(routes, **kw):
+        session = FakeSession(routes)
+        monkeypatch.setattr(requests, "Session", lambda: session)
+        kw.setdefault("backoff", 0.01)
+        net = NetWorker(str(tmp_path / "outbox.jsonl"), **kw)
+        net.session = session
+        return net
+    return make
+
+
+def wait_for(results, n=1):
+    for _ in range(500):
+        if len(results) >= n:
+            return results
+        threading.Event().wait(0.01)
+    raise AssertionError(f"only {len(results)} of {n} results")
+
+
+def test_non_json_error_page_is_a_clear_error(worker):
+    net = worker({"/invoke": [FakeResponse(404, text="<html>Not Found</html>")]}).start()
+    errors = []
+    net.invoke("/invoke", {}, {"action": "reserve"}, on_error=errors.append)
+    wait_for(errors)
+    assert isinstance(errors[0], BadReplyError) and "404" in str(errors[0])
+    assert len(net.session.calls) == 1  # not retried
+
+
+def test_lookups_run_while_a_call_waits_for_its_retry(worker):
+    busy = FakeResponse(503, {"ok": False}, headers={"Retry-After": "0.5"})
+    net = worker({"/invoke": [busy, ok(token="T1")], "/lookup": [ok(type="nearest")]}).start()
+    results = []
+    net.invoke("/invoke", {}, {"action": "reserve"}, on_done=lambda d: results.append(("invoke", d)))
+    wait_for(net.session.calls)
+    net.lookup("/lookup", {}, {"action": "nearest"}, lambda d: results.append(("lookup", d)))
+    wait_for(results, 2)
+    assert [r[0] for r in results] == ["lookup", "invoke"]
+    assert results[1][1]["token"] == "T1"
+    # the retry carried the first attempt's Idempotency-Key
+    keys = [c[2]["Idempotency-Key"] for c in net.session.calls if c[0] == "/invoke"]
+    assert len(keys) == 2 and keys[0] == keys[1]
+
+
+def test_unreachable_reservation_goes_to_the_outbox(worker):
+    net = worker({"/invoke": [requests.ConnectionError("down")]}, retries=2).start()
+    offline = []
+    net.invoke("/invoke", {"X-API-KEY": "k"}, {"action": "reserve"}, outbox=True, on_offline=lambda: offline.append(1))
+    wait_for(offline)
+    assert len(net.session.calls) >= 3 and net.outbox_size() == 1  # 3 attempts, then flushes that fail too
+    assert NetWorker(net.outbox_path).outbox_size() == 1
+
+
+def outbox_entry(n, url="/invoke", key=True, **payload):
+    headers = {"X-API-KEY": "k", "Idempotency-Key": f"key-{n}"} if key else {"X-API-KEY": "k"}
+    return {"id": f"{n:04d}", "url": url, "headers": headers, "ts": 0,
+            "item": {"tool": "q_intelli", "action": "reserve", "payload": dict(payload, n=n)}}
+
+
+def flusher(tmp_path, routes, entries, **kw):
+    net = NetWorker(str(tmp_path / "outbox.jsonl"), **kw)
+    net._outbox = list(entries)
+    net._session = FakeSession(routes)
+    delivered = []
+    net.on_outbox_result = lambda entry, result: delivered.append((entry["id"], result))
+    return net, delivered
+
+
+def batch_reply(chunk_size):
+    return FakeResponse(200, {"ok": True, "type": "batch",
+                              "results": [{"ok": True, "status": 200, "i": i} for i in range(chunk_size)]})
+
+
+def test_flush_batches_keyed_entries_under_their_keys(tmp_path):
+    net, delivered = flusher(tmp_path, {"/invoke": [batch_reply(3)]}, [outbox_entry(n) for n in range(3)])
+    net._flush()
+    (url, body, headers), = net._session.calls
+    assert [item["idempotency_key"] for item in body] == ["key-0", "key-1", "key-2"]
+    assert headers["X-API-KEY"] == "k" and headers["Idempotency-Key"] not in ("key-0", "key-1", "key-2")
+    assert [(d[0], d[1]["i"]) for d in delivered] == [("0000", 0), ("0001", 1), ("0002", 2)]
+    assert net.outbox_size() == 0 and NetWorker(net.outbox_path).outbox_size() == 0
+
+
+def test_flush_shrinks_batches_after_413(tmp_path):
+    too_big = FakeResponse(413, {"ok": False, "max_calls": 2})
+    net, delivered = flusher(tmp_path, {"/invoke": [too_big, batch_reply(2), batch_reply(2), batch_reply(1)]},
+                             [outbox_entry(n) for n in range(5)])
+    net._flush()
+    assert [len(c[1]) for c in net._session.calls] == [5, 2, 2, 1]
+    assert net.batch_size == 2 and len(delivered) == 5 and net.outbox_size() == 0
+
+
+def test_flush_rejects_a_refused_batch_and_goes_on(tmp_path):
+    refused = FakeResponse(403, text="<html>Forbidden</html>")
+    entries = [outbox_entry(0, url="/bad"), outbox_entry(1), outbox_entry(2, key=False)]
+    net, delivered = flusher(tmp_path, {"/bad": [refused], "/invoke": [batch_reply(2)]}, entries)
+    net._flush()
+    assert net.outbox_size() == 0 and len(delivered) == 3
+    assert delivered[0][0] == "0000" and delivered[0][1]["status"] == 403 and "not JSON" in delivered[0][1]["error"]
+    rejected = [json.loads(line) for line in open(net.rejected_path)]
+    assert [(e["id"], e["reply"]["status"]) for e in rejected] == [("0000", 403)]
+    # the entry from before keys were kept goes without one
+    assert "idempotency_key" not in net._session.calls[1][1][1]
+
+
+@pytest.mark.parametrize("answer", [FakeResponse(503, {"ok": False}), FakeResponse(200, text="<html>portal</html>"),
+                                    requests.ConnectionError("down")])
+def test_flush_keeps_entries_while_the_server_is_away(tmp_path, answer):
+    net, delivered = flusher(tmp_path, {"/invoke": [answer]}, [outbox_entry(0)])
+    net._flush()
+    assert net.outbox_size() == 1 and not delivered and net._next_flush > 0
+
+
+class ServerSession:
+    """requests.Session look-alike posting to the Flask app."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        r = self.client.post(url, json=json, headers=headers)
+        return FakeResponse(r.status_code, text=r.get_data(as_text=True), headers=dict(r.headers))
+
+
+def test_flushed_entry_gets_the_booking_its_lost_answer_made(tmp_path, server):
+    from conftest import API_KEY
+    e = outbox_entry(0, domain="outbox-" + tmp_path.name)
+    e["headers"]["X-API-KEY"] = API_KEY
+    e["headers"]["Idempotency-Key"] = "lost-" + tmp_path.name
+    session = ServerSession(server.app)
+    first = session.post("/invoke", json=e["item"], headers=e["headers"]).json()  # booked, answer lost
+    net, delivered = flusher(tmp_path, {}, [e, outbox_entry(1, domain="outbox-" + tmp_path.name)])
+    net._outbox[1]["headers"] = dict(e["headers"], **{"Idempotency-Key": "new-" + tmp_path.name})
+    net._session = session
+    net._flush()
+    assert delivered[0][1]["token"] == first["token"]
+    assert delivered[1][1]["token"] != first["token"] and delivered[1][1]["position"] == 1
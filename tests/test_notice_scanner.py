@@ -0,0 +1,14 @@
+from notice_scanner import ScanCache
+
+
+def test_scan_cache_keeps_the_most_recently_used(tmp_path):
+    path = str(tmp_path / "scan.json")
+    cache = ScanCache(path, max_entries=2)
+    cache.put("a", 1, {"domain": "bank"})
+    cache.put("b", 1, {"domain": "clinic"})
+    assert cache.get("a", 1) == {"domain": "bank"}  # now b is the oldest
+    cache.put("c", 1, {"domain": "post"})
+    assert cache.get("b", 1) is None and list(cache.entries) == ["a", "c"]
+    assert cache.get("a", 2) is None  # another model version
+    cache.save()
+    assert list(ScanCache(path, max_entries=1).entries) == ["c"]
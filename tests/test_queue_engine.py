@@ -0,0 +1,60 @@
+import time
+import itertools
+
+from queue_engine import DomainQueue, QueueEngine, check_args, parse_urgency
+from token_registry import TokenRegistry
+
+
+def test_parse_urgency_snaps_to_known_levels():
+    assert parse_urgency("2 - High (must be quick)") == 2.0
+    assert parse_urgency(2.9) == 3.0
+    assert parse_urgency("urgent") == 1.0
+
+
+def test_check_args():
+    assert check_args({"domain": "bank", "urgency": 2, "desk": "3"}) is None
+    assert check_args({"domain": 5}) is not None
+    assert check_args({"urgency": [1]}) is not None
+    assert check_args({"desks": 1.5}) is not None
+
+
+def test_positions_follow_urgency_then_arrival():
+    q = DomainQueue("bank")
+    assert [q.enqueue(t, f) for t, f in (("A", 1), ("B", 1), ("C", 3), ("D", 2))] == [0, 1, 0, 1]
+    assert [q.position(t) for t in "ABCD"] == [2, 3, 0, 1]
+    assert [q.call_next()["token"] for _ in range(4)] == ["C", "D", "A", "B"]
+    assert q.call_next() is None and len(q) == 0
+
+
+def test_cancelled_reservations_leave_the_line():
+    q = DomainQueue("bank")
+    for t in "ABCD":
+        q.enqueue(t)
+    assert q.cancel("B") and not q.cancel("B")
+    assert [q.position(t) for t in "ACD"] == [0, 1, 2]
+    assert q.call_next()["token"] == "A"
+    assert q.call_next()["token"] == "C"
+    assert q.position("D") == 0
+
+
+def test_engine_tracks_tokens_and_desks():
+    tokens = (f"T{i}" for i in itertools.count())
+    changes = []
+    engine = QueueEngine({"bank": 4}, token_factory=lambda: next(tokens), on_change=changes.append)
+    first = engine.reserve("bank")
+    second = engine.reserve("bank")
+    assert (first["position"], second["eta_min"]) == (0, 4)
+    called = engine.call_next("bank", desk=2)
+    assert called["token"] == first["token"] and called["desk"] == 2 and called["waiting"] == 1
+    assert engine.position(first["token"]) is None
+    assert engine.position(second["token"])["position"] == 0
+    assert changes == ["bank"] * 3
+
+
+def test_expired_token_is_removed_from_its_queue():
+    registry = TokenRegistry(default_ttl=1)
+    engine = QueueEngine(registry=registry)
+    tok = engine.reserve("bank")["token"]
+    registry.lookup(tok, now=time.time() + 3)
+    assert engine.position(tok) is None
+    assert engine.call_next("bank") is None
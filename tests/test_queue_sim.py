@@ -0,0 +1,46 @@
+import pytest
+
+from queue_sim import MAX_STEPS, MAX_WALK_STEPS, MIN_WALK_SAMPLES, parse_mix, simulate
+
+
+def test_mmc_percentiles_are_ordered_and_cached():
+    res = simulate(10, 3.0, desks=2, samples=5000)
+    assert res["model"] == "mmc" and res["unserved"] == 0.0
+    assert res["p50"] <= res["p90"] <= res["p99"]
+    assert 12 < res["mean"] < 21  # 11 departures at 2 / 3 per minute: 16.5
+    assert simulate(10, 3.0, desks=2, samples=5000) == res
+
+
+def test_priority_without_jumps_matches_mmc():
+    mmc = simulate(20, 4.0, samples=5000, model="mmc")
+    prio = simulate(20, 4.0, urgency=3.0, arrivals_per_hour=30, mix={1: 1.0, 3: 1.0}, samples=5000)
+    assert prio["model"] == "priority" and prio["samples"] == 5000 and prio["unserved"] == 0.0
+    assert abs(prio["mean"] - mmc["mean"]) < 0.05 * mmc["mean"]
+
+
+def test_jumps_lengthen_the_wait():
+    calm = simulate(20, 4.0, samples=5000, model="mmc")
+    busy = simulate(20, 4.0, arrivals_per_hour=6, mix={1: 1.0, 3: 1.0}, samples=5000)
+    assert busy["mean"] > calm["mean"]
+
+
+def test_priority_work_is_bounded():
+    res = simulate(3000, 5.0, arrivals_per_hour=20, mix={1: 1.0, 3: 1.0}, samples=200000)
+    assert res["samples"] == max(MIN_WALK_SAMPLES, MAX_WALK_STEPS // MAX_STEPS)
+
+
+@pytest.mark.parametrize("service_mins", [0, -1, 0.00001, float("nan"), float("inf")])
+def test_service_time_must_be_positive(service_mins):
+    with pytest.raises(ValueError):
+        simulate(5, service_mins)
+
+
+def test_unknown_model_is_rejected():
+    with pytest.raises(ValueError):
+        simulate(5, 3.0, model="fifo")
+
+
+def test_parse_mix():
+    assert parse_mix("1:0.7,3:0.1,2.9:0.2") == {1.0: 0.7, 3.0: 0.30000000000000004}
+    assert parse_mix({"1.4": 1}) == {1.5: 1.0}
+    assert parse_mix("") is None
@@ -0,0 +1,60 @@
+import json
+import time
+import zlib
+
+import pytest
+
+from report_ingest import NDJSONReports, ingest_stream, parse_report
+from report_store import ReportStore
+
+NOW = time.time()
+
+
+def line(**fields):
+    r = {"kiosk": "k1", "seq": 1, "domain": "bank", "people": 5, "ts": NOW}
+    r.update(fields)
+    return json.dumps(r)
+
+
+def gzipped(text):
+    c = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return c.compress(text.encode("utf-8")) + c.flush()
+
+
+@pytest.mark.parametrize("fields", [
+    {"ts": float("nan")}, {"ts": float("inf")}, {"ts": 1e300}, {"ts": "soon"}, {"ts": 0},
+    {"people": -1}, {"people": 10 ** 9}, {"people": float("inf")},
+    {"seq": 0}, {"seq": 2 ** 63}, {"domain": ""}, {"domain": 7}, {"kiosk": ""},
+])
+def test_parse_report_drops_bad_fields(fields):
+    assert parse_report(json.loads(line(**fields))) is None
+
+
+def test_parse_report_accepts_a_report_without_ts():
+    assert parse_report({"kiosk": "k", "seq": "3", "domain": "bank", "people": "2"}) == ("k", 3, "bank", 2, None)
+
+
+def test_lines_split_across_chunks_and_gzip():
+    body = "\n".join(line(seq=i) for i in range(1, 4)) + "\n"
+    parser = NDJSONReports()
+    rows = parser.feed(body[:30].encode()) + parser.feed(body[30:].encode()) + parser.close()
+    assert [r[1] for r in rows] == [1, 2, 3]
+    parser = NDJSONReports(gzip=True)
+    data = gzipped(body)
+    rows = parser.feed(data[:10]) + parser.feed(data[10:]) + parser.close()
+    assert [r[1] for r in rows] == [1, 2, 3] and parser.max_seq == {"k1": 3}
+    parser = NDJSONReports(gzip=True)
+    parser.feed(data[:-4])
+    with pytest.raises(ValueError):
+        parser.close()
+
+
+def test_poisoned_line_is_counted_invalid_and_the_rest_stored(tmp_path):
+    store = ReportStore(str(tmp_path / "r.db"))
+    body = "\n".join([line(seq=1), line(seq=2, ts=float("nan")), "not json", line(seq=3, ts=1e300),
+                      line(seq=4, people=10 ** 30), line(seq=5)])
+    reply = ingest_stream(store, [body.encode()])
+    assert (reply["stored"], reply["invalid"], reply["acked"]) == (2, 4, {"k1": 5})
+    assert ingest_stream(store, [body.encode()])["duplicates"] == 2
+    assert store.report_count("bank") == 2
+    store.close()
@@ -0,0 +1,60 @@
+import uuid
+import threading
+
+from conftest import runs_off_loop
+
+HEADERS = {"X-API-KEY": "supersecret123"}
+
+
+def call(action, **payload):
+    return {"tool": "q", "action": action, "payload": payload}
+
+
+def invoke(client, body, headers=HEADERS):
+    return client.request("POST", "/invoke", body, headers)
+
+
+def test_api_key_is_required(plain_client):
+    assert invoke(plain_client, call("reserve"), {"X-API-KEY": "wrong"})[0] == 403
+
+
+def test_reserve_status_and_call_next(plain_client):
+    d = "test-" + uuid.uuid4().hex[:12]
+    _, _, first = invoke(plain_client, call("reserve", domain=d))
+    _, _, urgent = invoke(plain_client, call("reserve", domain=d, urgency=3))
+    assert (first["position"], urgent["position"]) == (0, 0)
+    _, _, status = invoke(plain_client, call("status", token=first["token"]))
+    assert status["state"] == "waiting" and status["position"] == 1
+    _, _, called = invoke(plain_client, call("call_next", domain=d))
+    assert called["token"] == urgent["token"]
+
+
+def test_batch_and_errors(plain_client, plain_server):
+    status, _, body = invoke(plain_client, [call("estimate", domain="bank", people=4), {"action": "x"},
+                                            call("simulate", domain="bank", people=3, samples=500)])
+    assert status == 200 and [r["status"] for r in body["results"]] == [200, 400, 200]
+    assert body["results"][2]["type"] == "simulate"
+    assert invoke(plain_client, [call("status")] * (plain_server.MAX_BATCH_ITEMS + 1))[0] == 413
+    assert invoke(plain_client, call("estimate", people=-1))[0] == 400
+    assert invoke(plain_client, call("simulate", people=1e400))[0] == 400
+    assert invoke(plain_client, call("reserve", domain=["x"]))[0] == 400
+    assert invoke(plain_client, call("nope"))[0] == 400
+
+
+def test_stream_long_poll(plain_client):
+    _, _, res = invoke(plain_client, call("reserve", domain="test-" + uuid.uuid4().hex[:12]))
+    status, _, body = plain_client.request("GET", f"/stream?token={res['token']}&since=0", headers=HEADERS)
+    assert status == 200 and body["position"] == 0
+    assert plain_client.request("GET", "/stream?token=NOSUCH&since=0", headers=HEADERS)[0] == 404
+
+
+def test_asgi_simulate_runs_off_the_event_loop(plain_server, monkeypatch):
+    """A slow simulate must not block the loop: another coroutine keeps running meanwhile."""
+    import queue_actions
+    release = threading.Event()
+
+    def slow_simulate(*args, **kwargs):
+        release.wait(5)
+        return {"model": "mmc"}
+    monkeypatch.setattr(queue_actions, "simulate", slow_simulate)
+    assert runs_off_loop(plain_server.create_asgi_app(), HEADERS, call("simulate"), release) == (True, 200)
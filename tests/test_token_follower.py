@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+import requests
+
+from queue_identifier import TokenFollower
+
+
+class FakeStream:
+    """Streaming response whose iter_lines blocks between lines until close()."""
+
+    def __init__(self, lines, hold=False):
+        self.lines = lines
+        self.hold = hold
+        self.closed = threading.Event()
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self, decode_unicode=False):
+        for line in self.lines:
+            yield line
+        if self.hold:
+            self.closed.wait(5)
+            raise requests.ConnectionError("closed")
+
+    def close(self):
+        self.closed.set()
+
+
+def follow(monkeypatch, stream, **kw):
+    monkeypatch.setattr(requests, "get", lambda *a, **k: stream)
+    seen, failed, done = [], [], threading.Event()
+    f = TokenFollower("http://x/", "T1", "k", seen.append, lambda: failed.append(1), **kw)
+    orig = f._run
+    f._run = lambda: (orig(), done.set())
+    return f, seen, failed, done
+
+
+def test_updates_until_the_token_leaves_the_queue(monkeypatch):
+    stream = FakeStream([": hi", 'data: {"state": "waiting", "position": 2}', "",
+                         'data: {"state": "called"}', 'data: {"state": "waiting"}'])
+    f, seen, failed, done = follow(monkeypatch, stream)
+    f.start()
+    assert done.wait(5)
+    assert [s["state"] for s in seen] == ["waiting", "called"]
+    assert not failed and stream.closed.is_set()
+
+
+def test_stop_closes_the_stream_and_silences_callbacks(monkeypatch):
+    stream = FakeStream(['data: {"state": "waiting"}'], hold=True)
+    f, seen, failed, done = follow(monkeypatch, stream)
+    f.start()
+    for _ in range(500):
+        if seen:
+            break
+        threading.Event().wait(0.01)
+    f.stop()
+    assert done.wait(1) and stream.closed.is_set()
+    assert len(seen) == 1 and not failed
+
+
+def test_stop_before_connect_never_reads(monkeypatch):
+    stream = FakeStream(['data: {"state": "waiting"}'])
+    f, seen, failed, done = follow(monkeypatch, stream)
+    f.stop()
+    f.start()
+    assert done.wait(5)
+    assert not seen and not failed and stream.closed.is_set()
+
+
+@pytest.mark.parametrize("err", [requests.ConnectionError("down"), ValueError("bad json")])
+def test_failure_falls_back(monkeypatch, err):
+    def boom(*a, **k):
+        raise err
+    f, seen, failed, done = follow(monkeypatch, None)
+    monkeypatch.setattr(requests, "get", boom)
+    f.start()
+    assert done.wait(5)
+    assert failed == [1] and not seen
@@ -0,0 +1,80 @@
+import json
+import asyncio
+import threading
+
+import token_stream
+from token_stream import StreamHub, async_stream_events, long_poll, stream_events
+
+
+def statuses(*states):
+    """status_fn returning the given states in turn (the last one repeats)."""
+    left = list(states)
+
+    def status_fn(token):
+        state = left.pop(0) if len(left) > 1 else left[0]
+        return {"valid": True, "token": token, "state": state}
+    return status_fn
+
+
+def events(chunks):
+    return [json.loads(c.split("data: ", 1)[1]) if "data: " in c else c for c in chunks]
+
+
+def test_wait_wakes_on_publish_and_times_out():
+    hub = StreamHub()
+    assert hub.wait("bank", 0, 0.01) == 0
+    threading.Timer(0.05, hub.publish, ("bank",)).start()
+    assert hub.wait("bank", 0, 5) == 1
+    assert hub.wait("bank", 0, 5) == 1  # already past `since`: at once
+    assert hub.version("clinic") == 0
+
+
+def test_async_waiters_of_one_loop_share_a_future():
+    hub = StreamHub()
+
+    async def scenario():
+        waiters = [asyncio.ensure_future(hub.async_wait("bank", 0, 5)) for _ in range(50)]
+        await asyncio.sleep(0.01)
+        assert len(hub._futures["bank"]) == 1
+        threading.Thread(target=hub.publish, args=("bank",)).start()
+        return await asyncio.gather(*waiters)
+
+    assert asyncio.run(scenario()) == [1] * 50
+
+
+def test_stream_ends_once_the_token_is_called(monkeypatch):
+    monkeypatch.setattr(token_stream, "MIN_UPDATE_SECS", 0)
+    monkeypatch.setattr(token_stream, "KEEPALIVE_SECS", 0.01)
+    hub = StreamHub()
+    gen = stream_events(hub, "bank", statuses("waiting", "waiting", "called"), "T1")
+    assert events([next(gen)])[0]["state"] == "waiting"
+    assert next(gen) == ": keep-alive\n\n"  # nothing changed
+    hub.publish("bank")
+    assert events([next(gen)])[0]["state"] == "waiting"
+    hub.publish("bank")
+    assert [e["state"] for e in events(list(gen))] == ["called"]
+
+
+def test_async_stream_matches_the_threaded_one(monkeypatch):
+    monkeypatch.setattr(token_stream, "MIN_UPDATE_SECS", 0)
+    hub = StreamHub()
+
+    async def scenario():
+        out = []
+        async for chunk in async_stream_events(hub, "bank", statuses("waiting", "served"), "T1"):
+            out.append(chunk)
+            if len(out) == 1:
+                asyncio.get_running_loop().call_later(0.01, hub.publish, "bank")
+        return out
+
+    assert [e["state"] for e in events(asyncio.run(scenario()))] == ["waiting", "served"]
+
+
+def test_long_poll_returns_the_new_version():
+    hub = StreamHub()
+    status_fn = statuses("waiting")
+    assert long_poll(hub, "bank", status_fn, "T1", None)["version"] == 0
+    hub.publish("bank")
+    res = long_poll(hub, "bank", status_fn, "T1", 0, timeout=5)
+    assert res["version"] == 1 and res["state"] == "waiting"
+    assert long_poll(hub, "bank", status_fn, "T1", 1, timeout=0.01)["version"] == 1
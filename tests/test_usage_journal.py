@@ -0,0 +1,46 @@
+import json
+
+from usage_journal import UsageJournal
+from usage_rollup import RollupEngine
+
+
+def legacy_file(tmp_path, n=5):
+    path = tmp_path / "mcp_usage.json"
+    calls = [{"ts": 1700000000 + i * 60, "tool": "t", "action": "reserve"} for i in range(n)]
+    path.write_text(json.dumps({"calls": calls, "counts": {"t": n}}))
+    return path
+
+
+def test_migration_keeps_counts_and_rollups(tmp_path):
+    path = legacy_file(tmp_path)
+    rollup = RollupEngine()
+    journal = UsageJournal(str(tmp_path / "j"), legacy_file=str(path), rollup=rollup)
+    try:
+        assert journal.counts == {"t": 5}
+        assert rollup.window("all", 1700000000)["tools"] == {"t": 5}
+        assert len(journal.recent_calls()) == 5
+    finally:
+        journal.close()
+    assert not path.exists() and (tmp_path / "mcp_usage.json.migrated").exists()
+
+    restarted = RollupEngine()
+    journal = UsageJournal(str(tmp_path / "j"), rollup=restarted)
+    try:
+        assert journal.counts == {"t": 5}
+        assert restarted.window("all", 1700000000)["actions"] == {"t/reserve": 5}
+    finally:
+        journal.close()
+
+
+def test_records_survive_a_restart(tmp_path):
+    journal = UsageJournal(str(tmp_path), rollup=RollupEngine())
+    journal.record("a", "reserve", ts=1700000000)
+    journal.record_many([("a", "status"), ("b", "reserve")], ts=1700000060)
+    journal.close()
+    rollup = RollupEngine()
+    journal = UsageJournal(str(tmp_path), rollup=rollup)
+    try:
+        assert journal.counts == {"a": 2, "b": 1}
+        assert rollup.window("all", 1700000060)["tools"] == {"a": 2, "b": 1}
+    finally:
+        journal.close()
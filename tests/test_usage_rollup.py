@@ -0,0 +1,34 @@
+from usage_rollup import RollupEngine
+
+T0 = 1700000000 - 1700000000 % 86400
+
+
+def test_windows_count_only_recent_calls():
+    r = RollupEngine()
+    r.add(T0, "q", "reserve")
+    r.add(T0 + 2 * 3600, "q", "reserve")
+    r.add(T0 + 2 * 3600 + 30, "q", "status")
+    now = T0 + 2 * 3600 + 60
+    assert r.window("5m", now) == {"tools": {"q": 2}, "actions": {"q/reserve": 1, "q/status": 1}}
+    assert r.window("24h", now)["tools"] == {"q": 3}
+    assert r.window("all", now)["actions"] == {"q/reserve": 2, "q/status": 1}
+    assert r.window("5m", now + 600) == {"tools": {}, "actions": {}}
+
+
+def test_late_records_go_to_the_latest_bucket():
+    r = RollupEngine()
+    r.add(T0 + 3600, "q", "reserve")
+    r.add(T0, "q", "reserve")
+    assert r.series("hour") == [(T0 + 3600, {"q/reserve": 2})]
+
+
+def test_export_and_load_round_trip():
+    r = RollupEngine()
+    for i in range(5):
+        r.add(T0 + i * 600, "q", "reserve")
+    restored = RollupEngine()
+    restored.load(r.export())
+    now = T0 + 4 * 600
+    for name in ("5m", "1h", "24h", "7d", "all"):
+        assert restored.window(name, now) == r.window(name, now)
+    assert restored.series("minute") == r.series("minute")
@@ -0,0 +1,69 @@
+import io
+import random
+
+import pytest
+
+from venue_index import CROWD_TTL, Venue, VenueIndex, _km, read_venues, synthetic_venues
+
+NOW = 1_700_000_000.0
+
+
+def brute_force(index, domain, lat, lon, k, max_km=None, speed_kmh=20.0, service_mins=None, people=None):
+    probe = Venue("probe", "probe", domain, lat, lon)
+    hits = []
+    for v in index.venues.values():
+        if v.domain != domain:
+            continue
+        km = _km(probe.rlat, probe.rlon, probe.coslat, v.rlat, v.rlon, v.coslat)
+        if max_km is not None and km > max_km:
+            continue
+        p = index.crowd(v.id, NOW)
+        p = people if p is None else p
+        wait = p * service_mins / v.desks if service_mins is not None and p is not None else None
+        hits.append((km * 60.0 / speed_kmh + (wait or 0.0), v.id))
+    return sorted(hits)[:k]
+
+
+@pytest.fixture(scope="module")
+def index():
+    idx = VenueIndex(synthetic_venues(3000, domains=("bank", "clinic")))
+    rnd = random.Random(7)
+    for vid in rnd.sample(sorted(idx.venues), 400):
+        idx.report(vid, rnd.randint(0, 60), NOW - rnd.uniform(0, 2 * CROWD_TTL))
+    return idx
+
+
+@pytest.mark.parametrize("lat,lon,kw", [
+    (13.08, 80.27, {}),
+    (13.08, 80.27, {"service_mins": 4.0, "people": 12}),
+    (21.0, 80.0, {"service_mins": 4.0, "people": None, "max_km": 300}),
+    (28.61, 77.21, {"service_mins": 10.0, "people": 3, "speed_kmh": 5.0}),
+])
+def test_nearest_matches_a_full_scan(index, lat, lon, kw):
+    hits = index.nearest("bank", lat, lon, k=7, now=NOW, **kw)
+    expected = brute_force(index, "bank", lat, lon, 7, **kw)
+    assert [h[3].id for h in hits] == [vid for _, vid in expected]
+    assert [round(h[0], 6) for h in hits] == [round(s, 6) for s, _ in expected]
+    assert all(h[3].domain == "bank" for h in hits)
+
+
+def test_crowded_venue_next_door_loses_to_a_quiet_one():
+    idx = VenueIndex([Venue("near", "near", "bank", 13.0, 80.0), Venue("far", "far", "bank", 13.0, 80.05)])
+    idx.report("near", 40, NOW)
+    idx.report("far", 0, NOW)
+    idx.report("near", 1, NOW - 60)  # older than the last report: ignored
+    assert [h[3].id for h in idx.nearest("bank", 13.0, 80.0, k=2, service_mins=5.0, now=NOW)] == ["far", "near"]
+    assert [h[3].id for h in idx.nearest("bank", 13.0, 80.0, k=2, now=NOW)] == ["near", "far"]
+    assert idx.crowd("near", NOW + CROWD_TTL + 1) is None
+    assert idx.nearest("train", 13.0, 80.0) == []
+
+
+def test_read_venues_skips_bad_rows():
+    csv = ("id,domain,name,lat,lon,desks\n"
+           "a,bank,A,13.0,80.0,2\n"
+           "b,bank,B,95.0,80.0,1\n"
+           ",bank,C,13.0,80.0,1\n"
+           "d,bank,D,north,80.0,1\n"
+           "e,clinic,,12.0,77.0,\n")
+    venues = list(read_venues(io.StringIO(csv)))
+    assert [(v.id, v.name, v.desks) for v in venues] == [("a", "A", 2), ("e", "e", 1)]
@@ -0,0 +1,133 @@
+import time
+import threading
+import uuid
+
+DEFAULT_TTL = 24 * 3600  # waiting tokens
+CALLED_TTL = 30 * 60  # grace period at the gate once a token was called
+
+
+def random_token():
+    return uuid.uuid4().hex[:8].upper()
+
+
+class TokenRegistry:
+    """
+    Issued tokens with O(1) lookup and timing-wheel expiry.
+
+    Every token sits in the wheel slot of its expiry second. The wheel is
+    advanced lazily on each call and only the slots for the seconds that passed
+    are visited, so expiring millions of tokens never needs a full scan; entries
+    whose expiry is more than one wheel turn away simply stay in their slot
+    until their round comes up. on_expire(token, record), if set, is called for
+    every token that expires (outside the registry lock).
+    """
+
+    def __init__(self, token_factory=None, default_ttl=DEFAULT_TTL, slots=65536):
+        self.token_factory = token_factory or random_token
+        self.default_ttl = default_ttl
+        self.slots = slots
+        self._wheel = {}  # slot -> {token: expiry tick}; slots are created on demand
+        self._tick = int(time.time())
+        self.tokens = {}  # token -> record dict
+        self.expired_count = 0
+        self.on_expire = None
+        self._lock = threading.Lock()
+
+    # ---------------------- wheel ---------------------- #
+    def _schedule(self, token, expires):
+        self._wheel.setdefault(int(expires) % self.slots, {})[token] = int(expires)
+
+    def _unschedule(self, token, expires):
+        slot = self._wheel.get(int(expires) % self.slots)
+        if slot is not None:
+            slot.pop(token, None)
+
+    def _advance(self, now):
+        """Expire the tokens of the seconds that passed; returns [(token, record)] for _notify()."""
+        now_tick = int(now)
+        if now_tick <= self._tick:
+            return ()
+        expired = []
+        # visit each slot at most once per advance, even after a long idle period
+        steps = min(now_tick - self._tick, self.slots)
+        for t in range(now_tick - steps + 1, now_tick + 1):
+            slot = self._wheel.get(t % self.slots)
+            if not slot:
+                continue
+            due = [tok for tok, exp in slot.items() if exp <= now_tick]
+            for tok in due:
+                del slot[tok]
+                rec = self.tokens.pop(tok, None)
+                if rec is not None:
+                    self.expired_count += 1
+                    expired.append((tok, rec))
+            if not slot:
+                del self._wheel[t % self.slots]
+        self._tick = now_tick
+        return expired
+
+    def _notify(self, expired):
+        if self.on_expire is not None:
+            for tok, rec in expired:
+                self.on_expire(tok, rec)
+
+    # ---------------------- API ---------------------- #
+    def allocate(self, ttl=None, now=None, **meta):
+        """Issue a new, never-colliding token with the given metadata."""
+        now = time.time() if now is None else now
+        expires = now + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            expired = self._advance(now)
+            token = self.token_factory()
+            while token in self.tokens:
+                token = self.token_factory()
+            self.tokens[token] = dict(meta, state="waiting", issued=now, expires=expires)
+            self._schedule(token, expires)
+        self._notify(expired)
+        return token
+
+    def lookup(self, token, now=None):
+        """Copy of the token's record, or None if unknown/expired. O(1)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = self._advance(now)
+            rec = self.tokens.get(token)
+            rec = None if rec is None or rec["expires"] <= now else dict(rec)
+        self._notify(expired)
+        return rec
+
+    def update(self, token, state, ttl=None, now=None, **meta):
+        """Change a token's state (and metadata), optionally restarting its TTL."""
+        now = time.time() if now is None else now
+        with self._lock:
+            rec = self.tokens.get(token)
+            if rec is None:
+                return False
+            rec.update(meta)
+            rec["state"] = state
+            if ttl is not None:
+                self._unschedule(token, rec["expires"])
+                rec["expires"] = now + ttl
+                self._schedule(token, rec["expires"])
+            return True
+
+    def revoke(self, token):
+        with self._lock:
+            rec = self.tokens.pop(token, None)
+            if rec is not None:
+                self._unschedule(token, rec["expires"])
+            return rec is not None
+
+    def status(self, token, now=None):
+        """Response body for the status/validate action."""
+        now = time.time() if now is None else now
+        rec = self.lookup(token, now)
+        if rec is None:
+            return {"token": token, "valid": False, "state": "unknown_or_expired"}
+        out = {"token": token, "valid": True, "state": rec["state"],
+               "expires_in": int(rec["expires"] - now)}
+        out.update({k: v for k, v in rec.items() if k not in ("state", "expires", "issued")})
+        return out
+
+    def __len__(self):
+        return len(self.tokens)
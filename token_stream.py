@@ -0,0 +1,125 @@
+import json
+import time
+import asyncio
+import threading
+
+KEEPALIVE_SECS = 15
+MIN_UPDATE_SECS = 1.0  # at most one pushed update per subscriber per second
+
+
+def sse_event(data, event=None):
+    msg = f"event: {event}\n" if event else ""
+    return msg + "data: " + json.dumps(data, separators=(",", ":")) + "\n\n"
+
+
+class StreamHub:
+    """
+    Change notifications per domain for token status streams.
+
+    The queue engine calls publish(domain) after each change. That bumps the
+    domain's version and wakes *one* shared waiter per domain: a Condition for
+    threaded (Flask) subscribers and one future per event loop for ASGI
+    subscribers, so a change costs the same whether 10 or 10,000 clients wait
+    on that domain. Each woken subscriber then does an O(1) position lookup.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._conds = {}
+        self._futures = {}  # domain -> {loop: future}
+
+    def version(self, domain):
+        return self._versions.get(domain, 0)
+
+    def publish(self, domain):
+        with self._lock:
+            self._versions[domain] = self._versions.get(domain, 0) + 1
+            cond = self._conds.get(domain)
+            futures = self._futures.pop(domain, None)
+        if cond is not None:
+            with cond:
+                cond.notify_all()
+        if futures:
+            for loop, fut in futures.items():
+                loop.call_soon_threadsafe(_resolve, fut)
+
+    def wait(self, domain, since, timeout):
+        """Block until domain's version != since or timeout; returns the version."""
+        with self._lock:
+            cond = self._conds.setdefault(domain, threading.Condition())
+        deadline = time.monotonic() + timeout
+        with cond:
+            while self.version(domain) == since:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not cond.wait(remaining):
+                    break
+        return self.version(domain)
+
+    async def async_wait(self, domain, since, timeout):
+        """Awaitable wait(); all coroutines of one loop share a single future."""
+        if self.version(domain) != since:
+            return self.version(domain)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            per_loop = self._futures.setdefault(domain, {})
+            fut = per_loop.get(loop)
+            if fut is None or fut.done():
+                fut = per_loop[loop] = loop.create_future()
+        if self.version(domain) == since:
+            try:
+                await asyncio.wait_for(asyncio.shield(fut), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.version(domain)
+
+
+def _resolve(fut):
+    if not fut.done():
+        fut.set_result(None)
+
+
+def stream_events(hub, domain, status_fn, token):
+    """
+    SSE body for threaded servers: the current status, then a new event after
+    each change of the token's domain until it is no longer waiting.
+    """
+    status = status_fn(token)
+    version = hub.version(domain)
+    yield sse_event(status, "status")
+    while status.get("valid") and status.get("state") == "waiting":
+        new_version = hub.wait(domain, version, KEEPALIVE_SECS)
+        if new_version == version:
+            yield ": keep-alive\n\n"
+            continue
+        version = new_version
+        status = status_fn(token)
+        yield sse_event(status, "status")
+        time.sleep(MIN_UPDATE_SECS)
+
+
+async def async_stream_events(hub, domain, status_fn, token):
+    """stream_events() for the ASGI server."""
+    status = status_fn(token)
+    version = hub.version(domain)
+    yield sse_event(status, "status")
+    while status.get("valid") and status.get("state") == "waiting":
+        new_version = await hub.async_wait(domain, version, KEEPALIVE_SECS)
+        if new_version == version:
+            yield ": keep-alive\n\n"
+            continue
+        version = new_version
+        status = status_fn(token)
+        yield sse_event(status, "status")
+        await asyncio.sleep(MIN_UPDATE_SECS)
+
+
+def long_poll(hub, domain, status_fn, token, since, timeout=25):
+    """Long-poll variant: returns once the domain changed after `since` (or on timeout)."""
+    version = hub.wait(domain, since, timeout) if since is not None else hub.version(domain)
+    return dict(status_fn(token), version=version)
+
+
+async def async_long_poll(hub, domain, status_fn, token, since, timeout=25):
+    version = await hub.async_wait(domain, since, timeout) if since is not None else hub.version(domain)
+    return dict(status_fn(token), version=version)
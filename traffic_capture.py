@@ -0,0 +1,100 @@
+import gzip
+import json
+import time
+import threading
+
+# One /invoke request per NDJSON line, written as a series of gzip members
+# (one per flush), so a crash loses at most the last flush:
+#   {"ts": wall clock, "ms": server time, "s": status, "b": request body,
+#    "tok": reserved tokens, "k": Idempotency-Key}
+FLUSH_SECS = 1.0
+MAX_PENDING = 100000  # lines held for the writer; beyond this requests are not captured
+
+
+class CaptureWriter:
+    """
+    Records full /invoke requests for replay_invoke.py.
+
+    record() only appends a line to a list; a background thread compresses
+    and appends the pending lines once per flush interval, so capturing adds
+    no disk I/O to the request path. Tokens issued by reservations are kept
+    so a replay can map them to the tokens the replay target issues.
+    """
+
+    def __init__(self, path, flush_secs=FLUSH_SECS):
+        self.path = path
+        self.flush_secs = flush_secs
+        self.dropped = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, body, status, seconds, result=None, ts=None, idempotency_key=None):
+        line = {"ts": round(time.time() if ts is None else ts, 4), "ms": round(seconds * 1000.0, 3),
+                "s": status, "b": body}
+        if idempotency_key:
+            line["k"] = idempotency_key
+        tokens = issued_tokens(body, result)
+        if tokens:
+            line["tok"] = tokens
+        with self._lock:
+            if len(self._pending) >= MAX_PENDING:
+                self.dropped += 1
+                return
+            self._pending.append(line)
+
+    def flush(self):
+        with self._lock:
+            lines, self._pending = self._pending, []
+        if not lines:
+            return
+        data = "".join(json.dumps(l, separators=(",", ":")) + "\n" for l in lines).encode("utf-8")
+        with open(self.path, "ab") as f:
+            f.write(gzip.compress(data))
+
+    def _run(self):
+        while not self._stop.wait(self.flush_secs):
+            try:
+                self.flush()
+            except Exception as e:
+                print("capture flush failed:", e)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="invoke-capture", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+
+def issued_tokens(body, result):
+    """{item index: token} for the reservations of one request (index 0 for a single item)."""
+    if not isinstance(result, dict):
+        return None
+    items = body if isinstance(body, list) else body.get("batch") if isinstance(body, dict) else None
+    if isinstance(items, list):
+        results = result.get("results") or []
+        out = {str(i): r["token"] for i, r in enumerate(results)
+               if isinstance(r, dict) and r.get("type") == "reservation" and r.get("token")}
+        return out or None
+    if result.get("type") == "reservation" and result.get("token"):
+        return {"0": result["token"]}
+    return None
+
+
+def read_capture(path):
+    """Captured lines of one file in order; a torn last member is ignored."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+        except (EOFError, OSError):
+            return
+
@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+
+# Compact on-disk layout of the usage journal:
+#   <dir>/snapshot.json      counts, recent calls and rollups, covers all segments <= "through"
+#   <dir>/segment-000001.log one call per line: [ts, tool, action]
+SNAPSHOT_NAME = "snapshot.json"
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+
+
+def _segment_name(seg_id):
+    return f"{SEGMENT_PREFIX}{seg_id:06d}{SEGMENT_SUFFIX}"
+
+
+class UsageJournal:
+    """
+    Append-only usage log with in-memory counters.
+
+    Each call costs one short line appended to the active segment, regardless of
+    how many calls were recorded before. A background thread periodically seals
+    the active segment, writes a snapshot of the counters and drops the sealed
+    segments, so restart time stays bounded too.
+    """
+
+    def __init__(self, directory, legacy_file=None, segment_max_records=50000,
+                 compact_interval=60, recent_size=100, rollup=None, observer=None):
+        self.directory = directory
+        self.rollup = rollup
+        self.observer = observer  # observer(op, seconds) for "append" and "compact" timings
+        self.segment_max_records = segment_max_records
+        self.compact_interval = compact_interval
+
+        self.counts = {}
+        self.recent = deque(maxlen=recent_size)
+        self._lock = threading.Lock()
+        self._through = 0  # highest segment id folded into the snapshot
+        self._segment_id = 0
+        self._segment_records = 0
+        self._fh = None
+        self._stop = threading.Event()
+        self._thread = None
+
+        os.makedirs(directory, exist_ok=True)
+        if legacy_file and os.path.exists(legacy_file) and not self._has_state():
+            self.migrate(legacy_file)
+        self._recover()
+
+    # ---------------------- startup ---------------------- #
+    def _has_state(self):
+        return any(n == SNAPSHOT_NAME or n.startswith(SEGMENT_PREFIX) for n in os.listdir(self.directory))
+
+    def _segment_ids(self):
+        ids = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                try:
+                    ids.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+                except ValueError:
+                    pass
+        return sorted(ids)
+
+    def migrate(self, legacy_file):
+        """
+        One-time import of the old single-file format ({"calls": [...], "counts": {...}}).
+        Calls are written to a sealed segment and folded into the rollups, so the
+        leaderboard keeps its history, and the old file is renamed to *.migrated.
+        """
+        try:
+            with open(legacy_file, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        recs = [[c.get("ts", 0), c.get("tool", ""), c.get("action", "")] for c in legacy.get("calls", [])]
+        with open(os.path.join(self.directory, _segment_name(1)), "w", encoding="utf-8") as f:
+            for rec in recs:
+                f.write(json.dumps(rec, separators=(",", ":")) + "\n")
+        snapshot = {
+            "through": 1,
+            "counts": legacy.get("counts", {}),
+            "recent": recs[-self.recent.maxlen:],
+        }
+        if self.rollup is not None:
+            for rec in sorted(recs, key=lambda r: r[0]):
+                self.rollup.add(*rec)
+            snapshot["rollups"] = self.rollup.export()
+        self._write_snapshot(snapshot)
+        os.replace(legacy_file, legacy_file + ".migrated")
+
+    def _recover(self):
+        snap_path = os.path.join(self.directory, SNAPSHOT_NAME)
+        if os.path.exists(snap_path):
+            with open(snap_path, "r", encoding="utf-8") as f:
+                snap = json.load(f)
+            self._through = snap.get("through", 0)
+            self.counts = dict(snap.get("counts", {}))
+            self.recent.extend(tuple(r) for r in snap.get("recent", []))
+            if self.rollup is not None and "rollups" in snap:
+                self.rollup.load(snap["rollups"])
+
+        ids = self._segment_ids()
+        for seg_id in ids:
+            if seg_id <= self._through:
+                continue
+            with open(os.path.join(self.directory, _segment_name(seg_id)), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue  # torn write at the tail of a crashed segment
+                    self._apply(rec)
+
+        # always start a fresh segment so a torn tail line is never appended to
+        self._segment_id = max([self._through] + ids) + 1
+        self._open_segment()
+
+    # ---------------------- hot path ---------------------- #
+    def _apply(self, rec):
+        tool = rec[1]
+        self.counts[tool] = self.counts.get(tool, 0) + 1
+        self.recent.append(tuple(rec))
+        if self.rollup is not None:
+            self.rollup.add(*rec)
+
+    def _open_segment(self):
+        path = os.path.join(self.directory, _segment_name(self._segment_id))
+        self._fh = open(path, "a", encoding="utf-8")
+        self._segment_records = 0
+
+    def _rotate(self):
+        self._fh.close()
+        self._segment_id += 1
+        self._open_segment()
+
+    def record(self, tool, action, ts=None):
+        """Append one call and bump its counter; O(1) regardless of history size."""
+        rec = [int(ts if ts is not None else time.time()), tool, action]
+        line = json.dumps(rec, separators=(",", ":")) + "\n"
+        with self._lock:
+            t0 = time.perf_counter()
+            self._fh.write(line)
+            self._fh.flush()
+            self._observe("append", t0)
+            self._apply(rec)
+            self._segment_records += 1
+            if self._segment_records >= self.segment_max_records:
+                self._rotate()
+        return rec
+
+    def record_many(self, calls, ts=None):
+        """Append several (tool, action) calls with a single write."""
+        if not calls:
+            return []
+        ts = int(ts if ts is not None else time.time())
+        recs = [[ts, tool, action] for tool, action in calls]
+        data = "".join(json.dumps(rec, separators=(",", ":")) + "\n" for rec in recs)
+        with self._lock:
+            t0 = time.perf_counter()
+            self._fh.write(data)
+            self._fh.flush()
+            self._observe("append", t0)
+            for rec in recs:
+                self._apply(rec)
+            self._segment_records += len(recs)
+            if self._segment_records >= self.segment_max_records:
+                self._rotate()
+        return recs
+
+    def _observe(self, op, t0):
+        if self.observer is not None:
+            self.observer(op, time.perf_counter() - t0)
+
+    def snapshot_counts(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def recent_calls(self, n=10):
+        with self._lock:
+            items = list(self.recent)[-n:]
+        return [{"ts": ts, "tool": tool, "action": action} for ts, tool, action in items]
+
+    # ---------------------- compaction ---------------------- #
+    def _write_snapshot(self, snapshot):
+        path = os.path.join(self.directory, SNAPSHOT_NAME)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def compact(self):
+        """Seal the active segment, snapshot the counters and delete folded segments."""
+        t0 = time.perf_counter()
+        with self._lock:
+            if self._segment_records == 0 and self._segment_id - 1 == self._through:
+                return
+            sealed = self._segment_id
+            self._rotate()
+            snapshot = {"through": sealed, "counts": dict(self.counts), "recent": list(self.recent)}
+            if self.rollup is not None:
+                snapshot["rollups"] = self.rollup.export()
+
+        self._write_snapshot(snapshot)
+        self._through = sealed
+        for seg_id in self._segment_ids():
+            if seg_id <= sealed:
+                try:
+                    os.remove(os.path.join(self.directory, _segment_name(seg_id)))
+                except OSError:
+                    pass
+        self._observe("compact", t0)
+
+    def _run(self):
+        while not self._stop.wait(self.compact_interval):
+            try:
+                self.compact()
+            except Exception as e:
+                print("usage journal compaction failed:", e)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="usage-journal", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        self.compact()
+        with self._lock:
+            if self._fh:
+                self._fh.close()
+                self._fh = None
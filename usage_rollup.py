@@ -0,0 +1,160 @@
+import threading
+from collections import deque
+
+# (name, bucket width in seconds, buckets kept)
+TIERS = (
+    ("minute", 60, 120),
+    ("hour", 3600, 48),
+    ("day", 86400, 90),
+)
+
+# window name -> (tier, span in seconds)
+WINDOWS = {
+    "5m": ("minute", 5 * 60),
+    "1h": ("minute", 3600),
+    "24h": ("hour", 24 * 3600),
+    "7d": ("day", 7 * 86400),
+    "30d": ("day", 30 * 86400),
+}
+
+
+def _bump(counter, key, n):
+    v = counter.get(key, 0) + n
+    if v:
+        counter[key] = v
+    else:
+        counter.pop(key, None)
+
+
+class _Tier:
+    """Fixed-width buckets of (tool, action) counts; old buckets fall off the front."""
+
+    def __init__(self, width, keep):
+        self.width = width
+        self.keep = keep
+        self.buckets = deque()  # [(start, {(tool, action): n})], oldest first
+
+    def bucket_for(self, ts):
+        start = ts - ts % self.width
+        if not self.buckets or self.buckets[-1][0] < start:
+            self.buckets.append((start, {}))
+            while len(self.buckets) > self.keep:
+                self.buckets.popleft()
+        return self.buckets[-1]
+
+
+class _Window:
+    """Running totals over the buckets of one tier that lie inside a sliding span."""
+
+    def __init__(self, span):
+        self.span = span
+        self.buckets = deque()
+        self.by_tool = {}
+        self.by_action = {}
+
+    def add(self, bucket, tool, action):
+        if not self.buckets or self.buckets[-1] is not bucket:
+            self.buckets.append(bucket)
+        _bump(self.by_tool, tool, 1)
+        _bump(self.by_action, (tool, action), 1)
+
+    def expire(self, now):
+        while self.buckets and self.buckets[0][0] <= now - self.span:
+            _, counts = self.buckets.popleft()
+            for (tool, action), n in counts.items():
+                _bump(self.by_tool, tool, -n)
+                _bump(self.by_action, (tool, action), -n)
+
+
+class RollupEngine:
+    """
+    Per-minute/hour/day usage counters with retention tiers.
+
+    Every call increments one bucket per tier and the running totals of each
+    window, so recording and window queries never look at raw call history.
+    Calls are bucketed by the latest timestamp seen, which keeps tiers ordered
+    even when a replayed or late record carries an older ts.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._tiers = {name: _Tier(width, keep) for name, width, keep in TIERS}
+        self._windows = {name: _Window(span) for name, (_, span) in WINDOWS.items()}
+        self._last_ts = 0
+        self.total = {}
+
+    def add(self, ts, tool, action):
+        with self._lock:
+            self._add(ts, tool, action)
+
+    def _add(self, ts, tool, action):
+        ts = max(int(ts), self._last_ts)
+        self._last_ts = ts
+        key = (tool, action)
+        buckets = {}
+        for name, tier in self._tiers.items():
+            bucket = tier.bucket_for(ts)
+            _bump(bucket[1], key, 1)
+            buckets[name] = bucket
+        for name, win in self._windows.items():
+            win.expire(ts)
+            win.add(buckets[WINDOWS[name][0]], tool, action)
+        _bump(self.total, key, 1)
+
+    def window(self, name, now):
+        """Totals for a window ("5m", "1h", "24h", "7d", "30d" or "all")."""
+        with self._lock:
+            if name == "all":
+                by_action = dict(self.total)
+                by_tool = {}
+                for (tool, _), n in by_action.items():
+                    _bump(by_tool, tool, n)
+            else:
+                win = self._windows[name]
+                win.expire(max(int(now), self._last_ts))
+                by_tool = dict(win.by_tool)
+                by_action = dict(win.by_action)
+        return {
+            "tools": by_tool,
+            "actions": {f"{tool}/{action}": n for (tool, action), n in by_action.items()},
+        }
+
+    def series(self, tier):
+        """Bucketed counts of one tier, oldest first: [(start, {"tool/action": n})]."""
+        with self._lock:
+            return [(start, {f"{t}/{a}": n for (t, a), n in counts.items()})
+                    for start, counts in self._tiers[tier].buckets]
+
+    # ---------------------- persistence ---------------------- #
+    def export(self):
+        with self._lock:
+            return {
+                "last_ts": self._last_ts,
+                "total": [[t, a, n] for (t, a), n in self.total.items()],
+                "tiers": {name: [[start, [[t, a, n] for (t, a), n in counts.items()]]
+                                 for start, counts in tier.buckets]
+                          for name, tier in self._tiers.items()},
+            }
+
+    def load(self, state):
+        """Restore from export(); window totals are rebuilt from the tier buckets."""
+        with self._lock:
+            self._reset()
+            self._last_ts = state.get("last_ts", 0)
+            self.total = {(t, a): n for t, a, n in state.get("total", [])}
+            for name, buckets in state.get("tiers", {}).items():
+                tier = self._tiers.get(name)
+                if tier is None:
+                    continue
+                for start, rows in buckets[-tier.keep:]:
+                    tier.buckets.append((start, {(t, a): n for t, a, n in rows}))
+            for name, win in self._windows.items():
+                for bucket in self._tiers[WINDOWS[name][0]].buckets:
+                    if bucket[0] > self._last_ts - win.span:
+                        win.buckets.append(bucket)
+                        for (tool, action), n in bucket[1].items():
+                            _bump(win.by_tool, tool, n)
+                            _bump(win.by_action, (tool, action), n)
@@ -0,0 +1,342 @@
+import os
+import csv
+import sys
+import math
+import time
+import heapq
+import random
+import argparse
+import itertools
+import threading
+
+EARTH_KM = 6371.0
+KM_PER_DEG = EARTH_KM * math.pi / 180.0  # along a meridian
+MIN_CELL_DEG = 1.0 / 4096  # ~27 m; venues closer than that share a cell
+TARGET_PER_CELL = 8  # a cell with more venues is split in four
+DEFAULT_SPEED_KMH = 20.0  # city travel speed that turns distance into minutes
+CROWD_TTL = 90 * 60  # a venue's crowd report counts for this long (seconds)
+
+
+class Venue:
+    """One place people queue at, from data/venues.csv."""
+
+    __slots__ = ("id", "name", "domain", "lat", "lon", "desks", "rlat", "rlon", "coslat", "cell")
+
+    def __init__(self, vid, name, domain, lat, lon, desks=1):
+        self.id = vid
+        self.name = name
+        self.domain = domain
+        self.lat = lat
+        self.lon = lon
+        self.desks = max(1, desks)
+        self.rlat = math.radians(lat)
+        self.rlon = math.radians(lon)
+        self.coslat = math.cos(self.rlat)
+        self.cell = None  # leaf _Cell, set when indexed
+
+
+def parse_venue(r):
+    """Venue from one CSV row (id, domain, name, lat, lon, optional desks), or None if invalid."""
+    try:
+        vid = r["id"].strip()
+        domain = r["domain"].strip()
+        lat = float(r["lat"])
+        lon = float(r["lon"])
+        desks = int(r.get("desks") or 1)
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return None
+    if not vid or not domain or not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        return None
+    return Venue(vid, (r.get("name") or vid).strip(), domain, lat, lon, desks)
+
+
+def read_venues(f):
+    for r in csv.DictReader(f):
+        v = parse_venue(r)
+        if v is not None:
+            yield v
+
+
+class _Cell:
+    """
+    A lat/lon square, split in four (one more geohash bit per axis) while it
+    holds more than TARGET_PER_CELL venues. max_desks and min_people bound
+    the shortest wait of any venue below it.
+    """
+
+    __slots__ = ("lat0", "lon0", "size", "parent", "venues", "children", "max_desks", "min_people")
+
+    def __init__(self, lat0, lon0, size, parent=None):
+        self.lat0 = lat0
+        self.lon0 = lon0
+        self.size = size
+        self.parent = parent
+        self.venues = []
+        self.children = None
+        self.max_desks = 1
+        self.min_people = None  # fewest people reported at a venue below (may be stale: only ever too low)
+
+    def split(self, out):
+        out.append(self)
+        self.max_desks = max(v.desks for v in self.venues)
+        if len(self.venues) <= TARGET_PER_CELL or self.size <= MIN_CELL_DEG:
+            for v in self.venues:
+                v.cell = self
+            return
+        half = self.size / 2
+        quads = {}
+        for v in self.venues:
+            qy, qx = v.lat >= self.lat0 + half, v.lon >= self.lon0 + half
+            q = quads.get((qy, qx))
+            if q is None:
+                q = quads[(qy, qx)] = _Cell(self.lat0 + half * qy, self.lon0 + half * qx, half, self)
+            q.venues.append(v)
+        self.venues = None
+        self.children = list(quads.values())
+        for q in self.children:
+            q.split(out)
+
+
+def _root(venues, out):
+    """Cell tree over one domain's venues; the root is a square of 2^n degrees."""
+    lat0 = math.floor(min(v.lat for v in venues))
+    lon0 = math.floor(min(v.lon for v in venues))
+    span = max(max(v.lat for v in venues) - lat0, max(v.lon for v in venues) - lon0)
+    size = 1.0
+    while size <= span:
+        size *= 2
+    root = _Cell(lat0, lon0, size)
+    root.venues = list(venues)
+    root.split(out)
+    return root
+
+
+def _km(rlat1, rlon1, coslat1, rlat2, rlon2, coslat2):
+    a = math.sin((rlat2 - rlat1) / 2) ** 2 + coslat1 * coslat2 * math.sin((rlon2 - rlon1) / 2) ** 2
+    return 2 * EARTH_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _cell_km(c, lat, lon, rlat, coslat):
+    """Great-circle distance from (lat, lon) to the nearest point of cell c."""
+    lat1, lon1 = c.lat0 + c.size, c.lon0 + c.size
+    if c.lon0 <= lon <= lon1:
+        return max(0.0, c.lat0 - lat, lat - lat1) * KM_PER_DEG
+    # otherwise the nearest point is on the nearer meridian edge
+    d0 = (c.lon0 - lon + 180.0) % 360.0 - 180.0
+    d1 = (lon1 - lon + 180.0) % 360.0 - 180.0
+    rdl = math.radians(d0 if abs(d0) <= abs(d1) else d1)
+    cosdl = math.cos(rdl)
+    if cosdl <= 0:
+        # 90+ degrees of longitude away the distance only grows along the edge: one end is nearest
+        return min(_km(rlat, 0.0, coslat, e, rdl, math.cos(e)) for e in (math.radians(c.lat0), math.radians(lat1)))
+    # at the foot of the perpendicular from the caller, or the end of the edge closest to it
+    foot = math.degrees(math.atan(math.tan(rlat) / cosdl))
+    rp = math.radians(min(max(foot, c.lat0), lat1))
+    return _km(rlat, 0.0, coslat, rp, rdl, math.cos(rp))
+
+
+class VenueIndex:
+    """
+    Venues per domain in a geohash-like cell tree, for "nearest least-crowded"
+    queries.
+
+    Each domain's venues sit in a square of 2^n degrees that is split in four,
+    recursively, wherever a cell holds more than TARGET_PER_CELL of them, so
+    dense cities get small cells and the countryside large ones. A query
+    walks the cells best-first by the lowest score anything inside could have
+    and stops once that cannot beat the k-th best venue found, so it touches
+    only the neighbourhood of the answer however many venues there are.
+
+    Scores are minutes: travel time at speed_kmh plus the wait at the venue
+    (people x service_mins / desks), so a crowded venue next door can lose
+    to a quiet one further away. People come from a fresh crowd report at
+    the venue (kept in memory for CROWD_TTL), else from the domain's expected
+    crowd passed in by the caller.
+    """
+
+    def __init__(self, venues=()):
+        self.venues = {}
+        for v in venues:
+            self.venues[v.id] = v  # a later row with the same id replaces the earlier one
+        by_domain = {}
+        for v in self.venues.values():
+            by_domain.setdefault(v.domain, []).append(v)
+        self._cells = []
+        self._roots = {d: _root(vs, self._cells) for d, vs in by_domain.items()}
+        self._counts = {d: len(vs) for d, vs in by_domain.items()}
+        self._crowd = {}  # venue id -> (people, ts)
+        self._floors_at = time.time()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.venues)
+
+    def count(self, domain):
+        return self._counts.get(domain, 0)
+
+    def get(self, vid):
+        return self.venues.get(vid)
+
+    def report(self, vid, people, ts=None):
+        """Crowd report for one venue; only the newest per venue is kept."""
+        v = self.venues.get(vid)
+        if v is None:
+            return
+        now = time.time()
+        ts = now if ts is None else ts
+        with self._lock:
+            prev = self._crowd.get(vid)
+            if prev is not None and ts < prev[1]:
+                return
+            self._crowd[vid] = (people, ts)
+            if now - self._floors_at > CROWD_TTL:
+                self._reset_floors(now)
+            else:
+                self._lower_floor(v.cell, people)
+
+    @staticmethod
+    def _lower_floor(c, people):
+        # a parent's floor is never above its children's: stop at the first one already low enough
+        while c is not None and (c.min_people is None or people < c.min_people):
+            c.min_people = people
+            c = c.parent
+
+    def _reset_floors(self, now):
+        """Drop expired reports and rebuild the cells' floors from the fresh ones."""
+        for c in self._cells:
+            c.min_people = None
+        for vid, (people, ts) in list(self._crowd.items()):
+            if now - ts > CROWD_TTL:
+                del self._crowd[vid]
+            else:
+                self._lower_floor(self.venues[vid].cell, people)
+        self._floors_at = now
+
+    def crowd(self, vid, now=None):
+        """People last reported at a venue, or None without a report in the last CROWD_TTL."""
+        entry = self._crowd.get(vid)
+        if entry is None or (time.time() if now is None else now) - entry[1] > CROWD_TTL:
+            return None
+        return entry[0]
+
+    def nearest(self, domain, lat, lon, k=5, max_km=None, speed_kmh=DEFAULT_SPEED_KMH,
+                service_mins=None, people=None, now=None):
+        """
+        The k best venues of domain for someone at (lat, lon), best first:
+        [(score_min, distance_km, wait_min, venue)]. Without service_mins the
+        ranking is by distance alone; a venue whose crowd is unknown (no fresh
+        report and people=None) gets wait_min None and counts as no wait.
+        """
+        root = self._roots.get(domain)
+        if root is None or k <= 0:
+            return []
+        now = time.time() if now is None else now
+        min_per_km = 60.0 / speed_kmh
+        rlat, rlon, coslat = math.radians(lat), math.radians(lon), math.cos(math.radians(lat))
+        crowd = self._crowd
+        best = []  # max-heap of the k best so far: (-score, -km, id, wait, venue)
+        seq = itertools.count()
+        todo = [(0.0, next(seq), root)]  # cells by the lowest score a venue inside could have
+
+        while todo:
+            bound, _, c = heapq.heappop(todo)
+            if len(best) == k and bound >= -best[0][0]:
+                break
+            if c.children is not None:
+                for ch in c.children:
+                    km = _cell_km(ch, lat, lon, rlat, coslat)
+                    if max_km is not None and km > max_km:
+                        continue
+                    floor = 0.0
+                    if service_mins is not None and people is not None:
+                        p = people if ch.min_people is None else min(people, ch.min_people)
+                        floor = p * service_mins / ch.max_desks
+                    heapq.heappush(todo, (km * min_per_km + floor, next(seq), ch))
+                continue
+            for v in c.venues:
+                km = _km(rlat, rlon, coslat, v.rlat, v.rlon, v.coslat)
+                if max_km is not None and km > max_km:
+                    continue
+                w = None
+                if service_mins is not None:
+                    entry = crowd.get(v.id)
+                    p = entry[0] if entry is not None and now - entry[1] <= CROWD_TTL else people
+                    if p is not None:
+                        w = p * service_mins / v.desks
+                score = km * min_per_km + (w or 0.0)
+                if len(best) < k:
+                    heapq.heappush(best, (-score, -km, v.id, w, v))
+                elif score < -best[0][0]:
+                    heapq.heapreplace(best, (-score, -km, v.id, w, v))
+        return [(-s, -km, w, v) for s, km, _, w, v in sorted(best, reverse=True)]
+
+
+def describe(hit, index, now=None):
+    """JSON-friendly form of one nearest() result."""
+    score, km, wait, v = hit
+    source = "report" if index.crowd(v.id, now) is not None else "forecast" if wait is not None else None
+    return {"id": v.id, "name": v.name, "lat": v.lat, "lon": v.lon, "desks": v.desks,
+            "distance_km": round(km, 2), "wait_min": None if wait is None else round(wait, 1),
+            "wait_source": source, "score_min": round(score, 1)}
+
+
+def load_index(path):
+    """VenueIndex from a venues CSV; an empty index if the file is missing."""
+    if not os.path.exists(path):
+        return VenueIndex()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return VenueIndex(read_venues(f))
+
+
+def synthetic_venues(n, domains=("hospital", "bank", "train", "temple"), seed=1):
+    """n random venues over India, half of them around five cities (for --bench)."""
+    rnd = random.Random(seed)
+    cities = [(13.08, 80.27), (12.97, 77.59), (28.61, 77.21), (19.08, 72.88), (22.57, 88.36)]
+    for i in range(n):
+        if rnd.random() < 0.5:
+            clat, clon = rnd.choice(cities)
+            lat, lon = rnd.gauss(clat, 0.15), rnd.gauss(clon, 0.15)
+        else:
+            lat, lon = rnd.uniform(8.0, 35.0), rnd.uniform(68.0, 97.0)
+        yield Venue(f"v{i}", f"venue {i}", domains[i % len(domains)], lat, lon, rnd.randint(1, 6))
+
+
+def main(argv=None):
+    default = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "venues.csv")
+    ap = argparse.ArgumentParser(description="Nearest least-crowded venues of a domain.")
+    ap.add_argument("domain")
+    ap.add_argument("lat", type=float)
+    ap.add_argument("lon", type=float)
+    ap.add_argument("-k", type=int, default=5, help="venues to return (default 5)")
+    ap.add_argument("--max-km", type=float, help="ignore venues further than this")
+    ap.add_argument("--venues", default=default, help="venues CSV (default: data/venues.csv)")
+    ap.add_argument("--bench", type=int, metavar="N",
+                    help="time 10000 queries around (lat, lon) over N synthetic venues instead")
+    args = ap.parse_args(argv)
+
+    if args.bench:
+        t0 = time.perf_counter()
+        index = VenueIndex(synthetic_venues(args.bench, (args.domain,)))
+        print(f"indexed {len(index)} venues in {time.perf_counter() - t0:.2f}s", file=sys.stderr)
+        rnd = random.Random(2)
+        for vid in rnd.sample(sorted(index.venues), len(index) // 20):
+            index.report(vid, rnd.randint(0, 40))
+        times = []
+        for _ in range(10000):
+            lat, lon = rnd.gauss(args.lat, 1.0), rnd.gauss(args.lon, 1.0)
+            t = time.perf_counter()
+            index.nearest(args.domain, lat, lon, args.k, args.max_km, service_mins=5.0, people=20)
+            times.append((time.perf_counter() - t) * 1000.0)
+        times.sort()
+        print(f"{args.domain}: {len(times)} queries, p50 {times[len(times) // 2]:.3f} ms, "
+              f"p99 {times[int(len(times) * 0.99)]:.3f} ms, max {times[-1]:.3f} ms")
+        return
+
+    index = load_index(args.venues)
+    for hit in index.nearest(args.domain, args.lat, args.lon, args.k, args.max_km):
+        d = describe(hit, index)
+        print(f"{d['distance_km']:7.2f} km  {d['name']} ({d['id']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import time
+import threading
+from queue_engine import DEFAULT_SERVICE_MINS
+
+
+class _DomainModel:
+    """24 hourly EWMA service times plus the last call time of each desk."""
+
+    __slots__ = ("prior", "hourly", "samples", "last_call")
+
+    def __init__(self, prior):
+        self.prior = prior
+        self.hourly = [None] * 24
+        self.samples = [0] * 24
+        self.last_call = {}  # desk -> ts of the previous call at that desk
+
+
+class WaitEstimator:
+    """
+    Online per-domain, per-hour service time model.
+
+    Every call_next at a desk closes the service of the previous person at that
+    desk; the gap between the two calls is one service-time sample. Samples feed
+    an exponentially weighted average for the hour of day they fall in, so each
+    update and each estimate is O(1) and a domain costs a fixed 24 slots.
+    Until an hour has seen samples, the static avg_service_time_mins from
+    data/*.json is used.
+    """
+
+    def __init__(self, priors=None, alpha=0.2, max_gap_factor=5.0, max_desks=256):
+        self.priors = dict(priors or {})
+        self.alpha = alpha
+        self.max_gap_factor = max_gap_factor  # longer gaps are idle desks, not service
+        self.max_desks = max_desks
+        self.models = {}
+        self._lock = threading.Lock()
+
+    def _model(self, domain):
+        m = self.models.get(domain)
+        if m is None:
+            m = self.models[domain] = _DomainModel(self.priors.get(domain, DEFAULT_SERVICE_MINS))
+        return m
+
+    def set_priors(self, priors):
+        """Swap in new static service times (catalog reload); learned hours are kept."""
+        with self._lock:
+            self.priors = dict(priors or {})
+            for domain, m in self.models.items():
+                m.prior = self.priors.get(domain, DEFAULT_SERVICE_MINS)
+
+    def observe_serve(self, domain, desk, ts=None):
+        """Record that desk called its next person at ts."""
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            m = self._model(domain)
+            prev = m.last_call.get(desk)
+            if prev is None and len(m.last_call) >= self.max_desks:
+                m.last_call.pop(next(iter(m.last_call)))
+            m.last_call[desk] = ts
+            if prev is None or ts <= prev:
+                return
+            sample = (ts - prev) / 60.0
+            hour = time.localtime(prev).tm_hour
+            current = m.hourly[hour]
+            baseline = current if current is not None else m.prior
+            if sample > baseline * self.max_gap_factor:
+                return
+            m.hourly[hour] = sample if current is None else current + self.alpha * (sample - current)
+            m.samples[hour] += 1
+
+    def observe_idle(self, domain, desk):
+        """Desk found nobody waiting; its next call does not close a service."""
+        with self._lock:
+            m = self.models.get(domain)
+            if m is not None:
+                m.last_call.pop(desk, None)
+
+    def service_mins(self, domain, hour=None):
+        m = self.models.get(domain)
+        if m is None:
+            return self.priors.get(domain, DEFAULT_SERVICE_MINS)
+        if hour is None:
+            hour = time.localtime().tm_hour
+        learned = m.hourly[hour % 24]
+        return m.prior if learned is None else learned
+
+    def estimate(self, domain, people, factor=1.0, desks=1, hour=None):
+        """Same shape as the GUI's people * avg * factor, with a learned avg."""
+        service = self.service_mins(domain, hour)
+        m = self.models.get(domain)
+        h = (time.localtime().tm_hour if hour is None else hour) % 24
+        learned = m is not None and m.hourly[h] is not None
+        return {
+            "domain": domain,
+            "wait_min": round(people * service * factor / max(1, desks)),
+            "service_mins": round(service, 2),
+            "source": "learned" if learned else "catalog" if domain in self.priors else "default",
+            "samples": m.samples[h] if m is not None else 0,
+        }